@@ -12,6 +12,10 @@ import os
 from django.conf import settings
 import logging
 from .business_metrics import calculate_business_metrics
+from .heavy_hitters import keyword_options
+from .llm_gateway import generate as llm_generate
+from .config import QA_PROMPT_TOKEN_BUDGET
+from .prompt_builder import build_chat_context
 from .group_event import analyze_group_events, get_event_counts, get_event_details, get_top_removers
 from .sentiment_analyzer import analyze_sentiment
 from .summary_generator import (
@@ -45,8 +49,7 @@ except Exception as e:
 def generate_with_gemini(prompt):
     """Generate content using Google Gemini AI SDK"""
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        return llm_generate(prompt, model=model)
     except Exception as e:
         logger.error(f"Gemini API error: {e}")
         # Check if it's a quota exceeded error
@@ -191,7 +194,7 @@ def summarize(request):
     
     # Generate summary based on type
     if summary_type == 'total':
-        summary = generate_total_summary(filtered_messages)
+        summary = generate_total_summary(filtered_messages, start_date_str, end_date_str, group_name=group_name)
         return JsonResponse({"summary_type": "total", "summary": summary})
     
     elif summary_type == 'user_messages':
@@ -251,13 +254,8 @@ def ask_question(request):
     if not filtered_messages:
         return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
     
-    # Create a truncated version of the chat text if it's too long
-    chat_text = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in filtered_messages])
-    
-    # Check if chat_text is too long and truncate if necessary
-    max_chars = 30000
-    if len(chat_text) > max_chars:
-        chat_text = chat_text[-max_chars:]
+    # Compressed chat text within the Q&A token budget
+    chat_text, _ = build_chat_context(filtered_messages, QA_PROMPT_TOKEN_BUDGET, query=user_question)
     
     try:
         prompt = "Answer questions based on this WhatsApp chat. Be concise and specific.\n\n" + chat_text + f"\n\nQuestion: {user_question}"
@@ -395,6 +393,10 @@ def topic(request):
     top_n = int(data.get('top_n', 5))
     if not group_name or group_name not in chat_data:
         return JsonResponse({"error": "Invalid group name"}, status=400)
+    try:
+        keyword_mode, keyword_error_rate = keyword_options(data.get('keyword_mode'), data.get('keyword_error_rate'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     messages = chat_data[group_name]['messages']
 
     filtered_messages = messages
@@ -416,5 +418,7 @@ def topic(request):
     
     if not filtered_messages:
         return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
-    topics = extract_topics(filtered_messages, top_n=top_n)
+    topics = extract_topics(
+        filtered_messages, top_n=top_n, keyword_mode=keyword_mode, keyword_error_rate=keyword_error_rate,
+    )
     return JsonResponse({"topics": topics})
\ No newline at end of file
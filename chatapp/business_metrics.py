@@ -2,8 +2,42 @@ from datetime import datetime
 from collections import Counter, defaultdict
 import re
 from .utils import parse_timestamp
+from .config import KEYWORD_MODE, KEYWORD_TOPK_ERROR_RATE
+from .heavy_hitters import SpaceSaving, keyword_options
 
-def calculate_business_metrics(messages):
+WORD_RE = re.compile(r'\b\w+\b')
+
+COMMON_WORDS = {'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those', 'a', 'an'}
+
+BUSINESS_KEYWORDS = ['price', 'cost', 'order', 'delivery', 'payment', 'product', 'service', 'meeting', 'client', 'customer', 'project', 'deadline', 'invoice', 'contract', 'deal', 'offer', 'discount', 'profit', 'loss', 'revenue', 'sales', 'marketing', 'promotion']
+
+
+def stream_keywords(messages, error_rate=KEYWORD_TOPK_ERROR_RATE, top_n=20):
+    """
+    Approximate top keywords and business keyword counts in one pass.
+
+    Memory is bounded by the Space-Saving capacity (ceil(1 / error_rate)
+    counters) instead of growing with the vocabulary and the joined chat text.
+    """
+    summary = SpaceSaving.from_error_rate(error_rate)
+    business_counts = {}
+    for msg in messages:
+        text = msg['message'].lower()
+        for match in WORD_RE.finditer(text):
+            word = match.group()
+            if len(word) > 2 and word not in COMMON_WORDS:
+                summary.add(word)
+        for keyword in BUSINESS_KEYWORDS:
+            if keyword in text:
+                business_counts[keyword] = business_counts.get(keyword, 0) + text.count(keyword)
+
+    top = summary.most_common(top_n)
+    metadata = summary.metadata()
+    metadata['keyword_errors'] = {word: error for word, _, error in top}
+    return {word: count for word, count, _ in top}, business_counts, metadata
+
+
+def calculate_business_metrics(messages, keyword_mode=None, keyword_error_rate=None):
     if not messages:
         return {"error": "No messages found"}
     
@@ -47,18 +81,26 @@ def calculate_business_metrics(messages):
                 metrics['activity_by_day'][day] = 0
             metrics['activity_by_day'][day] += 1
     
+    keyword_mode, keyword_error_rate = keyword_options(keyword_mode, keyword_error_rate)
+    keyword_mode = keyword_mode or KEYWORD_MODE
+    if keyword_mode == 'approximate':
+        top_keywords, business_counts, keyword_metadata = stream_keywords(
+            messages, error_rate=keyword_error_rate or KEYWORD_TOPK_ERROR_RATE
+        )
+        metrics['top_keywords'] = top_keywords
+        metrics['business_keywords_count'] = business_counts
+        metrics['top_keywords_metadata'] = keyword_metadata
+        return metrics
+    
     all_text = ' '.join([msg['message'].lower() for msg in messages])
-    words = re.findall(r'\b\w+\b', all_text)
+    words = WORD_RE.findall(all_text)
     word_counts = Counter(words)
     
-    common_words = ['the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those', 'a', 'an', 'the']
-    
-    filtered_words = {word: count for word, count in word_counts.items() if word not in common_words and len(word) > 2}
+    filtered_words = {word: count for word, count in word_counts.items() if word not in COMMON_WORDS and len(word) > 2}
     metrics['top_keywords'] = dict(Counter(filtered_words).most_common(20))
+    metrics['top_keywords_metadata'] = {'mode': 'exact', 'stream_length': sum(filtered_words.values()), 'max_overestimate': 0}
     
-    business_keywords = ['price', 'cost', 'order', 'delivery', 'payment', 'product', 'service', 'meeting', 'client', 'customer', 'project', 'deadline', 'invoice', 'contract', 'deal', 'offer', 'discount', 'profit', 'loss', 'revenue', 'sales', 'marketing', 'promotion']
-    
-    for keyword in business_keywords:
+    for keyword in BUSINESS_KEYWORDS:
         count = all_text.count(keyword)
         if count > 0:
             metrics['business_keywords_count'][keyword] = count
@@ -0,0 +1,153 @@
+"""
+Circuit breaker for calls to the Gemini API.
+
+Outcomes of recent calls are kept in a sliding time window. Once the window
+has enough calls and too many of them failed or were slow, the breaker
+opens and calls are rejected immediately with CircuitOpenError, so requests
+go straight to their local fallbacks instead of waiting on a degraded API.
+After a cool-down the breaker is half-open: a limited number of probe calls
+go through, and the first probe result closes the breaker again or reopens it.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from .config import (
+    LLM_BREAKER_WINDOW_SECONDS,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_SLOW_CALL_SECONDS,
+    LLM_BREAKER_SLOW_CALL_RATE,
+    LLM_BREAKER_OPEN_SECONDS,
+    LLM_BREAKER_HALF_OPEN_PROBES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the breaker is open"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit for {name} is open; retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Thread-safe breaker tripped by the error rate or slow-call rate of recent calls"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window_seconds=LLM_BREAKER_WINDOW_SECONDS, min_calls=LLM_BREAKER_MIN_CALLS,
+                 error_rate=LLM_BREAKER_ERROR_RATE, slow_call_seconds=LLM_BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate=LLM_BREAKER_SLOW_CALL_RATE, open_seconds=LLM_BREAKER_OPEN_SECONDS,
+                 half_open_probes=LLM_BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = self.CLOSED
+        self._calls = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Admit one call, raising CircuitOpenError while open. Returns True when
+        the call is a half-open probe; pass that to record() or release().
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                retry_in = self._opened_at + self.open_seconds - time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = self.HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit for {self.name} half-open, probing")
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise CircuitOpenError(self.name, 0)
+                self._probes += 1
+                return True
+            return False
+
+    def record(self, ok, latency, probe=False):
+        """Record the outcome of an admitted call that took latency seconds"""
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            if probe and self.state == self.HALF_OPEN:
+                self._probes -= 1
+                if ok and not slow:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                    logger.info(f"Circuit for {self.name} closed")
+                else:
+                    self._trip(now, "probe failed" if not ok else f"probe took {latency:.1f}s")
+                return
+            self._calls.append((now, ok, slow))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            if self.state != self.CLOSED or len(self._calls) < self.min_calls:
+                return
+            errors = sum(1 for _, call_ok, _ in self._calls if not call_ok) / len(self._calls)
+            slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow) / len(self._calls)
+            if errors >= self.error_rate:
+                self._trip(now, f"{errors:.0%} of {len(self._calls)} calls failed")
+            elif slow_calls >= self.slow_call_rate:
+                self._trip(now, f"{slow_calls:.0%} of {len(self._calls)} calls took over {self.slow_call_seconds}s")
+
+    def release(self, probe):
+        """Give back an admitted call that ended without an outcome (e.g. an abandoned stream)"""
+        if probe:
+            with self._lock:
+                if self.state == self.HALF_OPEN:
+                    self._probes -= 1
+
+    def _trip(self, now, reason):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._calls.clear()
+        logger.warning(f"Circuit for {self.name} opened for {self.open_seconds}s: {reason}")
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'error_rate': round(sum(1 for _, ok, _ in self._calls if not ok) / calls, 3) if calls else None,
+                'slow_call_rate': round(sum(1 for _, _, slow in self._calls if slow) / calls, 3) if calls else None,
+                'retry_in': (
+                    round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+                    if self.state == self.OPEN else None
+                ),
+            }
+
+
+_breakers_lock = threading.Lock()
+_breakers = {}
+
+
+def breaker_for(name):
+    """The process-wide breaker for one model"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breaker_stats():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
@@ -11,4 +11,117 @@ MODEL_NAME = "deepseek-r1-distill-llama-70b"
 MAX_CHARS_FOR_ANALYSIS = 30000  
 SENTIMENT_THRESHOLD = 0.1
 TOPIC_MIN_WORD_LENGTH = 3
-TOPIC_MAX_TOPICS = 15
\ No newline at end of file
+TOPIC_MAX_TOPICS = 15
+
+# Approximate (streaming) keyword counting for very large groups.
+# Space-Saving keeps ceil(1 / error_rate) counters, so counts overestimate by
+# at most error_rate * total_words.
+KEYWORD_MODE = os.getenv("KEYWORD_MODE", "exact")
+KEYWORD_TOPK_ERROR_RATE = float(os.getenv("KEYWORD_TOPK_ERROR_RATE", "0.001"))
+
+# Group event log pagination
+EVENT_LOGS_PAGE_SIZE = int(os.getenv("EVENT_LOGS_PAGE_SIZE", "100"))
+EVENT_LOGS_MAX_PAGE_SIZE = int(os.getenv("EVENT_LOGS_MAX_PAGE_SIZE", "500"))
+
+# Concurrent LLM dispatch: worker threads, token-bucket pacing shared per
+# process, and jittered exponential backoff on 429 / quota errors
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "4"))
+LLM_BURST = int(os.getenv("LLM_BURST", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20.0"))
+
+# Every Gemini call is bounded by LLM_CALL_TIMEOUT_SECONDS and by the time
+# left before its request's deadline; Q&A and sentiment requests get
+# LLM_REQUEST_DEADLINE_SECONDS, summaries SUMMARY_DEADLINE_SECONDS
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "45"))
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv("LLM_REQUEST_DEADLINE_SECONDS", "60"))
+
+# Shared keep-alive HTTP client for the Gemini REST API: "auto" uses httpx
+# when installed (HTTP/2 with the h2 package and LLM_HTTP2 on), otherwise a
+# requests Session. Calls also stay within their LLM_CALL_TIMEOUT_SECONDS share.
+LLM_HTTP_CLIENT = os.getenv("LLM_HTTP_CLIENT", "auto")
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+LLM_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_READ_TIMEOUT_SECONDS", "45"))
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "10"))
+LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "60"))
+
+# Circuit breaker per model: opens when, over the last LLM_BREAKER_WINDOW_SECONDS
+# and at least LLM_BREAKER_MIN_CALLS calls, the error rate or the share of
+# calls slower than LLM_BREAKER_SLOW_CALL_SECONDS reaches its threshold.
+# While open, calls fail fast to local fallbacks; after
+# LLM_BREAKER_OPEN_SECONDS a few probe calls decide whether it closes again.
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "30"))
+LLM_BREAKER_SLOW_CALL_RATE = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+LLM_BREAKER_HALF_OPEN_PROBES = int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Sentiment batches are packed up to a token budget (message text only; the
+# fixed instructions are added on top) and a maximum number of messages
+SENTIMENT_BATCH_TOKEN_BUDGET = int(os.getenv("SENTIMENT_BATCH_TOKEN_BUDGET", "1200"))
+SENTIMENT_BATCH_MAX_ITEMS = int(os.getenv("SENTIMENT_BATCH_MAX_ITEMS", "25"))
+
+# Sentiment engine: "llm" (the default) sends everything to the LLM,
+# "tiered" labels everything locally and escalates only low-confidence
+# messages, "local" never calls the LLM. Requests opt in with "engine".
+# At most SENTIMENT_MAX_ESCALATION_RATIO of the messages are escalated,
+# least confident first.
+SENTIMENT_ENGINE = os.getenv("SENTIMENT_ENGINE", "llm")
+LOCAL_SENTIMENT_CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_SENTIMENT_CONFIDENCE_THRESHOLD", "0.7"))
+SENTIMENT_MAX_ESCALATION_RATIO = float(os.getenv("SENTIMENT_MAX_ESCALATION_RATIO", "0.3"))
+
+# Estimate mode labels a stratified sample sized for this margin of error
+# (as a proportion) at this confidence level and extrapolates the rest
+SENTIMENT_ESTIMATE_MARGIN_OF_ERROR = float(os.getenv("SENTIMENT_ESTIMATE_MARGIN_OF_ERROR", "0.03"))
+SENTIMENT_ESTIMATE_CONFIDENCE_LEVEL = float(os.getenv("SENTIMENT_ESTIMATE_CONFIDENCE_LEVEL", "0.95"))
+
+# Negative messages sent with each streamed sentiment update
+SENTIMENT_STREAM_NEGATIVE_SAMPLES = int(os.getenv("SENTIMENT_STREAM_NEGATIVE_SAMPLES", "5"))
+
+# Weekly/daily summaries: per-bucket prompts run concurrently, and buckets
+# still unfinished after SUMMARY_DEADLINE_SECONDS get a local fallback summary
+# so the response returns inside the 120s worker timeout
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_DEADLINE_SECONDS = float(os.getenv("SUMMARY_DEADLINE_SECONDS", "90"))
+
+# Total/brief summaries of chats that don't fit SUMMARY_PROMPT_TOKEN_BUDGET
+# are built from cached day, week and month summaries instead of one prompt.
+# The day (map) stage gets SUMMARY_TREE_MAP_SHARE of the time left, and
+# both stages end SUMMARY_FINAL_CALL_RESERVE_SECONDS (at most half the time
+# left) before the deadline so the final summary call still has time
+SUMMARY_TREE_MAP_SHARE = float(os.getenv("SUMMARY_TREE_MAP_SHARE", "0.6"))
+SUMMARY_FINAL_CALL_RESERVE_SECONDS = float(os.getenv("SUMMARY_FINAL_CALL_RESERVE_SECONDS", "30"))
+
+# Token budgets for the compressed chat context in Q&A and summary prompts
+QA_PROMPT_TOKEN_BUDGET = int(os.getenv("QA_PROMPT_TOKEN_BUDGET", "8000"))
+SUMMARY_PROMPT_TOKEN_BUDGET = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", "6000"))
+
+# Persistent cache of LLM responses shared by every Gemini call site.
+# Entries expire after LLM_CACHE_TTL_SECONDS; beyond LLM_CACHE_MAX_BYTES the
+# least recently used entries are evicted.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "50"))
+
+# Identical concurrent LLM calls share one request: threads in a worker wait
+# on the in-flight call, other workers wait on its LLMInFlight row and read
+# the response from the cache. Waiters give up after
+# LLM_SINGLE_FLIGHT_WAIT_SECONDS and call the model themselves; rows older
+# than that are treated as left behind by a dead worker.
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+LLM_SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("LLM_SINGLE_FLIGHT_WAIT_SECONDS", "60"))
+LLM_SINGLE_FLIGHT_POLL_SECONDS = float(os.getenv("LLM_SINGLE_FLIGHT_POLL_SECONDS", "0.25"))
+
+# Background analysis jobs (sentiment, exports, weekly/daily summaries)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Each worker process refreshes heartbeat_at on the jobs it is running every
+# JOB_HEARTBEAT_SECONDS; a running job whose heartbeat is older than
+# JOB_LEASE_SECONDS belongs to a dead worker and is marked failed.
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "90"))
@@ -0,0 +1,126 @@
+"""
+Single-pass classifier for WhatsApp group system messages.
+
+Every system-message shape is one branch of a single compiled alternation with
+named groups, so a line is classified with one regex match and no I/O.
+
+Android exports write system lines without a "sender: " part, so the parser
+folds them into the previous message as continuation lines that still carry
+their own timestamp. iOS exports attribute them to the group name and prefix
+the text with a left-to-right mark. Both shapes are handled here.
+"""
+import re
+
+EVENT_TYPES = ('added', 'left', 'removed', 'changed_subject', 'changed_icon', 'created')
+
+# Bump when classification changes so persisted event indexes are rebuilt
+CLASSIFIER_VERSION = '1'
+
+LRM = '\u200e'
+
+_EVENT_ALTERNATION = r"""
+    (?P<created_actor>.+?)\ created\ (?:this\ )?group(?:\ ["“](?P<created_subject>.*)["”])?
+  | (?P<subject_actor>.+?)\ changed\ (?:the\ subject|the\ group\ name|this\ group['’]s\ subject)
+        (?:\ from\ ["“](?P<old_subject>.*?)["”])?\ to\ ["“](?P<new_subject>.*)["”]
+  | (?P<icon_actor>.+?)\ (?P<icon_action>changed|deleted|removed)\ (?:this\ group['’]s|the\ group)\ icon
+  | (?P<joined_actor>.+?)\ joined\ (?:using\ this\ group['’]s\ invite\ link|from\ the\ community|the\ group)
+  | (?P<removed_actor>.+?)\ removed\ (?P<removed_target>.+)
+  | (?P<added_actor>.+?)\ added\ (?P<added_target>.+)
+  | (?P<left_actor>.+?)\ (?:left|exited)(?:\ the\ group)?
+"""
+
+_TIMESTAMP = (
+    r'\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4},?\ \d{1,2}:\d{2}(?::\d{2})?'
+    '(?:[ \u202f\u00a0]?[AaPp]\\.?[Mm]\\.?)?'
+)
+
+# Body of a system message, e.g. "Ravi added Priya"
+EVENT_RE = re.compile(r'^(?:' + _EVENT_ALTERNATION + r')$', re.IGNORECASE | re.VERBOSE)
+
+# Timestamped system line embedded in a message, e.g. "1/2/23, 9:05 PM - Ravi left"
+SYSTEM_LINE_RE = re.compile(
+    r'^\[?(?P<timestamp>' + _TIMESTAMP + r')\]?\ -\ ' + LRM + r'?(?:' + _EVENT_ALTERNATION + r')$',
+    re.IGNORECASE | re.VERBOSE | re.MULTILINE,
+)
+
+_TARGET_SPLIT_RE = re.compile(r',\s*(?:and\s+)?|\s+and\s+')
+
+
+def split_targets(target):
+    """Split "A, B, and C" into individual names"""
+    if not target:
+        return []
+    return [name.strip() for name in _TARGET_SPLIT_RE.split(target) if name.strip()]
+
+
+def _event_from_match(match, timestamp, raw):
+    groups = match.groupdict()
+    if groups['created_actor'] is not None:
+        actor = groups['created_actor']
+        return _event('created', timestamp, actor, None, 'Group created', raw)
+    if groups['subject_actor'] is not None:
+        actor = groups['subject_actor']
+        return _event('changed_subject', timestamp, actor, None, f"New subject: {groups['new_subject']}", raw)
+    if groups['icon_actor'] is not None:
+        details = 'Icon deleted' if groups['icon_action'].lower() != 'changed' else 'Icon changed'
+        return _event('changed_icon', timestamp, groups['icon_actor'], None, details, raw)
+    if groups['joined_actor'] is not None:
+        actor = groups['joined_actor']
+        return _event('added', timestamp, actor, actor, f"{actor} joined the group", raw)
+    if groups['removed_actor'] is not None:
+        actor, target = groups['removed_actor'], groups['removed_target']
+        return _event('removed', timestamp, actor, target, f"{actor} removed {target}", raw)
+    if groups['added_actor'] is not None:
+        actor, target = groups['added_actor'], groups['added_target']
+        return _event('added', timestamp, actor, target, f"{actor} added {target}", raw)
+    actor = groups['left_actor']
+    return _event('left', timestamp, actor, None, f"{actor} left the group", raw)
+
+
+def _event(event_type, timestamp, actor, target, details, raw):
+    return {
+        'event_type': event_type,
+        'timestamp': timestamp,
+        'actor': actor.strip(),
+        'target': target.strip() if target else None,
+        'details': details,
+        'raw_message': raw,
+    }
+
+
+def classify_line(body, timestamp=None):
+    """Classify a single system-message body; returns an event dict or None"""
+    body = body.strip().lstrip(LRM)
+    match = EVENT_RE.match(body)
+    if not match:
+        return None
+    return _event_from_match(match, timestamp, body)
+
+
+def is_system_message(msg):
+    """True when the parsed message itself is a system notice (iOS exports)"""
+    return not msg.get('sender') or msg.get('message', '').startswith(LRM)
+
+
+def classify_messages(messages):
+    """
+    Extract normalized group events from parsed messages in one pass.
+
+    Returns a list of dicts with keys event_type, timestamp, actor, target,
+    details and raw_message, in message order.
+    """
+    events = []
+    append = events.append
+    for msg in messages:
+        text = msg.get('message', '')
+        if is_system_message(msg):
+            first_line = text.split('\n', 1)[0]
+            event = classify_line(first_line, msg.get('timestamp'))
+            if event:
+                append(event)
+        if '\n' not in text:
+            continue
+        for match in SYSTEM_LINE_RE.finditer(text):
+            raw = match.group(0)
+            append(_event_from_match(match, match.group('timestamp'), raw[raw.index(' - ') + 3:].lstrip(LRM)))
+    return events
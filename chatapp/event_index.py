@@ -0,0 +1,186 @@
+"""
+Persisted group-event index.
+
+Normalized event rows are written once per group (at upload time, or lazily
+when the uploaded files change) with their epoch and day already computed, so
+the analytics and log endpoints only run an indexed range query plus a few
+small aggregations instead of re-parsing the chat and every event timestamp.
+"""
+import base64
+import calendar
+import hashlib
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from .event_classifier import CLASSIFIER_VERSION, EVENT_TYPES
+from .group_event import analyze_group_events, parse_timestamp, compute_most_active_day
+from .membership import build_membership
+from .models import ChatFile, GroupEvent, GroupEventIndex, MembershipChange, MembershipInterval
+
+
+def to_epoch(dt):
+    """Seconds since 1970-01-01 for a naive export timestamp"""
+    return calendar.timegm(dt.timetuple())
+
+
+def source_signature(group_name):
+    """Fingerprint of the files and classifier version a group's index is built from; None if no files"""
+    file_ids = list(
+        ChatFile.objects.filter(group_name=group_name).order_by('id').values_list('id', flat=True)
+    )
+    if not file_ids:
+        return None
+    source = f"{CLASSIFIER_VERSION}:" + ','.join(str(i) for i in file_ids)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def rebuild_event_index(group_name, messages, signature=None):
+    """Classify messages and replace the persisted event rows and membership timeline for a group"""
+    if signature is None:
+        signature = source_signature(group_name)
+    rows = []
+    for event in analyze_group_events(messages):
+        dt = parse_timestamp(event['timestamp'] or '')
+        if dt is None:
+            continue
+        rows.append(GroupEvent(
+            group_name=group_name,
+            epoch=to_epoch(dt),
+            day=dt.date(),
+            event_type=event['event_type'],
+            actor=event['actor'],
+            target=event['target'],
+            timestamp=event['timestamp'],
+            details=event['details'] or '',
+            raw_message=event['raw_message'] or '',
+        ))
+    rows.sort(key=lambda r: r.epoch)
+
+    with transaction.atomic():
+        GroupEvent.objects.filter(group_name=group_name).delete()
+        GroupEvent.objects.bulk_create(rows, batch_size=500)
+        stats = build_membership(group_name, rows, messages, to_epoch)
+        GroupEventIndex.objects.update_or_create(
+            group_name=group_name,
+            defaults={'source_signature': signature or '', 'event_count': len(rows), 'membership_stats': stats},
+        )
+    return len(rows)
+
+
+def drop_event_index(group_name):
+    with transaction.atomic():
+        GroupEvent.objects.filter(group_name=group_name).delete()
+        MembershipInterval.objects.filter(group_name=group_name).delete()
+        MembershipChange.objects.filter(group_name=group_name).delete()
+        GroupEventIndex.objects.filter(group_name=group_name).delete()
+
+
+def ensure_event_index(group_name, load_messages):
+    """
+    Make sure the persisted rows for a group match its uploaded files.
+
+    load_messages is only called when the index is missing or stale. Returns
+    False when the group has no uploaded files.
+    """
+    signature = source_signature(group_name)
+    if signature is None:
+        drop_event_index(group_name)
+        return False
+    current = GroupEventIndex.objects.filter(group_name=group_name).values_list('source_signature', flat=True).first()
+    if current != signature:
+        rebuild_event_index(group_name, load_messages(), signature)
+    return True
+
+
+def query_events(group_name, start_dt=None, end_dt=None, event_types=None, user=None, search=None):
+    """Indexed slice of a group's events, ordered by time"""
+    qs = GroupEvent.objects.filter(group_name=group_name)
+    if start_dt:
+        qs = qs.filter(epoch__gte=to_epoch(start_dt))
+    if end_dt:
+        qs = qs.filter(epoch__lte=to_epoch(end_dt))
+    if event_types:
+        qs = qs.filter(event_type__in=list(event_types))
+    if user:
+        qs = qs.filter(Q(actor__icontains=user) | Q(target__icontains=user))
+    if search:
+        qs = qs.filter(Q(actor__icontains=search) | Q(target__icontains=search) | Q(details__icontains=search))
+    return qs.order_by('epoch', 'id')
+
+
+def encode_cursor(epoch, row_id):
+    return base64.urlsafe_b64encode(f"{epoch}:{row_id}".encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(epoch, id) from an opaque cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        epoch, row_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').split(':')
+        return int(epoch), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def page_events(qs, cursor=None, page_size=100, descending=False):
+    """
+    Keyset page over (epoch, id). Returns (rows, next_cursor); next_cursor is
+    None on the last page.
+    """
+    if cursor:
+        epoch, row_id = decode_cursor(cursor)
+        if descending:
+            qs = qs.filter(Q(epoch__lt=epoch) | Q(epoch=epoch, id__lt=row_id))
+        else:
+            qs = qs.filter(Q(epoch__gt=epoch) | Q(epoch=epoch, id__gt=row_id))
+    qs = qs.order_by('-epoch', '-id') if descending else qs.order_by('epoch', 'id')
+
+    rows = list(qs.values('id', 'epoch', 'event_type', 'actor', 'target', 'details')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1]['epoch'], rows[-1]['id'])
+
+
+def summarize_events(qs, top_limit=5):
+    """Timeseries, distribution, top contributors and actors for a slice"""
+    counts = {event_type: 0 for event_type in EVENT_TYPES}
+    by_day = {}
+    for row in qs.order_by().values('day', 'event_type').annotate(n=Count('id')):
+        day = row['day'].isoformat()
+        d = by_day.setdefault(day, {'total': 0, **{event_type: 0 for event_type in EVENT_TYPES}})
+        d['total'] += row['n']
+        d[row['event_type']] += row['n']
+        counts[row['event_type']] += row['n']
+    timeseries = [{'date': day, **by_day[day]} for day in sorted(by_day)]
+
+    total = sum(counts.values()) or 1
+    distribution = {
+        'counts': counts,
+        'percentages': {k: (v * 100.0) / total for k, v in counts.items()},
+        'total': total,
+    }
+
+    top_contributors = [
+        {'name': row['actor'] or 'Unknown', 'count': row['n']}
+        for row in qs.order_by().values('actor').annotate(n=Count('id'), first=Min('epoch')).order_by('-n', 'first')[:top_limit]
+    ]
+
+    actors = set(qs.exclude(actor__isnull=True).values_list('actor', flat=True).distinct())
+    actors.update(qs.exclude(target__isnull=True).values_list('target', flat=True).distinct())
+
+    return {
+        'event_counts': dict(counts),
+        'timeseries': timeseries,
+        'distribution': distribution,
+        'most_active_day': compute_most_active_day(timeseries),
+        'top_contributors': top_contributors,
+        'actors': sorted(actors),
+    }
+
+
+def from_epoch(epoch):
+    """Naive export datetime for an epoch produced by to_epoch"""
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch)
@@ -0,0 +1,115 @@
+import math
+
+KEYWORD_MODES = ('exact', 'approximate')
+
+
+def keyword_options(mode=None, error_rate=None):
+    """
+    Validate a request's keyword counting mode and Space-Saving error rate.
+    Returns (mode, error_rate) with None left for the configured defaults;
+    raises ValueError for an unknown mode or a rate outside (0, 1).
+    """
+    if mode in (None, ''):
+        mode = None
+    elif mode not in KEYWORD_MODES:
+        raise ValueError(f"Unknown keyword_mode: {mode}")
+    if error_rate in (None, ''):
+        return mode, None
+    try:
+        error_rate = float(error_rate)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid keyword_error_rate")
+    if not 0 < error_rate < 1:
+        raise ValueError("keyword_error_rate must be between 0 and 1")
+    return mode, error_rate
+
+
+class SpaceSaving:
+    """
+    Bounded-memory top-k counter (Space-Saving, Metwally et al. 2005).
+
+    At most ``capacity`` counters are kept no matter how long the stream is.
+    Every reported count overestimates the true frequency by at most
+    ``stream_length / capacity``, and any item whose true frequency exceeds
+    that bound is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = int(capacity)
+        self.stream_length = 0
+        self._counts = {}
+        self._errors = {}
+        # count -> set of items currently holding that count, so the minimum
+        # counter can be found and replaced in O(1)
+        self._buckets = {}
+        self._min_count = 0
+
+    @classmethod
+    def from_error_rate(cls, error_rate):
+        """Size the summary so the overestimate stays below error_rate * N"""
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        return cls(math.ceil(1.0 / error_rate))
+
+    def _move(self, item, old_count, new_count):
+        bucket = self._buckets[old_count]
+        bucket.discard(item)
+        if not bucket:
+            del self._buckets[old_count]
+            if old_count == self._min_count:
+                self._min_count = new_count
+        self._buckets.setdefault(new_count, set()).add(item)
+        self._counts[item] = new_count
+
+    def add(self, item):
+        self.stream_length += 1
+        count = self._counts.get(item)
+        if count is not None:
+            self._move(item, count, count + 1)
+            return
+
+        if len(self._counts) < self.capacity:
+            self._counts[item] = 1
+            self._errors[item] = 0
+            self._buckets.setdefault(1, set()).add(item)
+            self._min_count = 1
+            return
+
+        # Replace one of the items holding the minimum count
+        bucket = self._buckets[self._min_count]
+        victim = bucket.pop()
+        if not bucket:
+            del self._buckets[self._min_count]
+        floor = self._counts.pop(victim)
+        del self._errors[victim]
+
+        self._counts[item] = floor + 1
+        self._errors[item] = floor
+        self._buckets.setdefault(floor + 1, set()).add(item)
+        if self._min_count not in self._buckets:
+            self._min_count = floor + 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def most_common(self, n=None):
+        """Return [(item, estimated_count, max_overestimate), ...] by count"""
+        ranked = sorted(self._counts.items(), key=lambda x: x[1], reverse=True)
+        if n is not None:
+            ranked = ranked[:n]
+        return [(item, count, self._errors[item]) for item, count in ranked]
+
+    def metadata(self):
+        full = len(self._counts) >= self.capacity
+        return {
+            'mode': 'approximate',
+            'algorithm': 'space_saving',
+            'capacity': self.capacity,
+            'stream_length': self.stream_length,
+            'max_overestimate': self._min_count if full else 0,
+            'error_bound': self.stream_length / self.capacity,
+            'relative_error_bound': 1.0 / self.capacity,
+        }
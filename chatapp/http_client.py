@@ -0,0 +1,123 @@
+"""
+Shared HTTP client for the Gemini REST API.
+
+One client per process keeps connections to the API alive between calls,
+so only the first request on each pooled connection pays for the TCP and
+TLS handshakes. httpx is used when it is installed, over HTTP/2 when the
+h2 package is available; otherwise a requests Session with a sized
+connection pool. Connect and read timeouts and the pool size come from
+config; a call's own timeout (its share of the request deadline) caps both.
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import (
+    LLM_HTTP_CLIENT,
+    LLM_HTTP2,
+    LLM_HTTP_CONNECT_TIMEOUT_SECONDS,
+    LLM_HTTP_READ_TIMEOUT_SECONDS,
+    LLM_HTTP_POOL_SIZE,
+    LLM_HTTP_KEEPALIVE_SECONDS,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Transport and status errors raised by either backend
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
+
+
+class HttpClient:
+    """Pooled keep-alive client with the same post_json()/stream_lines() calls on either backend"""
+
+    def __init__(self, backend=LLM_HTTP_CLIENT, http2=LLM_HTTP2, pool_size=LLM_HTTP_POOL_SIZE,
+                 connect_timeout=LLM_HTTP_CONNECT_TIMEOUT_SECONDS, read_timeout=LLM_HTTP_READ_TIMEOUT_SECONDS,
+                 keepalive_seconds=LLM_HTTP_KEEPALIVE_SECONDS, verify=True):
+        if backend == 'auto':
+            backend = 'httpx' if httpx is not None else 'requests'
+        if backend == 'httpx' and httpx is None:
+            raise ValueError("LLM_HTTP_CLIENT is 'httpx' but httpx is not installed")
+        if backend not in ('httpx', 'requests'):
+            raise ValueError(f"Unknown HTTP client backend: {backend}")
+        self.backend = backend
+        self.http2 = bool(http2) and backend == 'httpx' and HTTP2_AVAILABLE
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # requests lets REQUESTS_CA_BUNDLE override Session.verify, so it is passed per call
+        self._options = {} if backend == 'httpx' else {'verify': verify}
+
+        if backend == 'httpx':
+            self._client = httpx.Client(
+                http2=self.http2,
+                verify=verify,
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=keepalive_seconds,
+                ),
+                timeout=self._timeout(None),
+            )
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._client = session
+
+    def _timeout(self, timeout):
+        read = self.read_timeout if timeout is None else min(self.read_timeout, timeout)
+        connect = min(self.connect_timeout, read)
+        if self.backend == 'httpx':
+            return httpx.Timeout(read, connect=connect, pool=connect)
+        return (connect, read)
+
+    def post_json(self, url, params=None, json=None, timeout=None):
+        """POST json and return the decoded JSON response; HTTP error statuses raise"""
+        response = self._client.post(url, params=params, json=json, timeout=self._timeout(timeout), **self._options)
+        response.raise_for_status()
+        return response.json()
+
+    def stream_lines(self, url, params=None, json=None, timeout=None):
+        """POST json and yield the response body line by line as it arrives"""
+        if self.backend == 'httpx':
+            with self._client.stream('POST', url, params=params, json=json, timeout=self._timeout(timeout)) as response:
+                response.raise_for_status()
+                yield from response.iter_lines()
+        else:
+            with self._client.post(
+                url, params=params, json=json, timeout=self._timeout(timeout), stream=True, **self._options,
+            ) as response:
+                response.raise_for_status()
+                # Decoded here: requests falls back to ISO-8859-1 for text/* without a charset
+                for line in response.iter_lines():
+                    yield line.decode('utf-8')
+
+    def close(self):
+        self._client.close()
+
+
+_client_lock = threading.Lock()
+_client = None
+
+
+def get_client():
+    """The process-wide client, created on first use so each gunicorn worker gets its own"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+            logger.info(f"Gemini HTTP client: {_client.backend}{' (HTTP/2)' if _client.http2 else ''}")
+        return _client
@@ -0,0 +1,221 @@
+"""
+Background job subsystem backed by the AnalysisJob table.
+
+Long analyses are submitted as jobs and run on a small in-process thread
+pool, so a request returns immediately and the sync worker stays free for
+other users. State lives in SQLite, so no broker (Redis, etc.) is needed.
+Handlers report progress per batch/week and check for cancellation each time
+they do; finished results are stored on the job row for later retrieval.
+
+Several worker processes may run jobs side by side (gunicorn runs more than
+one worker and recycles them), so each running job carries its owner process
+and a heartbeat that the owner refreshes. A running job is only given up on
+once its heartbeat has lapsed for longer than the lease. Every heartbeat
+also re-queues the jobs still waiting in the table, so jobs left queued by a
+worker that died are picked up by a live one.
+
+Handlers are registered with @register_job(kind) and called as
+handler(params, job) where job is a JobContext.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .config import JOB_WORKERS, JOB_HEARTBEAT_SECONDS, JOB_LEASE_SECONDS
+from .models import AnalysisJob
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_owner = None
+# Jobs waiting on this process's executor, so each sweep queues a job once
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def register_job(kind):
+    """Decorator registering a handler(params, job) for a job kind"""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def job_kinds():
+    return sorted(_handlers)
+
+
+class JobContext:
+    """Progress and cancellation hooks handed to a running handler"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, done, total, message=''):
+        """Record progress; raises JobCancelled once cancellation was requested"""
+        AnalysisJob.objects.filter(id=self.job_id).update(
+            progress_done=done, progress_total=total, progress_message=str(message)[:255],
+            heartbeat_at=timezone.now(),
+        )
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if AnalysisJob.objects.filter(id=self.job_id, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def _get_executor():
+    global _executor, _owner
+    with _executor_lock:
+        if _executor is None:
+            # Set here rather than at import so each forked worker gets its own
+            _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='analysis-job')
+            threading.Thread(target=_heartbeat_loop, name='analysis-job-heartbeat', daemon=True).start()
+    return _executor
+
+
+def _submit(job_id):
+    """Queue job_id on this process's executor unless it is already waiting there"""
+    with _queued_lock:
+        if job_id in _queued:
+            return
+        _queued.add(job_id)
+    _get_executor().submit(_run_job, job_id)
+
+
+def _heartbeat_loop():
+    """
+    Keep this process's running jobs leased, fail jobs whose owner died and
+    pick up queued jobs, starting with a sweep as soon as the process starts
+    """
+    while True:
+        close_old_connections()
+        try:
+            AnalysisJob.objects.filter(owner=_owner, status=AnalysisJob.STATUS_RUNNING).update(
+                heartbeat_at=timezone.now(),
+            )
+            for job_id in _recover_interrupted_jobs():
+                _submit(job_id)
+        except Exception as e:
+            logger.warning(f"Job heartbeat failed: {e}")
+        finally:
+            connection.close()
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+
+
+def _fail_expired_jobs():
+    """Mark failed the running jobs whose heartbeat is older than the lease"""
+    expired = timezone.now() - timedelta(seconds=JOB_LEASE_SECONDS)
+    # Rows started before heartbeats existed have none; their start time stands in
+    lapsed = Q(heartbeat_at__lt=expired) | Q(heartbeat_at__isnull=True, started_at__lt=expired)
+    return AnalysisJob.objects.filter(lapsed, status=AnalysisJob.STATUS_RUNNING).update(
+        status=AnalysisJob.STATUS_FAILED, error='Interrupted: the worker running it stopped',
+        finished_at=timezone.now(),
+    )
+
+
+def _recover_interrupted_jobs():
+    """
+    Fail running jobs whose worker stopped heartbeating and return the ids
+    of queued ones so they are picked up again. Jobs still leased by another
+    live worker are left alone; starting a queued job is a conditional
+    update, so a job never runs twice even when several workers queue it.
+    """
+    _fail_expired_jobs()
+    return list(AnalysisJob.objects.filter(status=AnalysisJob.STATUS_QUEUED).values_list('id', flat=True))
+
+
+def submit_job(kind, params):
+    """Create a job row and queue it; raises ValueError for unknown kinds"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = AnalysisJob.objects.create(id=uuid.uuid4().hex, kind=kind, params=params or {})
+    _submit(job.id)
+    return job
+
+
+def cancel_job(job_id):
+    """
+    Request cancellation. Queued jobs are cancelled immediately; running
+    jobs stop at their next progress report. Returns the job or None.
+    """
+    job = AnalysisJob.objects.filter(id=job_id).first()
+    if job is None:
+        return None
+    if job.status == AnalysisJob.STATUS_QUEUED:
+        AnalysisJob.objects.filter(id=job_id, status=AnalysisJob.STATUS_QUEUED).update(
+            status=AnalysisJob.STATUS_CANCELLED, cancel_requested=True, finished_at=timezone.now(),
+        )
+    elif job.status == AnalysisJob.STATUS_RUNNING:
+        AnalysisJob.objects.filter(id=job_id).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def _finish(job_id, status, **fields):
+    AnalysisJob.objects.filter(id=job_id).update(status=status, finished_at=timezone.now(), **fields)
+
+
+def _run_job(job_id):
+    with _queued_lock:
+        _queued.discard(job_id)
+    close_old_connections()
+    try:
+        started = AnalysisJob.objects.filter(
+            id=job_id, status=AnalysisJob.STATUS_QUEUED, cancel_requested=False,
+        ).update(
+            status=AnalysisJob.STATUS_RUNNING, started_at=timezone.now(), owner=_owner, heartbeat_at=timezone.now(),
+        )
+        if not started:
+            return
+        job = AnalysisJob.objects.get(id=job_id)
+        try:
+            result = _handlers[job.kind](job.params, JobContext(job_id))
+        except JobCancelled:
+            _finish(job_id, AnalysisJob.STATUS_CANCELLED)
+            return
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job.kind}) failed: {e}")
+            traceback.print_exc()
+            _finish(job_id, AnalysisJob.STATUS_FAILED, error=str(e))
+            return
+        _finish(job_id, AnalysisJob.STATUS_SUCCEEDED, result=result)
+    finally:
+        connection.close()
+
+
+def job_status(job):
+    """JSON-ready status dict for a job row"""
+    total = job.progress_total
+    return {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': {
+            'done': job.progress_done,
+            'total': total,
+            'percent': round(job.progress_done * 100.0 / total, 1) if total else None,
+            'message': job.progress_message,
+        },
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,173 @@
+"""
+Concurrent dispatch of independent LLM requests.
+
+Requests run on a bounded thread pool. A shared token bucket paces them
+instead of sleeping a fixed interval after each call. Rate-limit errors
+(HTTP 429 / quota exhausted) are retried with exponential backoff and full
+jitter. Results always come back in input order.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+from django.db import connections
+
+from .circuit_breaker import CircuitOpenError
+from .config import (
+    LLM_CONCURRENCY,
+    LLM_RATE_PER_SECOND,
+    LLM_BURST,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, at most ``capacity`` banked"""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """Block until ``tokens`` are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def refund(self, tokens=1.0):
+        """Give back tokens taken for a request that was never sent"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+
+# Shared by every request in this process so concurrent users split one budget
+_default_bucket = TokenBucket(LLM_RATE_PER_SECOND, LLM_BURST)
+
+
+def is_rate_limited(exc):
+    """True for 429 / quota-exhausted errors from the Gemini SDK or REST API"""
+    if getattr(exc, 'code', None) == 429 or getattr(exc, 'status_code', None) == 429:
+        return True
+    response = getattr(exc, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+    text = str(exc).lower()
+    return '429' in text or 'resource exhausted' in text or 'resourceexhausted' in text or 'quota' in text
+
+
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE, cap=LLM_BACKOFF_MAX):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retry(fn, item, bucket=None, max_retries=LLM_MAX_RETRIES, deadline=None):
+    """fn(item), retried with backoff while rate limited, but never sleeping past deadline"""
+    bucket = bucket or _default_bucket
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            return fn(item)
+        except CircuitOpenError:
+            # Rejected before reaching the API, so it shouldn't hold up the calls behind it
+            bucket.refund()
+            raise
+        except Exception as e:
+            if not is_rate_limited(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            logger.warning(f"Rate limited, retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            attempt += 1
+
+
+def iter_dispatch(items, fn, on_error=None, concurrency=LLM_CONCURRENCY, bucket=None,
+                  max_retries=LLM_MAX_RETRIES, paced=True, deadline=None):
+    """
+    Run fn(item) for every item concurrently, yielding (index, result) in
+    completion order. Closing the generator early cancels items not yet started.
+
+    deadline is a time.monotonic() value; once it passes, iteration stops
+    without waiting for the items still running, so callers must handle
+    indices that were never yielded.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    def run(item):
+        try:
+            return call_with_retry(fn, item, bucket, max_retries, deadline) if paced else fn(item)
+        finally:
+            # Worker threads may touch the response cache; don't leak their connections
+            connections.close_all()
+
+    workers = max(1, min(concurrency, len(items)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    timed_out = False
+    futures = {pool.submit(run, item): index for index, item in enumerate(items)}
+    try:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    result = on_error(items[index], e)
+                yield index, result
+        except FuturesTimeoutError:
+            timed_out = True
+            pending = sum(1 for future in futures if not future.done())
+            logger.warning(f"Deadline reached with {pending} of {len(items)} requests unfinished")
+    except BaseException:
+        # Don't start queued items once the caller has given up
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        # Past the deadline, running requests finish in the background
+        pool.shutdown(wait=not timed_out, cancel_futures=True)
+
+
+def dispatch(items, fn, on_error=None, on_complete=None, concurrency=LLM_CONCURRENCY, bucket=None,
+             max_retries=LLM_MAX_RETRIES, paced=True, deadline=None):
+    """
+    Run fn(item) for every item concurrently and return results in input order.
+
+    on_error(item, exc) supplies the result for an item that still fails after
+    retries (the exception propagates if it is not given). on_complete(index,
+    result) is called on the calling thread as each item finishes, so it may
+    touch the database. With paced=False fn is called directly and is
+    expected to use call_with_retry itself for every request it makes.
+    Items unfinished at the deadline are left as None.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    for index, result in iter_dispatch(items, fn, on_error, concurrency, bucket, max_retries, paced, deadline):
+        results[index] = result
+        if on_complete:
+            on_complete(index, result)
+    return results
@@ -0,0 +1,427 @@
+"""
+Single entry point for Gemini text generation.
+
+Every call site (summaries, Q&A, sentiment batches and insights) goes through
+generate(), or generate_stream() for streamed output. Both look up a
+persistent response cache keyed by a hash of (model, prompt, generation
+parameters) before calling the model. Entries expire after a TTL, and the
+least recently used ones are evicted once the cache grows past its size
+budget. Cache failures never fail a call.
+
+Identical calls made at the same time are coalesced: the first one goes to
+the model, and concurrent threads wait for its response instead of making
+their own request. Across gunicorn workers the leader holds an LLMInFlight
+row, and other workers wait for the row to go away and read the response
+from the cache.
+
+Each model call runs through that model's circuit breaker and gets a timeout
+of LLM_CALL_TIMEOUT_SECONDS, capped by the time left before the caller's
+deadline. While the breaker is open, or once the deadline has passed, calls
+raise at once instead of waiting, so callers can go straight to their
+fallbacks.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .circuit_breaker import breaker_for
+from .config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES, LLM_CACHE_EVICT_EVERY,
+    LLM_SINGLE_FLIGHT, LLM_SINGLE_FLIGHT_WAIT_SECONDS, LLM_SINGLE_FLIGHT_POLL_SECONDS,
+    LLM_CALL_TIMEOUT_SECONDS,
+)
+from .models import LLMInFlight, LLMResponse
+
+try:
+    from google.api_core.retry import Retry
+except ImportError:
+    Retry = None
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'errors': 0, 'coalesced': 0}
+
+_flights_lock = threading.Lock()
+_flights = {}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's deadline passed before (or while) the model answered"""
+
+
+def call_timeout(deadline=None):
+    """
+    Seconds the next model call may take: LLM_CALL_TIMEOUT_SECONDS, capped by
+    the time left before deadline (a time.monotonic() value)
+    """
+    if deadline is None:
+        return LLM_CALL_TIMEOUT_SECONDS
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline passed before the model call")
+    return min(LLM_CALL_TIMEOUT_SECONDS, remaining)
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def model_name_of(model):
+    return getattr(model, 'model_name', None) or type(model).__name__
+
+
+def cache_key(model_name, prompt, params=None):
+    raw = json.dumps([model_name, prompt, params or {}], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _lookup(key):
+    cutoff = timezone.now() - timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+    entry = LLMResponse.objects.filter(key=key, created_at__gte=cutoff).only('response').first()
+    if entry is not None:
+        LLMResponse.objects.filter(key=key).update(last_used_at=timezone.now(), hits=F('hits') + 1)
+        return entry.response
+    return None
+
+
+def _store(key, model_name, text):
+    size = len(text.encode('utf-8'))
+    LLMResponse.objects.update_or_create(
+        key=key,
+        defaults={
+            'model_name': model_name[:128],
+            'response': text,
+            'size_bytes': size,
+            'created_at': timezone.now(),
+            'last_used_at': timezone.now(),
+        },
+    )
+    with _stats_lock:
+        _stats['stores'] += 1
+        due = LLM_CACHE_EVICT_EVERY <= 1 or _stats['stores'] % LLM_CACHE_EVICT_EVERY == 1
+    if due:
+        evict()
+
+
+def _save(key, model_name, text):
+    try:
+        _store(key, model_name, text)
+    except Exception as e:
+        logger.warning(f"LLM cache write failed: {e}")
+        _count('errors')
+
+
+def _cached(key):
+    try:
+        return _lookup(key)
+    except Exception as e:
+        logger.warning(f"LLM cache lookup failed: {e}")
+        _count('errors')
+        return None
+
+
+class _Flight:
+    """A call in progress that identical calls in this process wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+        self.claimed = False
+
+
+def _claim(key):
+    """Take the LLMInFlight row for key; False while another worker holds it"""
+    stale = timezone.now() - timedelta(seconds=LLM_SINGLE_FLIGHT_WAIT_SECONDS)
+    try:
+        LLMInFlight.objects.filter(key=key, started_at__lt=stale).delete()
+        with transaction.atomic():
+            LLMInFlight.objects.create(key=key)
+        return True
+    except IntegrityError:
+        return False
+    except Exception as e:
+        # Coordination is best effort; without the row this worker just calls the model
+        logger.warning(f"LLM in-flight claim failed: {e}")
+        _count('errors')
+        return None
+
+
+def _await_remote(key, wait=LLM_SINGLE_FLIGHT_WAIT_SECONDS):
+    """Cached response of another worker's call for key, or None if it doesn't produce one within wait seconds"""
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(LLM_SINGLE_FLIGHT_POLL_SECONDS)
+        text = _cached(key)
+        if text is not None:
+            return text
+        try:
+            if not LLMInFlight.objects.filter(key=key).exists():
+                return _cached(key)
+        except Exception as e:
+            logger.warning(f"LLM in-flight lookup failed: {e}")
+            return None
+    return None
+
+
+def _follow(key, shared, deadline=None):
+    """
+    (text, flight) for a call about to go to the model.
+
+    text is the response of an identical call that was already in flight;
+    the caller returns it as is. Otherwise text is None and, unless
+    coalescing is off or the leader gave up, flight is this call's own entry,
+    which must be passed to _land() when the call finishes. shared also
+    coordinates with other workers through the response cache.
+    """
+    if not LLM_SINGLE_FLIGHT:
+        return None, None
+    wait = LLM_SINGLE_FLIGHT_WAIT_SECONDS
+    if deadline is not None:
+        wait = min(wait, max(0.0, deadline - time.monotonic()))
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(wait):
+            return None, None
+        if flight.error is not None:
+            raise flight.error
+        if flight.text is not None:
+            _count('coalesced')
+        return flight.text, None
+
+    if shared:
+        flight.claimed = _claim(key)
+        if flight.claimed is False:
+            text = _await_remote(key, wait)
+            if text is not None:
+                _count('coalesced')
+                _land(key, flight, text)
+                return text, None
+    return None, flight
+
+
+def _land(key, flight, text=None, error=None):
+    """Finish flight, handing text (or error) to the calls waiting on it"""
+    if flight is None:
+        return
+    if flight.claimed:
+        try:
+            LLMInFlight.objects.filter(key=key).delete()
+        except Exception as e:
+            logger.warning(f"LLM in-flight release failed: {e}")
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.text = text
+    flight.error = error
+    flight.done.set()
+
+
+def evict():
+    """Drop expired entries, then least recently used ones until under the size budget"""
+    cutoff = timezone.now() - timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+    removed, _ = LLMResponse.objects.filter(created_at__lt=cutoff).delete()
+
+    total = LLMResponse.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    if total > LLM_CACHE_MAX_BYTES:
+        excess = total - LLM_CACHE_MAX_BYTES
+        stale_ids = []
+        for entry_id, size in LLMResponse.objects.order_by('last_used_at').values_list('id', 'size_bytes').iterator():
+            if excess <= 0:
+                break
+            stale_ids.append(entry_id)
+            excess -= size
+        for i in range(0, len(stale_ids), 500):
+            deleted, _ = LLMResponse.objects.filter(id__in=stale_ids[i:i + 500]).delete()
+            removed += deleted
+    if removed:
+        _count('evictions', removed)
+    return removed
+
+
+def _request_options(timeout):
+    """SDK request options that keep the call, including the SDK's own retries, within timeout"""
+    options = {'timeout': timeout}
+    if Retry is not None:
+        options['retry'] = Retry(timeout=timeout)
+    return options
+
+
+def _request(model_name, deadline, send):
+    """send(timeout) through model_name's circuit breaker; raises CircuitOpenError while it is open"""
+    timeout = call_timeout(deadline)
+    breaker = breaker_for(model_name)
+    probe = breaker.allow()
+    started = time.monotonic()
+    try:
+        text = send(timeout)
+    except Exception:
+        breaker.record(False, time.monotonic() - started, probe)
+        raise
+    breaker.record(True, time.monotonic() - started, probe)
+    return text
+
+
+def generate(prompt, model=None, call=None, model_name=None, params=None, parse=None, use_cache=True,
+             deadline=None):
+    """
+    Response text for prompt (or parse(text) when parse is given).
+
+    The request is made with model.generate_content(prompt) for an SDK model,
+    or with call(prompt, timeout) for other transports. Errors propagate to
+    the caller and are never cached; with parse, a response is only cached if
+    it parses. Calls waiting on an identical in-flight call get its response,
+    or its error. deadline is a time.monotonic() value the call must finish by.
+    """
+    if model is None and call is None:
+        raise ValueError("Gemini model not available")
+    model_name = model_name or model_name_of(model)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    key = cache_key(model_name, prompt, params)
+
+    if use_cache:
+        cached = _cached(key)
+        if cached is not None:
+            try:
+                result = parse(cached) if parse else cached
+                _count('hits')
+                return result
+            except Exception:
+                # Parser changed since this was stored; fetch a fresh response
+                pass
+        _count('misses')
+
+    text, flight = _follow(key, use_cache, deadline)
+    if text is not None:
+        return parse(text) if parse else text
+
+    def send(timeout):
+        if call is not None:
+            return call(prompt, timeout)
+        options = _request_options(timeout)
+        if params:
+            return model.generate_content(prompt, generation_config=params, request_options=options).text
+        return model.generate_content(prompt, request_options=options).text
+
+    error = None
+    try:
+        text = _request(model_name, deadline, send)
+        result = parse(text) if parse else text
+        if use_cache and text:
+            _save(key, model_name, text)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _land(key, flight, text if error is None else None, error)
+    return result
+
+
+def generate_stream(prompt, model=None, call=None, model_name=None, params=None, use_cache=True, deadline=None):
+    """
+    Yield the response text for prompt in chunks as the model produces them.
+
+    Uses model.generate_content(prompt, stream=True) for an SDK model, or
+    call(prompt, timeout), which must return an iterable of text chunks, for
+    other transports. Shares cache entries with generate(): a cached response
+    is yielded whole, and a completed stream is stored for both. A stream that
+    fails or is abandoned part-way is never cached. Calls waiting on an
+    identical in-flight call get its response whole once it completes; if it
+    is abandoned they make their own request. The stream is cut off with
+    DeadlineExceeded once deadline passes; its time to first chunk is its
+    latency for the circuit breaker.
+    """
+    if model is None and call is None:
+        raise ValueError("Gemini model not available")
+    model_name = model_name or model_name_of(model)
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    key = cache_key(model_name, prompt, params)
+
+    if use_cache:
+        cached = _cached(key)
+        if cached is not None:
+            _count('hits')
+            yield cached
+            return
+        _count('misses')
+
+    text, flight = _follow(key, use_cache, deadline)
+    if text is not None:
+        yield text
+        return
+
+    breaker = breaker_for(model_name)
+    error = None
+    try:
+        timeout = call_timeout(deadline)
+        probe = breaker.allow()
+        started = time.monotonic()
+        first_chunk = None
+        parts = []
+        try:
+            if call is not None:
+                chunks = call(prompt, timeout)
+            else:
+                options = _request_options(timeout)
+                if params:
+                    response = model.generate_content(
+                        prompt, generation_config=params, stream=True, request_options=options,
+                    )
+                else:
+                    response = model.generate_content(prompt, stream=True, request_options=options)
+                chunks = (chunk.text for chunk in response)
+            for chunk in chunks:
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                if deadline is not None and time.monotonic() > deadline:
+                    raise DeadlineExceeded("Request deadline passed during the response stream")
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+        except (GeneratorExit, DeadlineExceeded):
+            # Cut short by the caller, not the API
+            breaker.release(probe)
+            raise
+        except Exception:
+            breaker.record(False, time.monotonic() - started, probe)
+            raise
+        breaker.record(True, first_chunk if first_chunk is not None else time.monotonic() - started, probe)
+        text = ''.join(parts)
+        if use_cache and text:
+            _save(key, model_name, text)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _land(key, flight, text if error is None else None, error)
+
+
+def cache_stats():
+    """Process-local hit/miss counters plus the size of the persistent cache"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+    totals = LLMResponse.objects.aggregate(total=Sum('size_bytes'), stored_hits=Sum('hits'))
+    stats.update({
+        'enabled': LLM_CACHE_ENABLED,
+        'entries': LLMResponse.objects.count(),
+        'size_bytes': totals['total'] or 0,
+        'stored_hits': totals['stored_hits'] or 0,
+        'max_bytes': LLM_CACHE_MAX_BYTES,
+        'ttl_seconds': LLM_CACHE_TTL_SECONDS,
+    })
+    return stats
@@ -0,0 +1,218 @@
+"""
+Offline first-tier sentiment engine.
+
+English scoring uses VADER when vaderSentiment is installed (a small built-in
+lexicon otherwise). A Hindi/Marathi lexicon covers both Devanagari and common
+romanized spellings, since most of these groups write in a mix of both. Every
+result carries a confidence, so only uncertain messages need the LLM tier.
+
+classify_messages() scores a whole batch at once: identical texts are scored
+once, and the Hindi/Marathi lexicon pass runs as one numpy pass over the
+tokens of every message. VADER only scores one text per call, so it still
+runs once per distinct text.
+"""
+import math
+import re
+import unicodedata
+
+import numpy as np
+
+try:
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    _vader = SentimentIntensityAnalyzer()
+except ImportError:
+    _vader = None
+
+# Word valences on VADER's -4..4 scale
+INDIC_LEXICON = {
+    # Hindi (Devanagari)
+    'अच्छा': 2.0, 'अच्छी': 2.0, 'अच्छे': 2.0, 'बढ़िया': 2.5, 'धन्यवाद': 2.0,
+    'शुक्रिया': 2.0, 'खुश': 2.5, 'सुंदर': 2.0, 'शानदार': 3.0, 'बधाई': 2.5, 'उत्तम': 2.5,
+    'आनंद': 2.5, 'प्रेम': 2.5, 'सही': 1.5, 'सफल': 2.0, 'लाभ': 1.5, 'फायदा': 1.5,
+    'बुरा': -2.0, 'बुरी': -2.0, 'खराब': -2.0, 'गलत': -1.5, 'दुःख': -2.5, 'दुख': -2.5,
+    'गुस्सा': -2.5, 'परेशान': -2.0, 'समस्या': -1.5, 'नुकसान': -2.0, 'बेकार': -2.5,
+    'घटिया': -3.0, 'नाराज': -2.0, 'चिंता': -1.5, 'धोखा': -3.0, 'बर्बाद': -3.0,
+    # Marathi (Devanagari)
+    'छान': 2.0, 'मस्त': 2.0, 'अभिनंदन': 2.5, 'आभार': 2.0, 'आनंदी': 2.5, 'चांगले': 2.0,
+    'चांगला': 2.0, 'भारी': 1.5, 'वाईट': -2.0, 'त्रास': -2.0, 'अडचण': -1.5, 'चूक': -1.5,
+    'रोग': -1.5, 'कीड': -1.5, 'तोटा': -2.0, 'काळजी': -1.0,
+    # Romanized Hindi / Marathi
+    'accha': 2.0, 'achha': 2.0, 'acha': 2.0, 'badhiya': 2.5, 'badiya': 2.5, 'dhanyawad': 2.0,
+    'dhanyavad': 2.0, 'shukriya': 2.0, 'khush': 2.5, 'sundar': 2.0, 'shandar': 3.0,
+    'badhai': 2.5, 'abhinandan': 2.5, 'jabardast': 3.0, 'zabardast': 3.0, 'mast': 2.0,
+    'chhan': 2.0, 'chan': 1.5, 'bhari': 1.5, 'aabhar': 2.0,
+    'bekar': -2.5, 'bekaar': -2.5, 'kharab': -2.0, 'bura': -2.0, 'galat': -1.5, 'dukh': -2.5,
+    'gussa': -2.5, 'pareshan': -2.0, 'nuksan': -2.0, 'nuksaan': -2.0, 'ghatiya': -3.0,
+    'traas': -2.0, 'naraz': -2.0, 'naraj': -2.0, 'chinta': -1.5, 'bakwas': -2.5,
+    'dhokha': -3.0, 'barbad': -3.0, 'vaait': -2.0, 'vait': -2.0,
+}
+
+NEGATIONS = {'नहीं', 'नही', 'ना', 'मत', 'नाही', 'नको', 'nahi', 'nahin', 'nai', 'nhi', 'mat', 'nako'}
+
+# Used only when vaderSentiment is not installed
+ENGLISH_LEXICON = {
+    'love': 3.2, 'like': 1.5, 'good': 1.9, 'great': 3.1, 'awesome': 3.1, 'amazing': 2.8,
+    'wonderful': 2.7, 'excellent': 2.7, 'happy': 2.7, 'glad': 2.0, 'excited': 1.4, 'best': 3.2,
+    'thanks': 1.9, 'thank': 1.5, 'congrats': 2.4, 'congratulations': 2.9, 'nice': 1.8, 'perfect': 2.7,
+    'hate': -2.7, 'bad': -2.5, 'terrible': -2.1, 'awful': -2.0, 'horrible': -2.5, 'worst': -3.1,
+    'angry': -2.3, 'sad': -2.1, 'upset': -1.6, 'disappointed': -1.9, 'worried': -1.2, 'problem': -1.7,
+    'issue': -0.8, 'loss': -1.3, 'damage': -2.2, 'wrong': -2.1, 'fail': -2.5, 'failed': -2.3,
+}
+
+ANGER_WORDS = {'angry', 'furious', 'mad', 'annoyed', 'गुस्सा', 'नाराज', 'gussa', 'naraz', 'naraj'}
+FEAR_WORDS = {'worried', 'scared', 'afraid', 'चिंता', 'काळजी', 'chinta'}
+
+TOKEN_RE = re.compile("[\u0900-\u097F]+|[a-z']+")
+
+# VADER's normalisation constant and negation scalar
+_ALPHA = 15
+_NEGATION_SCALAR = -0.74
+
+
+def _normalize(score):
+    return score / math.sqrt(score * score + _ALPHA)
+
+
+def _indic_score(tokens):
+    """(summed valence, positive hits, negative hits, matched words)"""
+    total = 0.0
+    pos = neg = 0
+    matched = []
+    for i, token in enumerate(tokens):
+        valence = INDIC_LEXICON.get(token)
+        if valence is None and _vader is None:
+            valence = ENGLISH_LEXICON.get(token)
+        if valence is None:
+            continue
+        # Hindi/Marathi usually negate after the word ("अच्छा नहीं"), English before it
+        window = tokens[max(0, i - 2):i] + tokens[i + 1:i + 3]
+        if any(t in NEGATIONS for t in window):
+            valence *= _NEGATION_SCALAR
+        total += valence
+        if valence > 0:
+            pos += 1
+        else:
+            neg += 1
+        matched.append(token)
+    return total, pos, neg, matched
+
+
+def _indic_scores(token_lists):
+    """
+    _indic_score() for many messages in one vectorised pass: per-message
+    (summed valences, positive hits, negative hits) arrays and matched words
+    """
+    count = len(token_lists)
+    lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=count)
+    if not lengths.sum():
+        return np.zeros(count), np.zeros(count, dtype=np.int64), np.zeros(count, dtype=np.int64), [[] for _ in range(count)]
+    flat = [token for tokens in token_lists for token in tokens]
+    owner = np.repeat(np.arange(count), lengths)
+
+    # Look each distinct token up once, then gather per position
+    vocabulary, inverse = np.unique(np.array(flat), return_inverse=True)
+    lexicon_values = [INDIC_LEXICON.get(word) for word in vocabulary.tolist()]
+    if _vader is None:
+        lexicon_values = [
+            ENGLISH_LEXICON.get(word) if value is None else value
+            for word, value in zip(vocabulary.tolist(), lexicon_values)
+        ]
+    valences = np.array([np.nan if value is None else value for value in lexicon_values])[inverse]
+    is_negation = np.isin(vocabulary, list(NEGATIONS))[inverse]
+
+    # A negation up to two tokens before or after, within the same message
+    negated = np.zeros(len(flat), dtype=bool)
+    for offset in (1, 2):
+        same = owner[offset:] == owner[:-offset]
+        negated[offset:] |= is_negation[:-offset] & same
+        negated[:-offset] |= is_negation[offset:] & same
+    valences = np.where(negated, valences * _NEGATION_SCALAR, valences)
+
+    hit = ~np.isnan(valences)
+    totals = np.bincount(owner[hit], weights=valences[hit], minlength=count)
+    pos = np.bincount(owner[hit & (valences > 0)], minlength=count)
+    neg = np.bincount(owner[hit & (valences <= 0)], minlength=count)
+    hit_positions = np.flatnonzero(hit)
+    bounds = np.searchsorted(owner[hit_positions], np.arange(count + 1))
+    matched = [[flat[k] for k in hit_positions[bounds[i]:bounds[i + 1]]] for i in range(count)]
+    return totals, pos, neg, matched
+
+
+def classify_text(text):
+    """Local sentiment result for one message, in the same shape as the LLM results"""
+    text = unicodedata.normalize('NFC', text or '')
+    tokens = TOKEN_RE.findall(text.lower())
+    indic_total, pos_hits, neg_hits, matched = _indic_score(tokens)
+    return _result(text, tokens, indic_total, pos_hits, neg_hits, matched)
+
+
+def _result(text, tokens, indic_total, pos_hits, neg_hits, matched):
+    compound = _normalize(indic_total) if indic_total else 0.0
+    if _vader is not None:
+        scores = _vader.polarity_scores(text)
+        compound = max(-1.0, min(1.0, compound + scores['compound']))
+        if scores['pos'] > 0:
+            pos_hits += 1
+        if scores['neg'] > 0:
+            neg_hits += 1
+        matched.extend(t for t in tokens if t in _vader.lexicon)
+
+    magnitude = abs(compound)
+    if pos_hits == 0 and neg_hits == 0:
+        sentiment = 'neutral'
+        # Long messages with no lexicon evidence may still carry tone
+        confidence = 0.55 if len(tokens) > 25 else 0.75
+    elif pos_hits and neg_hits:
+        sentiment = 'positive' if compound >= 0.05 else 'negative' if compound <= -0.05 else 'neutral'
+        confidence = 0.35 + 0.3 * magnitude
+    elif magnitude < 0.05:
+        sentiment = 'neutral'
+        confidence = 0.6
+    else:
+        sentiment = 'positive' if compound > 0 else 'negative'
+        confidence = min(0.95, 0.6 + 0.4 * magnitude)
+
+    token_set = set(tokens)
+    if sentiment == 'positive':
+        emotion = 'joy'
+    elif sentiment == 'negative':
+        emotion = 'anger' if token_set & ANGER_WORDS else 'fear' if token_set & FEAR_WORDS else 'sadness'
+    else:
+        emotion = 'neutral'
+
+    return {
+        'sentiment': sentiment,
+        'confidence': round(confidence, 3),
+        'emotion': emotion,
+        'polarity_score': round(compound, 3),
+        'emotional_indicators': matched[:5],
+        'reason': f"Local analysis: {sentiment} (score {compound:+.2f})",
+        'source': 'local',
+    }
+
+
+def classify_messages(messages):
+    """Classify every message locally in one batch; gives the same results as classify_text() per message"""
+    texts = [unicodedata.normalize('NFC', msg.get('message', '') or '') for msg in messages]
+    distinct = list(dict.fromkeys(texts))
+    token_lists = [TOKEN_RE.findall(text.lower()) for text in distinct]
+    totals, pos, neg, matched = _indic_scores(token_lists)
+    by_text = {
+        text: _result(text, tokens, float(totals[i]), int(pos[i]), int(neg[i]), matched[i])
+        for i, (text, tokens) in enumerate(zip(distinct, token_lists))
+    }
+    # Copies, since callers update results in place
+    return [dict(by_text[text]) for text in texts]
+
+
+def select_escalations(results, confidence_threshold, max_escalation_ratio):
+    """
+    Positions whose local confidence is below the threshold, least confident
+    first, capped at max_escalation_ratio of all messages
+    """
+    candidates = sorted(
+        (i for i, result in enumerate(results) if result['confidence'] < confidence_threshold),
+        key=lambda i: results[i]['confidence'],
+    )
+    limit = int(math.floor(max(0.0, min(1.0, max_escalation_ratio)) * len(results)))
+    return sorted(candidates[:limit]), len(candidates)
@@ -0,0 +1,131 @@
+"""
+Offline extractive summaries.
+
+Sentences are taken from the compressed chat (noise dropped, forwards
+collapsed) and ranked by TF-IDF cosine similarity to the range's centroid,
+so the sentences most representative of what the group talked about come
+first. Repeated forwards and messages that share documents or links get a
+small boost, and sentences too similar to one already chosen are skipped.
+Tokenization keeps Devanagari vowel signs inside words, so Hindi, Marathi
+and English text are ranked the same way. No model or network is involved.
+"""
+import math
+import re
+from collections import Counter
+
+from .prompt_builder import compress_messages
+
+_TOKEN_RE = re.compile(r'[\w\u0900-\u097f]+')
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?।])\s+|\s*\n\s*')
+_URL_RE = re.compile(r'https?://\S+')
+_DOCUMENT_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xlsx')
+
+STOPWORDS = {
+    # English
+    'the', 'and', 'for', 'are', 'was', 'were', 'this', 'that', 'with', 'you', 'your', 'have', 'has',
+    'had', 'not', 'but', 'all', 'any', 'can', 'will', 'from', 'they', 'them', 'their', 'there', 'what',
+    'when', 'which', 'who', 'how', 'our', 'out', 'about', 'into', 'also', 'just', 'then', 'than', 'its',
+    'been', 'one', 'please', 'pls', 'ok', 'okay', 'yes', 'thanks', 'thank', 'sir', 'https', 'http', 'www',
+    # Hindi
+    'है', 'हैं', 'और', 'की', 'का', 'के', 'को', 'में', 'से', 'पर', 'भी', 'तो', 'यह', 'वह', 'था', 'थे',
+    'थी', 'हो', 'कर', 'ने', 'एक', 'लिए', 'नहीं', 'जी', 'ही', 'या', 'कि',
+    # Marathi
+    'आहे', 'आहेत', 'व', 'ला', 'ना', 'चा', 'ची', 'चे', 'च्या', 'ते', 'ती', 'हे', 'ही', 'तर', 'पण',
+    'मध्ये', 'साठी', 'करा', 'केले', 'होते', 'नाही', 'आणि', 'सर', 'सर्व',
+    # Romanized
+    'hai', 'hain', 'aur', 'ki', 'ka', 'ke', 'ko', 'mein', 'se', 'bhi', 'nahi', 'ahe', 'aahe', 'ani',
+}
+
+# Sentences need this many content words to be worth quoting
+MIN_SENTENCE_TERMS = 3
+MAX_SENTENCE_CHARS = 240
+# Candidates considered for selection after ranking
+MAX_CANDIDATES = 2000
+REDUNDANCY_THRESHOLD = 0.35
+
+
+def _terms(text):
+    return [
+        token for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS and not token.isdigit()
+    ]
+
+
+def _sentences(items):
+    for item in items:
+        for sentence in _SENTENCE_SPLIT_RE.split(_URL_RE.sub('', item['text'])):
+            sentence = sentence.strip(' *-•')
+            terms = _terms(sentence)
+            if len(terms) >= MIN_SENTENCE_TERMS:
+                yield item, sentence, terms
+
+
+def _cosine(a, a_norm, b, b_norm):
+    if not a_norm or not b_norm:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0.0) for term, weight in a.items()) / (a_norm * b_norm)
+
+
+def rank_sentences(messages, limit):
+    """
+    Up to limit (item, sentence) pairs, most representative first.
+    item is the compressed message the sentence came from.
+    """
+    items, _ = compress_messages(messages)
+    candidates = list(_sentences(items))
+    if not candidates:
+        return []
+
+    document_frequency = Counter()
+    for _, _, terms in candidates:
+        document_frequency.update(set(terms))
+    total = len(candidates)
+    idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in document_frequency.items()}
+
+    vectors = []
+    centroid = Counter()
+    for _, _, terms in candidates:
+        vector = {term: (1 + math.log(count)) * idf[term] for term, count in Counter(terms).items()}
+        vectors.append(vector)
+        centroid.update(vector)
+    centroid_norm = math.sqrt(sum(weight * weight for weight in centroid.values()))
+    norms = [math.sqrt(sum(weight * weight for weight in vector.values())) for vector in vectors]
+
+    scores = []
+    for i, (item, sentence, _) in enumerate(candidates):
+        score = _cosine(vectors[i], norms[i], centroid, centroid_norm)
+        score *= 1 + 0.2 * math.log(item['repeats'])
+        lower = item['text'].lower()
+        if _URL_RE.search(item['text']) or any(ext in lower for ext in _DOCUMENT_EXTENSIONS):
+            score *= 1.15
+        scores.append(score)
+
+    order = sorted(range(total), key=lambda i: scores[i], reverse=True)[:MAX_CANDIDATES]
+    chosen = []
+    for i in order:
+        if len(chosen) >= limit:
+            break
+        if any(_cosine(vectors[i], norms[i], vectors[j], norms[j]) > REDUNDANCY_THRESHOLD for j in chosen):
+            continue
+        chosen.append(i)
+    return [(candidates[i][0], candidates[i][1]) for i in chosen]
+
+
+def local_summary(messages, sentence_count=4):
+    """
+    Bullet-point extractive summary of messages, in chronological order,
+    or None when no message has enough content to quote
+    """
+    ranked = rank_sentences(messages, sentence_count)
+    if not ranked:
+        return None
+    ranked.sort(key=lambda pair: pair[0]['position'])
+    lines = []
+    for item, sentence in ranked:
+        if len(sentence) > MAX_SENTENCE_CHARS:
+            sentence = sentence[:MAX_SENTENCE_CHARS].rstrip() + '…'
+        when = f" ({item['day']})" if item['day'] else ''
+        lines.append(f"* **{item['sender']}**{when}: {sentence}")
+    return '\n'.join(lines)
@@ -0,0 +1,58 @@
+import glob
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatapp.event_classifier import classify_messages
+from chatapp.views import parse_whatsapp
+
+
+def legacy_detect(messages):
+    """Per-message substring checks plus uncompiled re.search, as the old detectors did"""
+    found = 0
+    for msg in messages:
+        text = msg['message'].lower()
+        for keyword, pattern in (
+            ('added', r'(.+?) added (.+)'),
+            ('left', r'(.+?) left'),
+            ('removed', r'(.+?) removed (.+)'),
+            ('changed the subject to', r'(.+?) changed the subject to "(.+)"'),
+            ("changed this group's icon", r"(.+?) changed this group's icon"),
+            ('created group', r'(.+?) created group'),
+        ):
+            if keyword in text:
+                if re.search(pattern, msg['message'], re.IGNORECASE):
+                    found += 1
+                break
+    return found
+
+
+class Command(BaseCommand):
+    help = "Benchmark the group-event classifier against the legacy per-message detector"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help="Chat export .txt files (defaults to media/chat_files)")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--scale', type=int, default=10, help="Replicate the corpus N times")
+
+    def handle(self, *args, **options):
+        files = options['files'] or glob.glob(os.path.join(settings.MEDIA_ROOT, 'chat_files', '*.txt'))
+        messages = []
+        for path in files:
+            messages.extend(parse_whatsapp(path))
+        messages = messages * options['scale']
+        self.stdout.write(f"{len(messages)} messages from {len(files)} file(s)")
+
+        for label, fn in (('legacy', legacy_detect), ('classifier', classify_messages)):
+            best = None
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                result = fn(messages)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            count = result if isinstance(result, int) else len(result)
+            rate = len(messages) / best if best else float('inf')
+            self.stdout.write(f"{label:>10}: {best * 1000:8.1f} ms  {rate:12,.0f} msg/s  {count} events")
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from chatapp.http_client import HttpClient, httpx
+
+RESPONSE = json.dumps({'candidates': [{'content': {'parts': [{'text': 'benchmark answer'}]}}]}).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every POST like generateContent after the configured latency, keeping the connection open"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Local HTTPS stand-in for the Gemini API that counts TLS handshakes"""
+    daemon_threads = True
+
+    def __init__(self, context, latency):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.context = context
+        self.latency = latency
+        self.handshakes = 0
+
+    def get_request(self):
+        sock, address = self.socket.accept()
+        sock = self.context.wrap_socket(sock, server_side=True)
+        self.handshakes += 1
+        return sock, address
+
+
+def self_signed_cert(directory):
+    if not shutil.which('openssl'):
+        raise CommandError("openssl is needed to create the stand-in's certificate")
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+         '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost', '-keyout', key, '-out', cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-call requests.post against the pooled keep-alive client on a local HTTPS stand-in"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=100)
+        parser.add_argument('--latency', type=float, default=0.0, help="Stand-in latency per call (s)")
+
+    def handle(self, *args, **options):
+        calls = options['calls']
+        with tempfile.TemporaryDirectory() as directory:
+            cert, key = self_signed_cert(directory)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(cert, key)
+            server = StandInServer(context, options['latency'])
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"https://127.0.0.1:{server.server_address[1]}/v1beta/models/stand-in:generateContent"
+            payload = {'contents': [{'parts': [{'text': 'benchmark prompt'}]}]}
+
+            def per_call_post():
+                response = requests.post(url, json=payload, verify=cert, timeout=10)
+                response.raise_for_status()
+                return response.json()
+
+            phases = [('requests.post per call', per_call_post, None)]
+            pooled = HttpClient(backend='requests', verify=cert)
+            phases.append(('pooled requests.Session', lambda: pooled.post_json(url, json=payload), pooled))
+            if httpx is not None:
+                # The stand-in speaks HTTP/1.1 only, so this measures httpx's connection reuse
+                client = HttpClient(backend='httpx', http2=False, verify=cert)
+                phases.append(('pooled httpx.Client', lambda: client.post_json(url, json=payload), client))
+            else:
+                self.stdout.write("httpx not installed; skipping the httpx client")
+
+            self.stdout.write(f"{calls} sequential calls to {url}")
+            baseline = None
+            try:
+                for label, call, client in phases:
+                    handshakes = server.handshakes
+                    start = time.perf_counter()
+                    for _ in range(calls):
+                        call()
+                    elapsed = time.perf_counter() - start
+                    per_call = elapsed / calls * 1000
+                    line = (
+                        f"{label:>24}: {elapsed:7.3f}s  {per_call:7.2f} ms/call  "
+                        f"{server.handshakes - handshakes:4d} TLS handshakes"
+                    )
+                    if baseline is None:
+                        baseline = per_call
+                    else:
+                        line += f"  saves {baseline - per_call:6.2f} ms/call ({baseline / per_call:.1f}x)"
+                    self.stdout.write(line)
+            finally:
+                for _, _, client in phases:
+                    if client is not None:
+                        client.close()
+                server.shutdown()
+                server.server_close()
@@ -0,0 +1,116 @@
+import json
+import random
+import re
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatapp import llm_gateway, sentiment_analyzer
+from chatapp.llm_dispatch import TokenBucket, dispatch
+
+
+class FakeRateLimit(Exception):
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for the Gemini model: fixed latency, optional random 429s"""
+
+    def __init__(self, latency, rate_limit_probability=0.0):
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.calls = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.calls += 1
+            limited = random.random() < self.rate_limit_probability
+            if limited:
+                self.rate_limited += 1
+        time.sleep(self.latency)
+        if limited:
+            raise FakeRateLimit("429 Resource has been exhausted")
+        # Each result echoes its message so the caller can check the order
+        texts = re.findall(r'^Message \d+: (.*)$', prompt, re.MULTILINE)
+        return FakeResponse(json.dumps({'results': [
+            {'message_index': i + 1, 'sentiment': 'neutral', 'confidence': 0.9, 'emotion': 'neutral',
+             'emotional_indicators': [], 'reason': text, 'polarity_score': 0.0}
+            for i, text in enumerate(texts)
+        ]}))
+
+
+class Command(BaseCommand):
+    help = "Benchmark serial vs concurrent sentiment batch dispatch against a local fake model"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=400)
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--latency', type=float, default=0.5, help="Fake model latency per call (s)")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--rate', type=float, default=10.0, help="Token bucket rate (calls/s)")
+        parser.add_argument('--burst', type=int, default=8)
+        parser.add_argument('--rate-limit-probability', type=float, default=0.02)
+
+    def handle(self, *args, **options):
+        messages = [
+            {'timestamp': '1/1/23, 9:00 PM', 'sender': f'user{i % 7}', 'message': f'benchmark message {i}'}
+            for i in range(options['messages'])
+        ]
+        size = options['batch_size']
+        batches = [messages[i:i + size] for i in range(0, len(messages), size)]
+        original_model = sentiment_analyzer.model
+        # Every call must reach the fake model, and none may be written to the LLM response cache
+        cache_enabled = llm_gateway.LLM_CACHE_ENABLED
+        llm_gateway.LLM_CACHE_ENABLED = False
+
+        try:
+            # Serial loop with the fixed 0.3s pause, as analyze_sentiment used to run
+            fake = FakeModel(options['latency'])
+            sentiment_analyzer.model = fake
+            start = time.perf_counter()
+            for batch in batches:
+                sentiment_analyzer.batch_analyze_sentiment_with_gemini(batch)
+                time.sleep(0.3)
+            serial = time.perf_counter() - start
+            self.report("serial + sleep(0.3)", serial, len(messages), fake)
+
+            fake = FakeModel(options['latency'], options['rate_limit_probability'])
+            sentiment_analyzer.model = fake
+            bucket = TokenBucket(options['rate'], options['burst'])
+            start = time.perf_counter()
+            results = dispatch(
+                batches,
+                sentiment_analyzer._request_sentiment_batch,
+                on_error=sentiment_analyzer._fallback_sentiment_results,
+                concurrency=options['concurrency'],
+                bucket=bucket,
+            )
+            concurrent = time.perf_counter() - start
+            self.report(
+                f"dispatch c={options['concurrency']} rate={options['rate']}/s", concurrent, len(messages), fake,
+            )
+        finally:
+            sentiment_analyzer.model = original_model
+            llm_gateway.LLM_CACHE_ENABLED = cache_enabled
+
+        # Batches that exhausted their retries hold fallback labels, which carry no echo
+        answered = [(r, b) for r, b in zip(results, batches) if not any(x.get('source') == 'fallback' for x in r)]
+        in_order = len(results) == len(batches) and all(
+            [x['reason'] for x in r] == [msg['message'] for msg in b] for r, b in answered
+        )
+        self.stdout.write(f"results in order: {in_order} ({len(batches) - len(answered)} batches fell back)")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {serial / concurrent:.1f}x"))
+
+    def report(self, label, elapsed, count, fake):
+        self.stdout.write(
+            f"{label:<32} {elapsed:7.2f}s  {count / elapsed:8.1f} msg/s  "
+            f"calls={fake.calls} rate_limited={fake.rate_limited}"
+        )
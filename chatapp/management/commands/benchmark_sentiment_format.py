@@ -0,0 +1,89 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from chatapp import sentiment_analyzer
+from chatapp.sentiment_format import compact_sentiment_result
+
+SAMPLE_TEXTS = [
+    "Good morning everyone, the grapes in block 4 look very healthy this week",
+    "Spraying schedule for downy mildew is attached, please follow it strictly",
+    "The rates at the market were bad today, we lost a lot on the last lot",
+    "Thank you sir for the guidance, the yield was excellent this season",
+    "Is anyone else seeing leaf curl after the rain? I am worried about the crop",
+    "Meeting at the society office tomorrow at 10 am",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare payload size and serialization time of the full and compact sentiment responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000)
+        parser.add_argument('--senders', type=int, default=150)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        start = datetime(2023, 1, 1, 8, 0)
+        sentiment_data = sentiment_analyzer._new_sentiment_data(options['messages'])
+        for i in range(options['messages']):
+            sentiment = rng.choice(['positive', 'neutral', 'neutral', 'negative'])
+            polarity = {'positive': 0.6, 'neutral': 0.0, 'negative': -0.6}[sentiment]
+            timestamp = start + timedelta(minutes=17 * i)
+            msg = {
+                'timestamp': f"{timestamp.month}/{timestamp.day}/{timestamp:%y}, {timestamp:%I:%M %p}".replace(' 0', ' '),
+                'sender': f"Farmer {rng.randrange(options['senders'])} - Village",
+                'message': rng.choice(SAMPLE_TEXTS),
+            }
+            result = {
+                'sentiment': sentiment,
+                'confidence': rng.uniform(0.5, 0.99),
+                'emotion': {'positive': 'joy', 'neutral': 'neutral', 'negative': 'sadness'}[sentiment],
+                'polarity_score': polarity + rng.uniform(-0.2, 0.2),
+                'emotional_indicators': ['healthy', 'excellent'] if sentiment == 'positive' else
+                                        ['bad', 'worried'] if sentiment == 'negative' else [],
+                'reason': f"The message expresses a {sentiment} tone about the crop or market",
+            }
+            sentiment_analyzer._accumulate_result(sentiment_data, msg, result)
+        sentiment_data['total_analyzed'] = options['messages']
+
+        start = time.perf_counter()
+        compact = compact_sentiment_result(sentiment_data)
+        build_time = time.perf_counter() - start
+        with_text = compact_sentiment_result(sentiment_data, include_text=True)
+
+        full_bytes, full_time = self.measure(
+            lambda: json.dumps(sentiment_data, cls=DjangoJSONEncoder), options['repeat'],
+        )
+        compact_bytes, compact_time = self.measure(
+            lambda: json.dumps(compact, cls=DjangoJSONEncoder, separators=(',', ':')), options['repeat'],
+        )
+        text_bytes, text_time = self.measure(
+            lambda: json.dumps(with_text, cls=DjangoJSONEncoder, separators=(',', ':')), options['repeat'],
+        )
+
+        self.report("full", full_bytes, full_time)
+        self.report("compact", compact_bytes, compact_time)
+        self.report("compact + include_text", text_bytes, text_time)
+        self.stdout.write(f"compact table build: {build_time * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"compact is {full_bytes / compact_bytes:.1f}x smaller and {full_time / compact_time:.1f}x faster to serialize "
+            f"({full_time / (compact_time + build_time):.1f}x including the build)"
+        ))
+
+    def measure(self, encode, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            payload = encode()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return len(payload.encode('utf-8')), best
+
+    def report(self, label, size, elapsed):
+        self.stdout.write(f"{label:<24} {size / 1024:10.1f} KiB  {elapsed * 1000:8.1f} ms")
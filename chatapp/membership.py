@@ -0,0 +1,209 @@
+"""
+Membership timeline built from the group event stream.
+
+At ingest the added/left/removed events are replayed once into per-member
+join/leave intervals and a sorted change log carrying the running member
+count. Point-in-time counts are then a single indexed lookup of the last
+change at or before a timestamp, and member lists are an indexed range scan
+over the intervals, so no request ever replays the event history.
+"""
+from statistics import mean, median
+
+from django.db.models import Q
+
+from .event_classifier import split_targets
+from .group_event import parse_timestamp
+from .models import GroupEventIndex, MembershipChange, MembershipInterval
+
+DAY_SECONDS = 86400
+
+
+def _member_name(name):
+    # "you" as a target and "You" as an actor are the same person
+    return 'You' if name.lower() == 'you' else name
+
+
+def _membership_moves(event):
+    """[(member, +1/-1), ...] for one persisted event row"""
+    if event.event_type == 'added':
+        return [(_member_name(name), 1) for name in split_targets(event.target)]
+    if event.event_type == 'removed':
+        return [(_member_name(name), -1) for name in split_targets(event.target)]
+    if event.event_type == 'left':
+        return [(_member_name(event.actor), -1)]
+    return []
+
+
+def _initial_members(moves, messages, to_epoch):
+    """
+    Members already present when the export starts: anyone whose first
+    membership move is a departure, and anyone who posted before (or without)
+    ever being added.
+    """
+    first_move = {}
+    for epoch, member, delta in moves:
+        first_move.setdefault(member, (epoch, delta))
+
+    initial = {member for member, (_, delta) in first_move.items() if delta < 0}
+    for msg in messages:
+        sender = msg.get('sender')
+        if not sender:
+            continue
+        dt = parse_timestamp(msg.get('timestamp') or '')
+        if dt is None:
+            continue
+        first = first_move.get(sender)
+        if first is None or (first[1] > 0 and to_epoch(dt) < first[0]):
+            initial.add(sender)
+    return initial
+
+
+def build_membership(group_name, events, messages, to_epoch):
+    """
+    Replay events (sorted by epoch) into intervals and a change log and
+    persist them. Must run inside the caller's transaction.
+    """
+    moves = [
+        (event.epoch, member, delta)
+        for event in events
+        for member, delta in _membership_moves(event)
+    ]
+
+    message_epochs = [
+        to_epoch(dt) for dt in (parse_timestamp(m.get('timestamp') or '') for m in messages) if dt
+    ]
+    epochs = message_epochs + [epoch for epoch, _, _ in moves]
+    start_epoch = min(epochs) if epochs else 0
+    end_epoch = max(epochs) if epochs else 0
+
+    open_since = {}
+    intervals = []
+    changes = []
+    for member in sorted(_initial_members(moves, messages, to_epoch)):
+        open_since[member] = (start_epoch, False)
+        changes.append(MembershipChange(
+            group_name=group_name, epoch=start_epoch, member=member, delta=1, member_count=len(open_since),
+        ))
+
+    for epoch, member, delta in moves:
+        if delta > 0 and member not in open_since:
+            open_since[member] = (epoch, True)
+        elif delta < 0 and member in open_since:
+            joined, observed = open_since.pop(member)
+            intervals.append(MembershipInterval(
+                group_name=group_name, member=member, joined_epoch=joined, left_epoch=epoch, join_observed=observed,
+            ))
+        else:
+            # Re-add of a current member or departure of someone not present
+            continue
+        changes.append(MembershipChange(
+            group_name=group_name, epoch=epoch, member=member, delta=delta, member_count=len(open_since),
+        ))
+
+    for member, (joined, observed) in open_since.items():
+        intervals.append(MembershipInterval(
+            group_name=group_name, member=member, joined_epoch=joined, left_epoch=None, join_observed=observed,
+        ))
+
+    MembershipInterval.objects.filter(group_name=group_name).delete()
+    MembershipChange.objects.filter(group_name=group_name).delete()
+    MembershipInterval.objects.bulk_create(intervals, batch_size=500)
+    MembershipChange.objects.bulk_create(changes, batch_size=500)
+
+    return tenure_stats(intervals, start_epoch, end_epoch, len(open_since))
+
+
+def tenure_stats(intervals, start_epoch, end_epoch, current_members):
+    """Tenure statistics in days; open intervals are measured to the end of the export"""
+    completed = sorted((i.left_epoch - i.joined_epoch) / DAY_SECONDS for i in intervals if i.left_epoch is not None)
+    all_tenures = sorted(
+        ((i.left_epoch if i.left_epoch is not None else end_epoch) - i.joined_epoch) / DAY_SECONDS
+        for i in intervals
+    )
+
+    def summary(values):
+        if not values:
+            return {'count': 0, 'mean_days': 0, 'median_days': 0, 'p90_days': 0, 'max_days': 0}
+        return {
+            'count': len(values),
+            'mean_days': round(mean(values), 2),
+            'median_days': round(median(values), 2),
+            'p90_days': round(values[min(len(values) - 1, int(len(values) * 0.9))], 2),
+            'max_days': round(values[-1], 2),
+        }
+
+    return {
+        'start_epoch': start_epoch,
+        'end_epoch': end_epoch,
+        'current_members': current_members,
+        'distinct_members': len({i.member for i in intervals}),
+        'departures': len(completed),
+        'completed_tenure': summary(completed),
+        'all_tenure': summary(all_tenures),
+    }
+
+
+# ------------------- Queries -------------------
+
+def member_count_at(group_name, epoch):
+    """Running member count after the last change at or before epoch"""
+    last = (
+        MembershipChange.objects.filter(group_name=group_name, epoch__lte=epoch)
+        .order_by('-epoch', '-id')
+        .values_list('member_count', flat=True)
+        .first()
+    )
+    return last or 0
+
+
+def members_at(group_name, epoch):
+    """
+    Intervals covering epoch, i.e. who was in the group at that moment.
+
+    An indexed range scan, not a point lookup: the (group_name, joined_epoch)
+    index finds the intervals that began at or before epoch, and each one's
+    left_epoch is then checked, so the cost is O(log n + k) for the k
+    intervals that began by epoch, including those that have since closed.
+    member_count_at() is the O(log n) lookup when only the count is needed.
+    """
+    return (
+        MembershipInterval.objects.filter(group_name=group_name, joined_epoch__lte=epoch)
+        .filter(Q(left_epoch__isnull=True) | Q(left_epoch__gt=epoch))
+        .order_by('member')
+    )
+
+
+def member_history(group_name, member):
+    return MembershipInterval.objects.filter(group_name=group_name, member=member).order_by('joined_epoch')
+
+
+def member_count_series(group_name, start_epoch=None, end_epoch=None):
+    """
+    Step series of (epoch, member_count) with at most one point per day: the
+    count after that day's last change. With start_epoch the series opens
+    with the count carried in at start_epoch, unless changes on that same
+    day replace it.
+    """
+    qs = MembershipChange.objects.filter(group_name=group_name)
+    series = []
+    last_day = None
+    if start_epoch is not None:
+        qs = qs.filter(epoch__gte=start_epoch)
+        series.append((start_epoch, member_count_at(group_name, start_epoch - 1)))
+        last_day = start_epoch // DAY_SECONDS
+    if end_epoch is not None:
+        qs = qs.filter(epoch__lte=end_epoch)
+
+    for epoch, count in qs.order_by('epoch', 'id').values_list('epoch', 'member_count'):
+        day = epoch // DAY_SECONDS
+        if day == last_day:
+            series[-1] = (epoch, count)
+        else:
+            last_day = day
+            series.append((epoch, count))
+    return series
+
+
+def membership_stats(group_name):
+    return GroupEventIndex.objects.filter(group_name=group_name).values_list('membership_stats', flat=True).first() or {}
+
@@ -0,0 +1,96 @@
+"""
+Pre-analysis stage for sentiment: collapse repeated texts and label
+system/media placeholders without a model call.
+
+Forwards, acks and stickers repeat constantly in group chats. Messages are
+grouped by a hash of their normalised text, so each distinct text is analysed
+once and the result is copied to every message that shares it.
+"""
+import hashlib
+import re
+import unicodedata
+
+# Invisible marks WhatsApp exports put around system text
+_INVISIBLE_RE = re.compile('[\u200e\u200f\u202a-\u202e\u2066-\u2069\ufeff]')
+_SPACE_RE = re.compile(r'\s+')
+_EDITED_SUFFIX = '<this message was edited>'
+
+PLACEHOLDER_TEXTS = {
+    '<media omitted>',
+    'image omitted',
+    'video omitted',
+    'audio omitted',
+    'sticker omitted',
+    'gif omitted',
+    'document omitted',
+    'contact card omitted',
+    'this message was deleted',
+    'you deleted this message',
+    'waiting for this message',
+    'waiting for this message. this may take a while.',
+    'missed voice call',
+    'missed video call',
+    'null',
+}
+
+_PLACEHOLDER_PATTERNS = (
+    re.compile(r'^<attached: .+>$'),
+    re.compile(r'^.+\.(?:jpg|jpeg|png|webp|opus|mp4|pdf|vcf) \(file attached\)$'),
+    re.compile(r'^(?:document|image|video|audio)\s*omitted$'),
+    re.compile(r'^location: https?://\S+$'),
+)
+
+
+def normalize_text(text):
+    """Case-folded, NFC, whitespace-collapsed text without invisible marks"""
+    text = unicodedata.normalize('NFC', text or '')
+    text = _INVISIBLE_RE.sub('', text).casefold()
+    text = _SPACE_RE.sub(' ', text).strip()
+    if text.endswith(_EDITED_SUFFIX):
+        text = text[:-len(_EDITED_SUFFIX)].rstrip()
+    return text
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def is_placeholder(text, normalized=None):
+    if normalized is None:
+        normalized = normalize_text(text)
+    if not normalized or normalized in PLACEHOLDER_TEXTS:
+        return True
+    return any(pattern.match(normalized) for pattern in _PLACEHOLDER_PATTERNS)
+
+
+def placeholder_result():
+    return {
+        'sentiment': 'neutral',
+        'confidence': 1.0,
+        'emotion': 'neutral',
+        'polarity_score': 0.0,
+        'emotional_indicators': [],
+        'reason': 'System or media placeholder',
+        'source': 'placeholder',
+    }
+
+
+def group_duplicates(messages, indices):
+    """
+    Split indices into one representative per distinct normalised text.
+
+    Returns (representatives, copies) where copies maps a representative
+    index to the other indices sharing its text.
+    """
+    first_by_key = {}
+    copies = {}
+    representatives = []
+    for index in indices:
+        key = text_key(messages[index].get('message', ''))
+        representative = first_by_key.get(key)
+        if representative is None:
+            first_by_key[key] = index
+            representatives.append(index)
+        else:
+            copies.setdefault(representative, []).append(index)
+    return representatives, copies
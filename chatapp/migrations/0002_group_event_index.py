@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupEventIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=255, unique=True)),
+                ('source_signature', models.CharField(max_length=64)),
+                ('event_count', models.IntegerField(default=0)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GroupEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=255)),
+                ('epoch', models.BigIntegerField()),
+                ('day', models.DateField()),
+                ('event_type', models.CharField(max_length=32)),
+                ('actor', models.CharField(blank=True, max_length=255, null=True)),
+                ('target', models.CharField(blank=True, max_length=512, null=True)),
+                ('timestamp', models.CharField(max_length=64)),
+                ('details', models.TextField(blank=True)),
+                ('raw_message', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['epoch', 'id'],
+                'indexes': [models.Index(fields=['group_name', 'epoch'], name='groupevent_group_epoch'), models.Index(fields=['group_name', 'event_type', 'epoch'], name='groupevent_group_type_epoch'), models.Index(fields=['group_name', 'actor'], name='groupevent_group_actor'), models.Index(fields=['group_name', 'target'], name='groupevent_group_target')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0002_group_event_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupeventindex',
+            name='membership_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='MembershipChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=255)),
+                ('epoch', models.BigIntegerField()),
+                ('member', models.CharField(max_length=255)),
+                ('delta', models.SmallIntegerField()),
+                ('member_count', models.IntegerField()),
+            ],
+            options={
+                'ordering': ['epoch', 'id'],
+                'indexes': [models.Index(fields=['group_name', 'epoch'], name='membershipchange_group_epoch')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MembershipInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=255)),
+                ('member', models.CharField(max_length=255)),
+                ('joined_epoch', models.BigIntegerField()),
+                ('left_epoch', models.BigIntegerField(blank=True, null=True)),
+                ('join_observed', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['joined_epoch', 'id'],
+                'indexes': [models.Index(fields=['group_name', 'joined_epoch'], name='membership_group_joined'), models.Index(fields=['group_name', 'left_epoch'], name='membership_group_left'), models.Index(fields=['group_name', 'member'], name='membership_group_member')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0003_membership_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentimentResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_key', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=64)),
+                ('sentiment', models.CharField(max_length=16)),
+                ('confidence', models.FloatField(default=0.5)),
+                ('emotion', models.CharField(default='neutral', max_length=32)),
+                ('polarity', models.FloatField(default=0.0)),
+                ('indicators', models.JSONField(blank=True, default=list)),
+                ('reason', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('message_key', 'model_version'), name='sentimentresult_key_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0005_analysis_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentimentRollupCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(db_index=True, max_length=255)),
+                ('start_day', models.DateField()),
+                ('end_day', models.DateField()),
+                ('source_signature', models.CharField(max_length=40)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['group_name', 'start_day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SentimentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=255)),
+                ('day', models.DateField()),
+                ('sender', models.CharField(max_length=255)),
+                ('sentiment', models.CharField(max_length=16)),
+                ('emotion', models.CharField(max_length=32)),
+                ('count', models.IntegerField(default=0)),
+                ('polarity_sum', models.FloatField(default=0.0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group_name', 'day'], name='sentimentrollup_group_day')],
+                'constraints': [models.UniqueConstraint(fields=('group_name', 'day', 'sender', 'sentiment', 'emotion'), name='sentimentrollup_key')],
+            },
+        ),
+    ]
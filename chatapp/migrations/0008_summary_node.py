@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0007_llm_response_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=8)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('summary', models.TextField()),
+                ('message_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('level', 'period_start', 'content_hash'), name='summarynode_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0008_summary_node'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BucketSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=255)),
+                ('kind', models.CharField(max_length=16)),
+                ('bucket_key', models.CharField(max_length=10)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('summary', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group_name', 'kind', 'bucket_key'), name='bucketsummary_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0009_bucket_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMInFlight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
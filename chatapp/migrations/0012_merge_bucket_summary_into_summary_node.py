@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0011_analysis_job_lease'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='BucketSummary',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0012_merge_bucket_summary_into_summary_node'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='summarynode',
+            name='summarynode_key',
+        ),
+        migrations.AddField(
+            model_name='summarynode',
+            name='group_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='summarynode',
+            constraint=models.UniqueConstraint(fields=('group_name', 'level', 'period_start', 'content_hash'), name='summarynode_group_key'),
+        ),
+    ]
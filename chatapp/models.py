@@ -8,3 +8,238 @@ class ChatFile(models.Model):
     
     def __str__(self):
         return self.group_name
+
+
+class GroupEvent(models.Model):
+    """Normalized group event row, persisted per group and ordered by epoch"""
+    group_name = models.CharField(max_length=255)
+    epoch = models.BigIntegerField()
+    day = models.DateField()
+    event_type = models.CharField(max_length=32)
+    actor = models.CharField(max_length=255, null=True, blank=True)
+    target = models.CharField(max_length=512, null=True, blank=True)
+    timestamp = models.CharField(max_length=64)
+    details = models.TextField(blank=True)
+    raw_message = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['epoch', 'id']
+        indexes = [
+            models.Index(fields=['group_name', 'epoch'], name='groupevent_group_epoch'),
+            models.Index(fields=['group_name', 'event_type', 'epoch'], name='groupevent_group_type_epoch'),
+            models.Index(fields=['group_name', 'actor'], name='groupevent_group_actor'),
+            models.Index(fields=['group_name', 'target'], name='groupevent_group_target'),
+        ]
+
+    def __str__(self):
+        return f"{self.group_name}: {self.event_type} @ {self.timestamp}"
+
+
+class GroupEventIndex(models.Model):
+    """Tracks which uploaded files the persisted event rows were built from"""
+    group_name = models.CharField(max_length=255, unique=True)
+    source_signature = models.CharField(max_length=64)
+    event_count = models.IntegerField(default=0)
+    membership_stats = models.JSONField(default=dict, blank=True)
+    built_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.group_name} ({self.event_count} events)"
+
+
+class MembershipInterval(models.Model):
+    """One continuous stay of a member in a group; open-ended while still a member"""
+    group_name = models.CharField(max_length=255)
+    member = models.CharField(max_length=255)
+    joined_epoch = models.BigIntegerField()
+    left_epoch = models.BigIntegerField(null=True, blank=True)
+    # False when the member was already present at the start of the export
+    join_observed = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['joined_epoch', 'id']
+        indexes = [
+            models.Index(fields=['group_name', 'joined_epoch'], name='membership_group_joined'),
+            models.Index(fields=['group_name', 'left_epoch'], name='membership_group_left'),
+            models.Index(fields=['group_name', 'member'], name='membership_group_member'),
+        ]
+
+    def __str__(self):
+        return f"{self.group_name}: {self.member}"
+
+
+class MembershipChange(models.Model):
+    """Sorted membership change log with the running member count after each change"""
+    group_name = models.CharField(max_length=255)
+    epoch = models.BigIntegerField()
+    member = models.CharField(max_length=255)
+    delta = models.SmallIntegerField()
+    member_count = models.IntegerField()
+
+    class Meta:
+        ordering = ['epoch', 'id']
+        indexes = [
+            models.Index(fields=['group_name', 'epoch'], name='membershipchange_group_epoch'),
+        ]
+
+    def __str__(self):
+        return f"{self.group_name}: {self.member} {self.delta:+d}"
+
+
+class SentimentResult(models.Model):
+    """Per-message sentiment label, keyed by message hash and model/prompt version"""
+    message_key = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=64)
+    sentiment = models.CharField(max_length=16)
+    confidence = models.FloatField(default=0.5)
+    emotion = models.CharField(max_length=32, default='neutral')
+    polarity = models.FloatField(default=0.0)
+    indicators = models.JSONField(default=list, blank=True)
+    reason = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['message_key', 'model_version'], name='sentimentresult_key_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.message_key[:12]} {self.sentiment}"
+
+
+class SentimentRollup(models.Model):
+    """Labelled message counts per group, day, sender, sentiment and emotion"""
+    group_name = models.CharField(max_length=255)
+    day = models.DateField()
+    sender = models.CharField(max_length=255)
+    sentiment = models.CharField(max_length=16)
+    emotion = models.CharField(max_length=32)
+    count = models.IntegerField(default=0)
+    polarity_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group_name', 'day', 'sender', 'sentiment', 'emotion'], name='sentimentrollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['group_name', 'day'], name='sentimentrollup_group_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.group_name} {self.day} {self.sender} {self.sentiment} x{self.count}"
+
+
+class SentimentRollupCoverage(models.Model):
+    """Day range of a group whose rollups are complete for the given source files"""
+    group_name = models.CharField(max_length=255, db_index=True)
+    start_day = models.DateField()
+    end_day = models.DateField()
+    source_signature = models.CharField(max_length=40)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['group_name', 'start_day']
+
+    def __str__(self):
+        return f"{self.group_name} {self.start_day}..{self.end_day}"
+
+
+class LLMResponse(models.Model):
+    """Cached model response, keyed by a hash of model, prompt and generation parameters"""
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=128)
+    response = models.TextField()
+    size_bytes = models.IntegerField(default=0)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model_name} {self.key[:12]}"
+
+
+class LLMInFlight(models.Model):
+    """Marks an LLM call in progress so other workers wait for its cached response"""
+    key = models.CharField(max_length=64, unique=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} since {self.started_at}"
+
+
+class SummaryNode(models.Model):
+    """
+    Cached summary of one day, week or month of a group's chat, keyed by the
+    group and a hash of its content ('' for callers without a group)
+    """
+    LEVEL_DAY = 'day'
+    LEVEL_WEEK = 'week'
+    LEVEL_MONTH = 'month'
+    LEVEL_CHOICES = [
+        (LEVEL_DAY, 'Day'),
+        (LEVEL_WEEK, 'Week'),
+        (LEVEL_MONTH, 'Month'),
+    ]
+
+    group_name = models.CharField(max_length=255, blank=True, default='')
+    level = models.CharField(max_length=8, choices=LEVEL_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    content_hash = models.CharField(max_length=64)
+    summary = models.TextField()
+    message_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group_name', 'level', 'period_start', 'content_hash'], name='summarynode_group_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.group_name}: {self.level} {self.period_start} {self.content_hash[:12]}"
+
+
+class AnalysisJob(models.Model):
+    """Long-running analysis executed in the background job pool"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+
+    id = models.CharField(max_length=32, primary_key=True)
+    kind = models.CharField(max_length=64)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Worker process running the job, and its last sign of life
+    owner = models.CharField(max_length=64, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='analysisjob_status_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
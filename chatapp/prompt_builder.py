@@ -0,0 +1,178 @@
+"""
+Token-budgeted chat context for LLM prompts.
+
+Messages are rendered as compact prompt lines: media/deleted placeholders and
+system notices are dropped, system lines glued into message bodies are
+stripped, repeated texts (forwards, copy-pasted notices) are kept once with a
+repeat count, consecutive messages from the same sender share one name, and
+a date header starts each day. When the result is over budget, the least
+important lines are dropped, scoring recency, substance and overlap with the
+question, and the final text is re-counted until it fits the budget exactly.
+"""
+import logging
+import math
+import re
+
+from .event_classifier import is_system_message
+from .message_dedup import is_placeholder, normalize_text
+from .token_utils import count_tokens, tokenizer_name
+from .utils import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+_EDITED_SUFFIX_RE = re.compile(r'\s*<This message was edited>\s*$', re.IGNORECASE)
+_MEDIA_MARKER_RE = re.compile(r'<Media omitted>\s*', re.IGNORECASE)
+
+# "1/5/25, 8:04 PM - Your security code with Ravi changed." glued into a body by the parser
+_EMBEDDED_NOTICE_RE = re.compile(
+    r'^\[?\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4},?\ \d{1,2}:\d{2}(?::\d{2})?'
+    '(?:[ \u202f\u00a0]?[AaPp]\\.?[Mm]\\.?)?\\]?\\ -\\ [^:]*$'
+)
+_URL_RE = re.compile(r'https?://\S+')
+_WORD_RE = re.compile(r'\w{4,}')
+_ATTACHMENT_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xlsx', '.jpg', '.jpeg', '.png', '.mp4')
+_DOCUMENT_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xlsx')
+
+# Long forwards are cut to this many characters
+MAX_LINE_CHARS = 600
+
+
+def _clean_body(text):
+    lines = [line for line in (text or '').split('\n') if not _EMBEDDED_NOTICE_RE.match(line.strip())]
+    text = _EDITED_SUFFIX_RE.sub('', ' '.join(line.strip() for line in lines if line.strip()))
+    text = _MEDIA_MARKER_RE.sub('', text).strip()
+    if len(text) > MAX_LINE_CHARS:
+        text = text[:MAX_LINE_CHARS].rstrip() + '…'
+    return text
+
+
+def _is_noise(msg, normalized):
+    if is_system_message(msg):
+        return True
+    # Shared documents are kept by name; other media and deletions are dropped
+    return is_placeholder(msg['message'], normalized) and not any(ext in normalized for ext in _DOCUMENT_EXTENSIONS)
+
+
+def compress_messages(messages):
+    """
+    Prompt items for messages with noise removed, in message order.
+    Each item is a dict with day, sender, text, repeats and position.
+    """
+    items = []
+    first_seen = {}
+    dropped = 0
+    for position, msg in enumerate(messages):
+        key = normalize_text(msg['message'])
+        if _is_noise(msg, key):
+            dropped += 1
+            continue
+        if key in first_seen:
+            items[first_seen[key]]['repeats'] += 1
+            continue
+        text = _clean_body(msg['message'])
+        if not text:
+            dropped += 1
+            continue
+        timestamp = parse_timestamp(msg['timestamp'])
+        first_seen[key] = len(items)
+        items.append({
+            'day': timestamp.strftime('%Y-%m-%d') if timestamp else None,
+            'sender': msg['sender'],
+            'text': text,
+            'repeats': 1,
+            'position': position,
+        })
+    return items, dropped
+
+
+def render_items(items, include_dates=True):
+    lines = []
+    day = sender = None
+    for item in items:
+        if include_dates and item['day'] and item['day'] != day:
+            day = item['day']
+            sender = None
+            lines.append(f"[{day}]")
+        text = item['text'] if item['repeats'] == 1 else f"{item['text']} (shared {item['repeats']}x)"
+        # Consecutive messages from one sender are written under a single name
+        lines.append(f"  {text}" if item['sender'] == sender else f"{item['sender']}: {text}")
+        sender = item['sender']
+    return "\n".join(lines)
+
+
+def _scores(items, query):
+    query_words = set(_WORD_RE.findall(query.lower())) if query else set()
+    scores = []
+    for rank, item in enumerate(items):
+        text = item['text']
+        lower = text.lower()
+        score = rank / len(items)
+        # Substance saturates quickly so a few long forwards don't crowd out the conversation
+        score += min(len(text), 80) / 80
+        if '?' in text or _URL_RE.search(text) or any(ext in lower for ext in _ATTACHMENT_EXTENSIONS):
+            score += 0.5
+        if item['repeats'] > 1:
+            score += 0.25
+        if query_words:
+            score += 2 * len(query_words & set(_WORD_RE.findall(lower))) / len(query_words)
+        scores.append(score)
+    return scores
+
+
+def build_chat_context(messages, token_budget, query=None, include_dates=True):
+    """
+    (text, stats) for messages compressed into at most token_budget tokens.
+    query, when given, ranks messages that share its words above others when
+    something has to be dropped. stats reports token counts before and after
+    compression and after truncation.
+    """
+    raw_tokens = count_tokens("\n".join(f"{msg['sender']}: {msg['message']}" for msg in messages))
+    items, dropped = compress_messages(messages)
+    text = render_items(items, include_dates)
+    compressed_tokens = count_tokens(text)
+
+    kept = items
+    if compressed_tokens > token_budget:
+        costs = [count_tokens(f"{item['sender']}: {item['text']}") + 1 for item in items]
+        # Value per token, dampened so short acks don't beat substantive messages
+        scores = [score / math.sqrt(cost) for score, cost in zip(_scores(items, query), costs)]
+        # Pick by per-line cost first, then trim until the rendered text fits
+        chosen = set()
+        used = 0
+        for i in sorted(range(len(items)), key=lambda i: scores[i], reverse=True):
+            if used + costs[i] <= token_budget:
+                chosen.add(i)
+                used += costs[i]
+        kept_order = sorted(chosen)
+        text = render_items([items[i] for i in kept_order], include_dates)
+        overflow = count_tokens(text) - token_budget
+        while kept_order and overflow > 0:
+            # Drop the lowest scoring lines until their cost covers the overflow
+            drop = set()
+            for i in sorted(kept_order, key=lambda i: scores[i]):
+                drop.add(i)
+                overflow -= costs[i]
+                if overflow <= 0:
+                    break
+            kept_order = [i for i in kept_order if i not in drop]
+            text = render_items([items[i] for i in kept_order], include_dates)
+            overflow = count_tokens(text) - token_budget
+        kept = [items[i] for i in kept_order]
+
+    stats = {
+        'messages': len(messages),
+        'lines_kept': len(kept),
+        'noise_dropped': dropped,
+        'duplicates_collapsed': sum(item['repeats'] - 1 for item in items),
+        'tokens_raw': raw_tokens,
+        'tokens_compressed': compressed_tokens,
+        'tokens_final': count_tokens(text),
+        'token_budget': token_budget,
+        'truncated': len(kept) < len(items),
+        'tokenizer': tokenizer_name(),
+    }
+    logger.info(
+        f"Prompt context: {stats['tokens_raw']} -> {stats['tokens_compressed']} -> {stats['tokens_final']} tokens "
+        f"({stats['lines_kept']}/{len(items)} lines, {dropped} noise, {stats['duplicates_collapsed']} duplicates)"
+    )
+    return text, stats
@@ -1,9 +1,29 @@
 import google.generativeai as genai
 from django.conf import settings
 import json
+import math
 import re
-from .config import SENTIMENT_THRESHOLD
+from .config import (
+    SENTIMENT_THRESHOLD,
+    LLM_CONCURRENCY,
+    SENTIMENT_BATCH_TOKEN_BUDGET,
+    SENTIMENT_BATCH_MAX_ITEMS,
+    SENTIMENT_ENGINE,
+    LOCAL_SENTIMENT_CONFIDENCE_THRESHOLD,
+    SENTIMENT_MAX_ESCALATION_RATIO,
+    SENTIMENT_STREAM_NEGATIVE_SAMPLES,
+    SENTIMENT_ESTIMATE_MARGIN_OF_ERROR,
+    SENTIMENT_ESTIMATE_CONFIDENCE_LEVEL,
+)
 from .utils import parse_timestamp
+from .sentiment_cache import message_key, load_cached_results, store_results
+from .llm_dispatch import iter_dispatch, call_with_retry
+from .llm_gateway import generate as llm_generate, DeadlineExceeded
+from .token_utils import count_tokens, plan_batches
+from .local_sentiment import classify_messages as classify_local, select_escalations
+from .message_dedup import is_placeholder, placeholder_result, group_duplicates
+from .sentiment_estimate import required_sample_size, select_sample, estimate_distributions
+import threading
 import logging
 from typing import Dict, List, Any
 import time
@@ -18,23 +38,37 @@ genai.configure(api_key=settings.GEMINI_API_KEY)
 # Initialize the model with correct name
 try:
     model = genai.GenerativeModel('gemini-2.0-flash')
+    MODEL_ID = 'gemini-2.0-flash'
     print("✅ Successfully initialized gemini-2.0-flash model")
 except Exception as e:
     logger.error(f"❌ Could not initialize gemini-2.0-flash: {e}")
     try:
         model = genai.GenerativeModel('gemini-flash-latest')
+        MODEL_ID = 'gemini-flash-latest'
         print("✅ Fallback: Successfully initialized gemini-flash-latest model")
     except Exception as e2:
         logger.error(f"❌ Could not initialize any Gemini model: {e2}")
         model = None
+        MODEL_ID = 'none'
 
-def batch_analyze_sentiment_with_gemini(messages_batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+# Bump when the batch prompt or result schema changes so cached labels are not reused
+SENTIMENT_PROMPT_VERSION = 'v1'
+SENTIMENT_MODEL_VERSION = f"{MODEL_ID}:{SENTIMENT_PROMPT_VERSION}"
+
+SENTIMENT_ENGINES = ('llm', 'tiered', 'local')
+
+def sentiment_engine(engine=None):
+    """Validate a request's engine; None leaves the configured default, unknown engines raise ValueError"""
+    if engine in (None, ''):
+        return None
+    if engine not in SENTIMENT_ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    return engine
+
+def build_sentiment_prompt(messages_batch: List[Dict[str, Any]]) -> str:
     """
-    Analyze sentiment for a batch of messages using Gemini AI
+    Build the batch sentiment prompt for Gemini
     """
-    if not messages_batch:
-        return []
-    
     # Prepare messages for analysis
     messages_text = []
     for i, msg in enumerate(messages_batch):
@@ -76,68 +110,301 @@ Respond in this exact JSON format:
 }}
 
 Ensure valid JSON with all {len(messages_batch)} messages analyzed."""
-    
+    return prompt
+
+def _request_sentiment_batch(messages_batch: List[Dict[str, Any]], deadline=None) -> List[Dict[str, Any]]:
+    """
+    Send one batch to Gemini and parse the results; raises on API or JSON
+    errors, and with DeadlineExceeded once deadline has passed
+    """
+    if model is None:
+        logger.error("Gemini model not initialized")
+        raise Exception("Gemini model not available")
+
+    analysis_results = llm_generate(
+        build_sentiment_prompt(messages_batch), model=model, parse=_parse_json_response, deadline=deadline,
+    )
+    return analysis_results.get('results', [])
+
+def _parse_json_response(response_text):
+    """JSON body of a model response, without Markdown code fences"""
+    response_text = response_text.strip()
+
+    # Clean up the response to ensure it's valid JSON
+    if response_text.startswith('```json'):
+        response_text = response_text[7:-3].strip()
+    elif response_text.startswith('```'):
+        response_text = response_text[3:-3].strip()
+
     try:
-        # Check if model is available
-        if model is None:
-            logger.error("Gemini model not initialized")
-            raise Exception("Gemini model not available")
-            
-        # Generate response using Gemini
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Clean up the response to ensure it's valid JSON
-        if response_text.startswith('```json'):  
-            response_text = response_text[7:-3].strip()
-        elif response_text.startswith('```'):
-            response_text = response_text[3:-3].strip()
-        
-        # Parse the JSON response
-        try:
-            analysis_results = json.loads(response_text)
-            return analysis_results.get('results', [])
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {e}. Response: {response_text[:500]}")
-            # Return fallback results
-            return [{
-                "message_index": i+1,
-                "sentiment": "neutral",
-                "confidence": 0.5,
-                "emotion": "neutral",
-                "emotional_indicators": [],
-                "reason": "Analysis failed, defaulting to neutral",
-                "polarity_score": 0.0
-            } for i in range(len(messages_batch))]
-            
+        return json.loads(response_text)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error: {e}. Response: {response_text[:500]}")
+        raise
+
+def _fallback_sentiment_results(messages_batch: List[Dict[str, Any]], error: Exception) -> List[Dict[str, Any]]:
+    """
+    Local results for a batch Gemini could not analyse
+    """
+    if isinstance(error, json.JSONDecodeError):
+        return [{
+            "message_index": i+1,
+            "sentiment": "neutral",
+            "confidence": 0.5,
+            "emotion": "neutral",
+            "emotional_indicators": [],
+            "reason": "Analysis failed, defaulting to neutral",
+            "polarity_score": 0.0,
+            "source": "fallback"
+        } for i in range(len(messages_batch))]
+
+    logger.error(f"Gemini API error: {error}")
+
+    # Enhanced fallback with basic sentiment analysis
+    print(f"\u26a0\ufe0f Gemini API unavailable (quota exceeded), using enhanced fallback analysis...")
+
+    fallback_results = []
+    for i, msg in enumerate(messages_batch):
+        sentiment, confidence, emotion, polarity = analyze_with_fallback(msg['message'])
+
+        fallback_results.append({
+            "message_index": i+1,
+            "sentiment": sentiment,
+            "confidence": confidence,
+            "emotion": emotion,
+            "emotional_indicators": get_emotional_indicators(msg['message'], sentiment),
+            "reason": f"Fallback analysis: {sentiment} sentiment detected",
+            "polarity_score": polarity,
+            "source": "fallback"
+        })
+
+    return fallback_results
+
+class BatchMetrics:
+    """Thread-safe counters for LLM sentiment calls made while analysing one request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.complete_calls = 0
+        self.malformed_calls = 0
+        self.partial_calls = 0
+        self.splits = 0
+        self.prompt_tokens = 0
+
+    def record(self, prompt_tokens, outcome):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            if outcome == 'complete':
+                self.complete_calls += 1
+            elif outcome == 'malformed':
+                self.malformed_calls += 1
+            else:
+                self.partial_calls += 1
+
+    def record_split(self):
+        with self._lock:
+            self.splits += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'llm_calls': self.calls,
+                'complete_calls': self.complete_calls,
+                'malformed_calls': self.malformed_calls,
+                'partial_calls': self.partial_calls,
+                'splits': self.splits,
+                'success_ratio': round(self.complete_calls / self.calls, 3) if self.calls else None,
+                'avg_prompt_tokens_per_call': round(self.prompt_tokens / self.calls, 1) if self.calls else 0,
+                'total_prompt_tokens': self.prompt_tokens,
+            }
+
+def _index_results(raw_results, batch_len: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Map model results to batch positions by message_index; fall back to
+    position when the model left the index out but returned every message
+    """
+    if not isinstance(raw_results, list):
+        return {}
+    by_index = {}
+    for position, result in enumerate(raw_results):
+        if not isinstance(result, dict):
+            continue
+        index = result.get('message_index')
+        if isinstance(index, int) and 1 <= index <= batch_len:
+            by_index.setdefault(index - 1, result)
+        elif index is None and len(raw_results) == batch_len:
+            by_index.setdefault(position, result)
+    return by_index
+
+def _analyze_batch_adaptive(messages_batch: List[Dict[str, Any]], metrics: BatchMetrics,
+                            deadline=None) -> List[Dict[str, Any]]:
+    """
+    Analyze one planned batch. A malformed response splits the batch in half
+    and retries each half; a partial response re-requests only the missing
+    messages. Single messages that still fail get the local fallback.
+    """
+    prompt_tokens = count_tokens(build_sentiment_prompt(messages_batch))
+    try:
+        raw_results = call_with_retry(
+            lambda batch: _request_sentiment_batch(batch, deadline), messages_batch, deadline=deadline,
+        )
+        by_index = _index_results(raw_results, len(messages_batch))
+        outcome = 'complete' if len(by_index) == len(messages_batch) else 'partial'
+    except json.JSONDecodeError:
+        by_index = {}
+        outcome = 'malformed'
+    metrics.record(prompt_tokens, outcome)
+
+    if outcome == 'complete':
+        return [by_index[i] for i in range(len(messages_batch))]
+
+    missing = [i for i in range(len(messages_batch)) if i not in by_index]
+    if len(messages_batch) == 1:
+        return _fallback_sentiment_results(messages_batch, ValueError("Incomplete model response"))
+
+    if by_index:
+        retry_groups = [missing]
+    else:
+        half = len(messages_batch) // 2
+        retry_groups = [missing[:half], missing[half:]]
+        metrics.record_split()
+
+    for group in retry_groups:
+        for i, result in zip(group, _analyze_batch_adaptive([messages_batch[i] for i in group], metrics, deadline)):
+            by_index[i] = result
+    return [by_index[i] for i in range(len(messages_batch))]
+
+def batch_analyze_sentiment_with_gemini(messages_batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Analyze sentiment for a batch of messages using Gemini AI
+    """
+    if not messages_batch:
+        return []
+    try:
+        return _request_sentiment_batch(messages_batch)
     except Exception as e:
-        logger.error(f"Gemini API error: {e}")
-        
-        # Enhanced fallback with basic sentiment analysis
-        print(f"\u26a0\ufe0f Gemini API unavailable (quota exceeded), using enhanced fallback analysis...")
-        
-        fallback_results = []
-        for i, msg in enumerate(messages_batch):
-            sentiment, confidence, emotion, polarity = analyze_with_fallback(msg['message'])
-            
-            fallback_results.append({
-                "message_index": i+1,
-                "sentiment": sentiment,
-                "confidence": confidence,
-                "emotion": emotion,
-                "emotional_indicators": get_emotional_indicators(msg['message'], sentiment),
-                "reason": f"Fallback analysis: {sentiment} sentiment detected",
-                "polarity_score": polarity
-            })
-        
-        return fallback_results
+        return _fallback_sentiment_results(messages_batch, e)
 
-def analyze_sentiment(messages):
-    if not messages:
-        return {"error": "No messages found"}
+def _accumulate_result(sentiment_data, msg, result):
+    """Fold one message's sentiment result into the aggregate response"""
+    timestamp = parse_timestamp(msg['timestamp'])
+    date_str = timestamp.strftime('%Y-%m-%d') if timestamp else 'unknown'
     
-    print(f"Starting Enhanced Gemini sentiment analysis for {len(messages)} messages")
+    # Initialize daily sentiment if needed
+    if date_str not in sentiment_data['daily_sentiment']:
+        sentiment_data['daily_sentiment'][date_str] = {'positive': 0, 'neutral': 0, 'negative': 0}
+    
+    # Extract sentiment information from Gemini results
+    sentiment = result.get('sentiment', 'neutral').lower()
+    confidence = result.get('confidence', 0.5)
+    emotion = result.get('emotion', 'neutral')
+    polarity_score = result.get('polarity_score', 0.0)
+    emotional_indicators = result.get('emotional_indicators', [])
+    reason = result.get('reason', '')
+    
+    # Handle fallback cases
+    if sentiment not in ['positive', 'neutral', 'negative']:
+        sentiment = 'neutral'
+        sentiment_data['analysis_metadata']['fallback_count'] += 1
+    
+    # Update sentiment counts
+    sentiment_data['overall_sentiment'][sentiment] += 1
+    sentiment_data['sentiment_breakdown'][sentiment] += 1
+    sentiment_data['daily_sentiment'][date_str][sentiment] += 1
+    
+    # Update emotion analysis
+    sentiment_data['emotion_analysis'][emotion] += 1
+    
+    # Update confidence distribution
+    if confidence >= 0.8:
+        sentiment_data['confidence_distribution']['high'] += 1
+    elif confidence >= 0.6:
+        sentiment_data['confidence_distribution']['medium'] += 1
+    else:
+        sentiment_data['confidence_distribution']['low'] += 1
+    
+    # Update user sentiment
+    user = msg['sender']
+    if user not in sentiment_data['user_sentiment']:
+        sentiment_data['user_sentiment'][user] = {'positive': 0, 'neutral': 0, 'negative': 0}
+    if user not in sentiment_data['user_sentiments']:
+        sentiment_data['user_sentiments'][user] = {'positive': 0, 'neutral': 0, 'negative': 0}
     
+    sentiment_data['user_sentiment'][user][sentiment] += 1
+    sentiment_data['user_sentiments'][user][sentiment] += 1
+    
+    # Store sentiment scores
+    sentiment_data['sentiment_scores'].append({
+        'timestamp': msg['timestamp'],
+        'sender': user,
+        'polarity': polarity_score,
+        'confidence': confidence,
+        'emotion': emotion
+    })
+    
+    # Store complete message info with sentiment
+    message_with_sentiment = {
+        'timestamp': msg['timestamp'],
+        'sender': user,
+        'message': msg['message'],
+        'sentiment': sentiment,
+        'polarity': polarity_score,
+        'confidence': confidence,
+        'emotion': emotion,
+        'emotional_indicators': emotional_indicators,
+        'reason': reason,
+        'date': date_str
+    }
+    if 'source_position' in msg:
+        # Where a sampled message sits in the full range (estimate mode)
+        message_with_sentiment['source_position'] = msg['source_position']
+    sentiment_data['all_messages_with_sentiment'].append(message_with_sentiment)
+    
+    # Store negative messages for drill-down
+    if sentiment == 'negative':
+        negative_message_detail = {
+            'timestamp': msg['timestamp'],
+            'sender': user,
+            'message': msg['message'],
+            'polarity': polarity_score,
+            'confidence': confidence,
+            'emotion': emotion,
+            'reason': reason,
+            'emotional_indicators': emotional_indicators,
+            'date': date_str
+        }
+        sentiment_data['negative_messages'].append(negative_message_detail)
+    
+    # Add to sentiment trend
+    if timestamp:
+        sentiment_data['sentiment_trend'].append({
+            'date': date_str,
+            'sentiment': sentiment,
+            'polarity': polarity_score,
+            'confidence': confidence,
+            'emotion': emotion
+        })
+    
+    # Extract emotional keywords
+    for indicator in emotional_indicators:
+        keyword_entry = {
+            'keyword': indicator,
+            'message': msg['message'][:100] + '...' if len(msg['message']) > 100 else msg['message'],
+            'sender': user,
+            'timestamp': msg['timestamp'],
+            'polarity': polarity_score,
+            'confidence': confidence
+        }
+        
+        if sentiment == 'positive':
+            sentiment_data['emotional_keywords']['positive'].append(keyword_entry)
+        elif sentiment == 'negative':
+            sentiment_data['emotional_keywords']['negative'].append(keyword_entry)
+
+def _new_sentiment_data(total_messages):
+    """Empty aggregate response for total_messages messages"""
     sentiment_data = {
         'overall_sentiment': {'positive': 0, 'neutral': 0, 'negative': 0},
         'sentiment_breakdown': {'positive': 0, 'neutral': 0, 'negative': 0},
@@ -159,155 +426,298 @@ def analyze_sentiment(messages):
             'recommendations': []
         },
         'analysis_metadata': {  # New: Analysis details
-            'total_processed': len(messages),
+            'total_processed': total_messages,
             'processing_time': None,
             'api_calls_made': 0,
-            'fallback_count': 0
+            'fallback_count': 0,
+            'failed_batches': 0
         }
     }
+    return sentiment_data
+
+def analyze_sentiment(messages, engine=None, max_escalation_ratio=None, confidence_threshold=None, progress=None,
+                      mode=None, margin_of_error=None, confidence_level=None, deadline=None):
+    """
+    Label every message and aggregate. engine is "tiered" (local first tier,
+    LLM only for uncertain messages), "llm" or "local"; defaults come from config.
+    progress(done, total, message) is called after each LLM batch. deadline
+    is a time.monotonic() value; batches unfinished by then get the local
+    fallback labels.
+
+    mode="estimate" labels only a stratified sample sized for margin_of_error
+    at confidence_level and extrapolates the distributions with intervals.
+    """
+    if not messages:
+        return {"error": "No messages found"}
     
-    import time
-    start_time = time.time()
+    mode = mode or 'full'
+    if mode == 'estimate':
+        return _estimate_sentiment(
+            messages, engine, max_escalation_ratio, confidence_threshold, progress, margin_of_error, confidence_level,
+            deadline,
+        )
+    if mode != 'full':
+        raise ValueError(f"Unknown sentiment mode: {mode}")
     
-    # Process messages in batches of 8 for optimal API usage
-    batch_size = 8
-    total_batches = (len(messages) + batch_size - 1) // batch_size
+    for event, payload in _iter_sentiment(
+        messages, engine, max_escalation_ratio, confidence_threshold, progress, deadline=deadline,
+    ):
+        if event == 'complete':
+            return payload
+
+def _estimate_sentiment(messages, engine, max_escalation_ratio, confidence_threshold, progress,
+                        margin_of_error=None, confidence_level=None, deadline=None):
+    """Analyse a stratified sample and extrapolate to the whole range"""
+    margin_of_error = float(margin_of_error or SENTIMENT_ESTIMATE_MARGIN_OF_ERROR)
+    confidence_level = float(confidence_level or SENTIMENT_ESTIMATE_CONFIDENCE_LEVEL)
+    if not 0 < margin_of_error < 1 or not 0 < confidence_level < 1:
+        raise ValueError("margin_of_error and confidence_level must be between 0 and 1")
     
-    for i in range(0, len(messages), batch_size):
-        batch = messages[i:i+batch_size]
-        batch_num = i//batch_size + 1
-        print(f"Processing batch {batch_num}/{total_batches} ({len(batch)} messages)")
-        
-        # Analyze batch with Gemini
-        batch_results = batch_analyze_sentiment_with_gemini(batch)
-        sentiment_data['analysis_metadata']['api_calls_made'] += 1
-        
-        # Process results
+    sample_size = required_sample_size(len(messages), margin_of_error, confidence_level)
+    positions = select_sample(messages, sample_size)
+    print(f"Estimating sentiment for {len(messages)} messages from a sample of {len(positions)}")
+    
+    # Each sampled message carries its position, so labels are joined on it
+    # rather than on list order, which a dropped result would shift
+    sentiment_data = analyze_sentiment(
+        [dict(messages[p], source_position=p) for p in positions], engine, max_escalation_ratio,
+        confidence_threshold, progress, deadline=deadline,
+    )
+    labels = {
+        msg['source_position']: msg['sentiment'] for msg in sentiment_data['all_messages_with_sentiment']
+    }
+    estimate = estimate_distributions(messages, positions, labels, confidence_level)
+    
+    def point_counts(group):
+        return {s: group[s]['count'] for s in ('positive', 'neutral', 'negative')}
+    
+    # Aggregates are replaced by extrapolated counts; per-message lists and
+    # emotion/confidence distributions describe the labelled sample
+    overall = point_counts(estimate['overall'])
+    sentiment_data['overall_sentiment'] = overall
+    sentiment_data['sentiment_breakdown'] = dict(overall)
+    sentiment_data['sentiment_percentages'] = {
+        s: round(estimate['overall'][s]['proportion'] * 100, 1) for s in ('positive', 'neutral', 'negative')
+    }
+    sentiment_data['daily_sentiment'] = {
+        day: point_counts(group) for day, group in estimate['daily'].items() if group['sampled']
+    }
+    sentiment_data['user_sentiment'] = {
+        user: point_counts(group) for user, group in estimate['users'].items() if group['sampled']
+    }
+    sentiment_data['user_sentiments'] = sentiment_data['user_sentiment']
+    sentiment_data['total_analyzed'] = len(messages)
+    sentiment_data['estimate'] = {
+        'population': len(messages),
+        'sample_size': len(labels),
+        'margin_of_error': margin_of_error,
+        'confidence_level': confidence_level,
+        **estimate,
+    }
+    metadata = sentiment_data['analysis_metadata']
+    metadata['mode'] = 'estimate'
+    metadata['total_processed'] = len(labels)
+    return sentiment_data
+
+def stream_sentiment(messages, engine=None, max_escalation_ratio=None, confidence_threshold=None, deadline=None):
+    """
+    Generator of (event, payload) pairs for incremental rendering.
+
+    'start' describes the work, 'update' follows the labels resolved without
+    the LLM and then each finished batch with the running breakdown, the
+    daily_sentiment entries that changed and new negative-message samples,
+    and 'complete' carries the same result analyze_sentiment returns.
+    """
+    return _iter_sentiment(
+        messages, engine, max_escalation_ratio, confidence_threshold, incremental=True, deadline=deadline,
+    )
+
+def _iter_sentiment(messages, engine=None, max_escalation_ratio=None, confidence_threshold=None, progress=None,
+                    incremental=False, deadline=None):
+    print(f"Starting Enhanced Gemini sentiment analysis for {len(messages)} messages")
+    
+    sentiment_data = _new_sentiment_data(len(messages))
+    
+    start_time = time.time()
+    
+    # System and media placeholders are neutral by definition
+    results = [placeholder_result() if is_placeholder(msg.get('message')) else None for msg in messages]
+    placeholders = sum(1 for result in results if result is not None)
+
+    # Reuse stored labels; only messages never analysed with this model/prompt go to Gemini
+    keys = [message_key(msg) for msg in messages]
+    cached = load_cached_results([keys[i] for i, result in enumerate(results) if result is None], SENTIMENT_MODEL_VERSION)
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = cached.get(keys[i])
+    pending = [i for i, result in enumerate(results) if result is None]
+    uncached = len(pending)
+
+    # Each distinct text is analysed once and copied to its duplicates
+    pending, copies = group_duplicates(messages, pending)
+    distinct = len(pending)
+
+    # Local first tier: keep confident labels, escalate the least confident
+    engine = sentiment_engine(engine) or sentiment_engine(SENTIMENT_ENGINE)
+    if confidence_threshold is None:
+        confidence_threshold = LOCAL_SENTIMENT_CONFIDENCE_THRESHOLD
+    if max_escalation_ratio is None:
+        max_escalation_ratio = SENTIMENT_MAX_ESCALATION_RATIO
+    if engine == 'tiered' and model is None:
+        engine = 'local'
+    tiering = {
+        'engine': engine,
+        'local_classified': 0,
+        'escalated': len(pending) if engine == 'llm' else 0,
+        'escalation_candidates': 0,
+        'confidence_threshold': confidence_threshold,
+        'max_escalation_ratio': max_escalation_ratio,
+    }
+    if engine in ('tiered', 'local') and pending:
+        local_results = classify_local([messages[k] for k in pending])
+        if engine == 'tiered':
+            escalated, tiering['escalation_candidates'] = select_escalations(
+                local_results, confidence_threshold, max_escalation_ratio,
+            )
+        else:
+            escalated = []
+        escalated_positions = set(escalated)
+        for position, k in enumerate(pending):
+            if position not in escalated_positions:
+                results[k] = local_results[position]
+        tiering['local_classified'] = len(pending) - len(escalated)
+        tiering['escalated'] = len(escalated)
+        pending = [pending[position] for position in escalated]
+    tiering['escalation_ratio'] = round(tiering['escalated'] / distinct, 3) if distinct else 0.0
+
+    def fan_out(representative):
+        duplicates = copies.get(representative, [])
+        for k in duplicates:
+            results[k] = results[representative]
+        return duplicates
+
+    pending_set = set(pending)
+    for representative in copies:
+        if representative not in pending_set:
+            fan_out(representative)
+
+    # Pack uncached messages into batches by token budget; batches run
+    # concurrently and the shared token bucket paces calls
+    metrics = BatchMetrics()
+    batches = [
+        [pending[p] for p in positions]
+        for positions in plan_batches(
+            [messages[k]['message'] for k in pending], SENTIMENT_BATCH_TOKEN_BUDGET, SENTIMENT_BATCH_MAX_ITEMS,
+        )
+    ]
+    print(f"Dispatching {len(batches)} batches with concurrency {LLM_CONCURRENCY}")
+
+    def request_batch(batch_indices):
+        return _analyze_batch_adaptive([messages[k] for k in batch_indices], metrics, deadline)
+
+    def fallback_batch(batch_indices, error):
+        sentiment_data['analysis_metadata']['failed_batches'] += 1
+        return _fallback_sentiment_results([messages[k] for k in batch_indices], error)
+
+    def batch_done(batch_num, batch_results):
+        """Record a finished batch; returns every message index it labelled"""
+        batch_indices = batches[batch_num]
         for j, result in enumerate(batch_results):
-            if j >= len(batch):  # Safety check
+            if j >= len(batch_indices):  # Safety check
                 continue
-                
-            msg = batch[j]
-            timestamp = parse_timestamp(msg['timestamp'])
-            date_str = timestamp.strftime('%Y-%m-%d') if timestamp else 'unknown'
-            
-            # Initialize daily sentiment if needed
-            if date_str not in sentiment_data['daily_sentiment']:
-                sentiment_data['daily_sentiment'][date_str] = {'positive': 0, 'neutral': 0, 'negative': 0}
-            
-            # Extract sentiment information from Gemini results
-            sentiment = result.get('sentiment', 'neutral').lower()
-            confidence = result.get('confidence', 0.5)
-            emotion = result.get('emotion', 'neutral')
-            polarity_score = result.get('polarity_score', 0.0)
-            emotional_indicators = result.get('emotional_indicators', [])
-            reason = result.get('reason', '')
-            
-            # Handle fallback cases
-            if sentiment not in ['positive', 'neutral', 'negative']:
-                sentiment = 'neutral'
-                sentiment_data['analysis_metadata']['fallback_count'] += 1
-            
-            # Update sentiment counts
-            sentiment_data['overall_sentiment'][sentiment] += 1
-            sentiment_data['sentiment_breakdown'][sentiment] += 1
-            sentiment_data['daily_sentiment'][date_str][sentiment] += 1
-            
-            # Update emotion analysis
-            sentiment_data['emotion_analysis'][emotion] += 1
-            
-            # Update confidence distribution
-            if confidence >= 0.8:
-                sentiment_data['confidence_distribution']['high'] += 1
-            elif confidence >= 0.6:
-                sentiment_data['confidence_distribution']['medium'] += 1
-            else:
-                sentiment_data['confidence_distribution']['low'] += 1
-            
-            # Update user sentiment
-            user = msg['sender']
-            if user not in sentiment_data['user_sentiment']:
-                sentiment_data['user_sentiment'][user] = {'positive': 0, 'neutral': 0, 'negative': 0}
-            if user not in sentiment_data['user_sentiments']:
-                sentiment_data['user_sentiments'][user] = {'positive': 0, 'neutral': 0, 'negative': 0}
-            
-            sentiment_data['user_sentiment'][user][sentiment] += 1
-            sentiment_data['user_sentiments'][user][sentiment] += 1
-            
-            # Store sentiment scores
-            sentiment_data['sentiment_scores'].append({
-                'timestamp': msg['timestamp'],
-                'sender': user,
-                'polarity': polarity_score,
-                'confidence': confidence,
-                'emotion': emotion
-            })
-            
-            # Store complete message info with sentiment
-            message_with_sentiment = {
-                'timestamp': msg['timestamp'],
-                'sender': user,
-                'message': msg['message'],
-                'sentiment': sentiment,
-                'polarity': polarity_score,
-                'confidence': confidence,
-                'emotion': emotion,
-                'emotional_indicators': emotional_indicators,
-                'reason': reason,
-                'date': date_str
-            }
-            sentiment_data['all_messages_with_sentiment'].append(message_with_sentiment)
-            
-            # Store negative messages for drill-down
-            if sentiment == 'negative':
-                negative_message_detail = {
-                    'timestamp': msg['timestamp'],
-                    'sender': user,
-                    'message': msg['message'],
-                    'polarity': polarity_score,
-                    'confidence': confidence,
-                    'emotion': emotion,
-                    'reason': reason,
-                    'emotional_indicators': emotional_indicators,
-                    'date': date_str
-                }
-                sentiment_data['negative_messages'].append(negative_message_detail)
-            
-            # Add to sentiment trend
-            if timestamp:
-                sentiment_data['sentiment_trend'].append({
-                    'date': date_str,
-                    'sentiment': sentiment,
-                    'polarity': polarity_score,
-                    'confidence': confidence,
-                    'emotion': emotion
-                })
-            
-            # Extract emotional keywords
-            for indicator in emotional_indicators:
-                keyword_entry = {
-                    'keyword': indicator,
-                    'message': msg['message'][:100] + '...' if len(msg['message']) > 100 else msg['message'],
-                    'sender': user,
-                    'timestamp': msg['timestamp'],
-                    'polarity': polarity_score,
-                    'confidence': confidence
-                }
-                
-                if sentiment == 'positive':
-                    sentiment_data['emotional_keywords']['positive'].append(keyword_entry)
-                elif sentiment == 'negative':
-                    sentiment_data['emotional_keywords']['negative'].append(keyword_entry)
-        
-        # Add a small delay to respect API rate limits
-        time.sleep(0.3)
+            results[batch_indices[j]] = result
+        labelled = list(batch_indices)
+        for k in batch_indices:
+            labelled.extend(fan_out(k))
+        store_results(
+            [(keys[k], results[k]) for k in labelled if results[k] is not None],
+            SENTIMENT_MODEL_VERSION,
+        )
+        return labelled
+
+    if incremental:
+        live = _new_sentiment_data(len(messages))
+        yield 'start', {
+            'total_messages': len(messages),
+            'resolved_without_llm': sum(1 for result in results if result is not None),
+            'total_batches': len(batches),
+            'engine': engine,
+        }
+        resolved = [i for i, result in enumerate(results) if result is not None]
+        if resolved:
+            yield 'update', _live_update(live, messages, results, resolved, 'resolved', 0, len(batches))
+
+    def with_late_fallbacks(completed):
+        """completed, then the local fallback for batches still unfinished at the deadline"""
+        finished = set()
+        for batch_num, batch_results in completed:
+            finished.add(batch_num)
+            yield batch_num, batch_results
+        for batch_num, batch_indices in enumerate(batches):
+            if batch_num not in finished:
+                yield batch_num, fallback_batch(
+                    batch_indices, DeadlineExceeded("Request deadline passed before the batch finished"),
+                )
+
+    if model is None:
+        # No point pacing calls that cannot be made
+        completed = (
+            (batch_num, fallback_batch(batch_indices, Exception("Gemini model not available")))
+            for batch_num, batch_indices in enumerate(batches)
+        )
+    elif deadline is not None and time.monotonic() >= deadline:
+        completed = with_late_fallbacks(())
+    else:
+        completed = with_late_fallbacks(
+            iter_dispatch(batches, request_batch, on_error=fallback_batch, paced=False, deadline=deadline)
+        )
+
+    for batches_done, (batch_num, batch_results) in enumerate(completed, start=1):
+        labelled = batch_done(batch_num, batch_results)
+        if progress:
+            progress(batches_done, len(batches), f"Analysed batch {batches_done}/{len(batches)}")
+        if incremental:
+            yield 'update', _live_update(live, messages, results, labelled, 'llm', batches_done, len(batches))
+
+    # Process results in message order
+    for msg, result in zip(messages, results):
+        if result is not None:
+            _accumulate_result(sentiment_data, msg, result)
+
+    metadata = sentiment_data['analysis_metadata']
+    cache_hits = len(messages) - placeholders - uncached
+    metadata['cache_hits'] = cache_hits
+    metadata['cache_misses'] = uncached
+    metadata['placeholders'] = placeholders
+    metadata['duplicates_saved'] = sum(len(duplicates) for duplicates in copies.values())
+    metadata['distinct_texts'] = distinct
+    metadata['tiering'] = tiering
+    metadata['cache_hit_ratio'] = round(cache_hits / len(messages), 3)
+    batching = metrics.as_dict()
+    batching.update({
+        'planned_batches': len(batches),
+        'token_budget': SENTIMENT_BATCH_TOKEN_BUDGET,
+        'max_items': SENTIMENT_BATCH_MAX_ITEMS,
+        'avg_messages_per_batch': round(len(pending) / len(batches), 1) if batches else 0,
+    })
+    metadata['batching'] = batching
+    metadata['api_calls_made'] = batching['llm_calls']
+    # Messages answered by the cache, duplicates or the local tier, in batches
+    # of this run's average size (the item cap when nothing was sent)
+    skipped = len(messages) - placeholders - len(pending)
+    per_batch = len(pending) / len(batches) if batches else SENTIMENT_BATCH_MAX_ITEMS
+    metadata['api_calls_saved'] = math.ceil(skipped / per_batch) if skipped > 0 else 0
+    metadata['model_version'] = SENTIMENT_MODEL_VERSION
     
     # Calculate processing time
     processing_time = time.time() - start_time
     sentiment_data['analysis_metadata']['processing_time'] = round(processing_time, 2)
     
-    # Generate AI insights
-    sentiment_data['gemini_insights'] = generate_gemini_insights(sentiment_data)
+    # Generate AI insights; the local engine never calls the LLM, so it builds them from the counts
+    if engine == 'local':
+        sentiment_data['gemini_insights'] = local_insights(sentiment_data)
+    else:
+        sentiment_data['gemini_insights'] = generate_gemini_insights(sentiment_data, deadline)
     
     # Add useful calculated metrics
     total_messages = sum(sentiment_data['overall_sentiment'].values())
@@ -324,9 +734,79 @@ def analyze_sentiment(messages):
     print(f"Results: {sentiment_data['overall_sentiment']} ({sentiment_data['analysis_metadata']['api_calls_made']} API calls)")
     print(f"Confidence distribution: {sentiment_data['confidence_distribution']}")
     
-    return sentiment_data
+    yield 'complete', sentiment_data
+
+def _live_update(live, messages, results, indices, stage, batches_done, total_batches):
+    """Fold newly labelled messages into the running aggregate and describe the change"""
+    negatives_before = len(live['negative_messages'])
+    touched_dates = set()
+    for k in sorted(indices):
+        if results[k] is None:
+            continue
+        _accumulate_result(live, messages[k], results[k])
+        touched_dates.add(live['all_messages_with_sentiment'][-1]['date'])
+    return {
+        'stage': stage,
+        'batches_done': batches_done,
+        'total_batches': total_batches,
+        'processed': len(live['all_messages_with_sentiment']),
+        'total_messages': len(messages),
+        'sentiment_breakdown': dict(live['sentiment_breakdown']),
+        'daily_sentiment': {date: dict(live['daily_sentiment'][date]) for date in sorted(touched_dates)},
+        'negative_samples': live['negative_messages'][negatives_before:negatives_before + SENTIMENT_STREAM_NEGATIVE_SAMPLES],
+    }
+
+
+def local_insights(sentiment_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The insights generate_gemini_insights returns, built from the aggregate
+    counts without a model call
+    """
+    breakdown = sentiment_data['overall_sentiment']
+    total = sum(breakdown.values())
+    top_emotions = sorted(sentiment_data['emotion_analysis'].items(), key=lambda x: x[1], reverse=True)[:3]
+    insights = {
+        'communication_style': 'No messages analysed',
+        'mood_patterns': [],
+        'key_findings': [],
+        'recommendations': [],
+        'top_emotions': [f"{emotion} ({count} messages)" for emotion, count in top_emotions],
+    }
+    if not total:
+        return insights
+
+    share = {s: round(count / total * 100, 1) for s, count in breakdown.items()}
+    dominant = max(breakdown, key=breakdown.get)
+    insights['communication_style'] = f"Mostly {dominant} ({share[dominant]}% of {total} messages)"
+    insights['key_findings'].append(
+        f"{share['positive']}% positive, {share['neutral']}% neutral, {share['negative']}% negative"
+    )
+    if top_emotions:
+        insights['mood_patterns'].append(
+            "Most common emotions: " + ", ".join(emotion for emotion, _ in top_emotions)
+        )
 
-def generate_gemini_insights(sentiment_data: Dict[str, Any]) -> Dict[str, Any]:
+    days = {day: counts for day, counts in sentiment_data['daily_sentiment'].items() if sum(counts.values())}
+    if len(days) > 1:
+        def negative_share(day):
+            return days[day]['negative'] / sum(days[day].values())
+        worst_day = max(sorted(days), key=negative_share)
+        if days[worst_day]['negative']:
+            insights['mood_patterns'].append(
+                f"Most negative day: {worst_day} ({round(negative_share(worst_day) * 100, 1)}% negative)"
+            )
+
+    negative_senders = {
+        user: counts['negative'] for user, counts in sentiment_data['user_sentiment'].items() if counts.get('negative')
+    }
+    if negative_senders:
+        sender = max(sorted(negative_senders), key=negative_senders.get)
+        insights['key_findings'].append(f"{sender} sent the most negative messages ({negative_senders[sender]})")
+    if breakdown['negative'] > breakdown['positive']:
+        insights['recommendations'].append("Review the negative messages for recurring complaints")
+    return insights
+
+def generate_gemini_insights(sentiment_data: Dict[str, Any], deadline=None) -> Dict[str, Any]:
     """
     Generate high-level insights about the conversation using Gemini
     """
@@ -376,16 +856,7 @@ Provide insights in the following JSON format:
                 'top_emotions': [f"{emotion} ({count})" for emotion, count in sentiment_data['emotion_analysis'].items()][:3]
             }
             
-        response = model.generate_content(insight_prompt)
-        response_text = response.text.strip()
-        
-        # Clean up JSON response
-        if response_text.startswith('```json'):
-            response_text = response_text[7:-3].strip()
-        elif response_text.startswith('```'):
-            response_text = response_text[3:-3].strip()
-        
-        insights = json.loads(response_text)
+        insights = llm_generate(insight_prompt, model=model, parse=_parse_json_response, deadline=deadline)
         insights['top_emotions'] = [f"{emotion} ({count} messages)" for emotion, count in top_emotions]
         
         return insights
@@ -0,0 +1,73 @@
+"""
+Persistent per-message sentiment results.
+
+Each message is identified by a hash of its timestamp, sender and text, so
+re-opening or widening a date range only sends messages that have never been
+labelled to the model. Rows are scoped by model/prompt version; bumping the
+version makes old labels invisible without deleting them.
+"""
+import hashlib
+import logging
+
+from .models import SentimentResult
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per query
+LOOKUP_CHUNK = 500
+
+
+def message_key(msg):
+    """Stable id for a parsed message"""
+    raw = '\x1f'.join((msg.get('timestamp') or '', msg.get('sender') or '', msg.get('message') or ''))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def load_cached_results(keys, model_version):
+    """{message_key: result dict} for keys that already have a label"""
+    cached = {}
+    unique_keys = list(dict.fromkeys(keys))
+    try:
+        for i in range(0, len(unique_keys), LOOKUP_CHUNK):
+            rows = SentimentResult.objects.filter(
+                model_version=model_version,
+                message_key__in=unique_keys[i:i + LOOKUP_CHUNK],
+            )
+            for row in rows:
+                cached[row.message_key] = {
+                    'sentiment': row.sentiment,
+                    'confidence': row.confidence,
+                    'emotion': row.emotion,
+                    'polarity_score': row.polarity,
+                    'emotional_indicators': row.indicators,
+                    'reason': row.reason,
+                }
+    except Exception as e:
+        logger.warning(f"Sentiment cache lookup failed: {e}")
+    return cached
+
+
+def store_results(keyed_results, model_version):
+    """Persist [(message_key, result dict), ...]; only LLM results are stored"""
+    rows = [
+        SentimentResult(
+            message_key=key,
+            model_version=model_version,
+            sentiment=result.get('sentiment', 'neutral'),
+            confidence=result.get('confidence', 0.5),
+            emotion=result.get('emotion', 'neutral'),
+            polarity=result.get('polarity_score', 0.0),
+            indicators=result.get('emotional_indicators', []),
+            reason=result.get('reason', ''),
+        )
+        for key, result in keyed_results
+        if result.get('source', 'llm') == 'llm'
+    ]
+    if not rows:
+        return 0
+    try:
+        SentimentResult.objects.bulk_create(rows, batch_size=LOOKUP_CHUNK, ignore_conflicts=True)
+    except Exception as e:
+        logger.warning(f"Sentiment cache write failed: {e}")
+        return 0
+    return len(rows)
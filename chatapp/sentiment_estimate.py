@@ -0,0 +1,134 @@
+"""
+Sample-based sentiment estimation for very large ranges.
+
+Messages are ordered by (day, sender) and a systematic sample is taken from
+that order, which stratifies implicitly: every day and every active sender is
+represented in proportion to their message count. Only the sample is
+labelled; overall, daily and per-user distributions are extrapolated to the
+known population counts with Wilson score intervals corrected for sampling
+without replacement.
+"""
+import hashlib
+import math
+import random
+from collections import Counter, defaultdict
+from statistics import NormalDist
+
+from .utils import parse_timestamp
+
+SENTIMENTS = ('positive', 'neutral', 'negative')
+
+
+def z_score(confidence_level):
+    return NormalDist().inv_cdf(0.5 + confidence_level / 2)
+
+
+def required_sample_size(population, margin_of_error, confidence_level):
+    """Sample size for a proportion at the worst case p=0.5, with finite population correction"""
+    if population <= 0:
+        return 0
+    z = z_score(confidence_level)
+    n0 = z * z * 0.25 / (margin_of_error * margin_of_error)
+    return min(population, int(math.ceil(n0 / (1 + (n0 - 1) / population))))
+
+
+def _day(msg):
+    timestamp = parse_timestamp(msg['timestamp'])
+    return timestamp.strftime('%Y-%m-%d') if timestamp else 'unknown'
+
+
+def select_sample(messages, sample_size):
+    """
+    Positions of a systematic sample over messages ordered by (day, sender).
+    The start offset is seeded from the range itself, so repeating a request
+    picks the same messages and reuses their cached labels.
+    """
+    population = len(messages)
+    if sample_size >= population:
+        return list(range(population))
+    order = sorted(range(population), key=lambda i: (_day(messages[i]), messages[i]['sender'], i))
+    seed_source = f"{population}|{messages[0]['timestamp']}|{messages[-1]['timestamp']}"
+    rng = random.Random(int(hashlib.sha1(seed_source.encode('utf-8')).hexdigest()[:16], 16))
+    step = population / sample_size
+    start = rng.uniform(0, step)
+    return sorted(order[int(start + i * step)] for i in range(sample_size))
+
+
+def proportion_interval(hits, sampled, population, z):
+    """(estimate, low, high) for a proportion, or None when nothing was sampled"""
+    if sampled == 0:
+        return None
+    p = hits / sampled
+    if sampled >= population:
+        return p, p, p
+    # Effective sample size under the finite population correction
+    n = sampled * (population - 1) / (population - sampled)
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    # The Wilson interval always contains p; clamping drops float rounding at p=0 and p=1
+    return p, max(0.0, min(p, centre - half)), min(1.0, max(p, centre + half))
+
+
+def _estimate_group(hits, sampled, population, z):
+    estimate = {'population': population, 'sampled': sampled}
+    for sentiment in SENTIMENTS:
+        interval = proportion_interval(hits.get(sentiment, 0), sampled, population, z)
+        if interval is None:
+            estimate[sentiment] = {'proportion': None, 'count': None, 'low': 0, 'high': population}
+            continue
+        p, low, high = interval
+        estimate[sentiment] = {
+            'proportion': round(p, 4),
+            'count': int(round(p * population)),
+            'low': int(math.floor(low * population)),
+            'high': int(math.ceil(high * population)),
+        }
+    return estimate
+
+
+def estimate_distributions(messages, sample_positions, sample_labels, confidence_level):
+    """
+    Extrapolate sample labels ({position: sentiment}) to the whole range.
+    Sampled positions without a label are left out of the sample.
+
+    Returns overall, daily and per-user estimates, each with a point count and
+    an interval per sentiment.
+    """
+    z = z_score(confidence_level)
+    population_daily = Counter()
+    population_users = Counter()
+    for msg in messages:
+        population_daily[_day(msg)] += 1
+        population_users[msg['sender']] += 1
+
+    overall_hits = Counter()
+    daily_hits = defaultdict(Counter)
+    user_hits = defaultdict(Counter)
+    daily_sampled = Counter()
+    user_sampled = Counter()
+    sampled = 0
+    for position in sample_positions:
+        sentiment = sample_labels.get(position)
+        if sentiment is None:
+            continue
+        sampled += 1
+        msg = messages[position]
+        day = _day(msg)
+        overall_hits[sentiment] += 1
+        daily_hits[day][sentiment] += 1
+        user_hits[msg['sender']][sentiment] += 1
+        daily_sampled[day] += 1
+        user_sampled[msg['sender']] += 1
+
+    return {
+        'overall': _estimate_group(overall_hits, sampled, len(messages), z),
+        'daily': {
+            day: _estimate_group(daily_hits[day], daily_sampled[day], count, z)
+            for day, count in sorted(population_daily.items())
+        },
+        'users': {
+            user: _estimate_group(user_hits[user], user_sampled[user], count, z)
+            for user, count in population_users.most_common()
+        },
+    }
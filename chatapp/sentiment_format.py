@@ -0,0 +1,121 @@
+"""
+Compact, columnar encoding of an analyze_sentiment result.
+
+The full response repeats every message's text and metadata in up to five
+lists. The compact form keeps one message table of parallel arrays (epoch
+timestamps, sender ids, sentiment/emotion codes, confidence, polarity) and
+the derived views refer to rows by index. Aggregates are passed through
+unchanged. Message text and reasons are only included on request.
+"""
+from .event_index import to_epoch
+from .utils import parse_timestamp
+
+RESPONSE_FORMATS = ('full', 'compact')
+SENTIMENT_CODES = ('positive', 'neutral', 'negative')
+
+# Aggregates copied as-is; user_sentiments is an alias of user_sentiment and is dropped
+AGGREGATE_KEYS = (
+    'overall_sentiment',
+    'sentiment_breakdown',
+    'sentiment_percentages',
+    'daily_sentiment',
+    'user_sentiment',
+    'emotion_analysis',
+    'confidence_distribution',
+    'gemini_insights',
+    'analysis_metadata',
+    'total_analyzed',
+)
+
+
+def _interner(initial=()):
+    """(intern(value) -> small int id in first-seen order, ids dict)"""
+    ids = {value: i for i, value in enumerate(initial)}
+
+    def intern(value):
+        return ids.setdefault(value, len(ids))
+    return intern, ids
+
+
+def compact_sentiment_result(sentiment_data, include_text=False):
+    """Columnar form of a full analyze_sentiment result"""
+    senders, sender_ids = _interner()
+    emotions, emotion_ids = _interner()
+    dates, date_ids = _interner()
+    keywords, keyword_ids = _interner()
+    sentiments, sentiment_ids = _interner(SENTIMENT_CODES)
+
+    columns = {
+        'timestamp': [],
+        'sender': [],
+        'date': [],
+        'sentiment': [],
+        'emotion': [],
+        'confidence': [],
+        'polarity': [],
+    }
+    if include_text:
+        columns['message'] = []
+        columns['reason'] = []
+
+    negative_rows = []
+    trend_rows = []
+    emotional_keywords = {'positive': [], 'negative': []}
+
+    # Busy groups post many messages within the same minute
+    epochs = {}
+
+    for row, msg in enumerate(sentiment_data.get('all_messages_with_sentiment', [])):
+        raw_timestamp = msg['timestamp']
+        if raw_timestamp not in epochs:
+            timestamp = parse_timestamp(raw_timestamp)
+            epochs[raw_timestamp] = to_epoch(timestamp) if timestamp else None
+        epoch = epochs[raw_timestamp]
+        sentiment = msg['sentiment']
+        columns['timestamp'].append(epoch)
+        columns['sender'].append(senders(msg['sender']))
+        columns['date'].append(dates(msg['date']))
+        columns['sentiment'].append(sentiments(sentiment))
+        columns['emotion'].append(emotions(msg['emotion']))
+        columns['confidence'].append(round(msg['confidence'], 3))
+        columns['polarity'].append(round(msg['polarity'], 3))
+        if include_text:
+            columns['message'].append(msg['message'])
+            columns['reason'].append(msg['reason'])
+
+        if sentiment == 'negative':
+            negative_rows.append(row)
+        if epoch is not None:
+            trend_rows.append(row)
+        if sentiment in emotional_keywords:
+            for indicator in msg['emotional_indicators']:
+                emotional_keywords[sentiment].append([row, keywords(indicator)])
+
+    compact = {key: sentiment_data[key] for key in AGGREGATE_KEYS if key in sentiment_data}
+    compact.update({
+        'format': 'compact',
+        'dictionaries': {
+            'sentiment': list(sentiment_ids),
+            'sender': list(sender_ids),
+            'emotion': list(emotion_ids),
+            'date': list(date_ids),
+            'keyword': list(keyword_ids),
+        },
+        'messages': columns,
+        'views': {
+            'negative_messages': negative_rows,
+            'sentiment_trend': trend_rows,
+            'emotional_keywords': emotional_keywords,
+        },
+    })
+    return compact
+
+
+def format_sentiment_result(sentiment_data, response_format=None, include_text=False):
+    """Encode a result in the requested format; raises ValueError for unknown formats"""
+    response_format = response_format or 'full'
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown format: {response_format}")
+    if response_format == 'compact':
+        return compact_sentiment_result(sentiment_data, include_text)
+    return sentiment_data
@@ -0,0 +1,178 @@
+"""
+Per-day sentiment rollups.
+
+Whenever a sentiment analysis finishes, its labels are folded into
+(group, day, sender, sentiment, emotion) counts and the analysed day range is
+recorded as covered. Breakdowns, daily trends and per-user sentiment for any
+range inside the covered days are then answered with one indexed query,
+without parsing the chat or calling the model. Rollups are tied to the
+group's source files and are discarded when those change.
+"""
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+from django.db import transaction
+
+from .event_index import source_signature
+from .models import SentimentRollup, SentimentRollupCoverage
+
+SENTIMENTS = ('positive', 'neutral', 'negative')
+
+
+def _day_bounds(start_date_str, end_date_str):
+    """Inclusive day range of a request; open ends cover everything"""
+    start_day = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else date.min
+    end_day = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else date.max
+    return start_day, end_day
+
+
+def _merge_ranges(ranges):
+    """Merge overlapping or adjacent (start_day, end_day) ranges"""
+    merged = []
+    for start_day, end_day in sorted(ranges):
+        if merged and (merged[-1][1] == date.max or start_day <= merged[-1][1] + timedelta(days=1)):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_day))
+        else:
+            merged.append((start_day, end_day))
+    return merged
+
+
+def record_rollups(group_name, start_date_str, end_date_str, sentiment_data):
+    """
+    Replace the rollups of the analysed days with the counts from a full
+    analyze_sentiment result and mark the requested range as covered
+    """
+    # Estimates only label a sample, so they cannot stand in for daily counts
+    if 'all_messages_with_sentiment' not in sentiment_data or 'estimate' in sentiment_data:
+        return 0
+    signature = source_signature(group_name)
+    if signature is None:
+        return 0
+    start_day, end_day = _day_bounds(start_date_str, end_date_str)
+
+    counts = Counter()
+    polarity = defaultdict(float)
+    for msg in sentiment_data['all_messages_with_sentiment']:
+        if msg['date'] == 'unknown':
+            continue
+        key = (msg['date'], msg['sender'], msg['sentiment'], msg['emotion'])
+        counts[key] += 1
+        polarity[key] += msg['polarity'] or 0.0
+
+    rows = [
+        SentimentRollup(
+            group_name=group_name,
+            day=datetime.strptime(day, '%Y-%m-%d').date(),
+            sender=sender[:255],
+            sentiment=sentiment,
+            emotion=emotion[:32],
+            count=count,
+            polarity_sum=polarity[(day, sender, sentiment, emotion)],
+        )
+        for (day, sender, sentiment, emotion), count in counts.items()
+    ]
+
+    with transaction.atomic():
+        coverage = SentimentRollupCoverage.objects.filter(group_name=group_name)
+        if coverage.exclude(source_signature=signature).exists():
+            # Files changed since these rollups were built
+            drop_rollups(group_name)
+        ranges = list(coverage.values_list('start_day', 'end_day'))
+
+        SentimentRollup.objects.filter(group_name=group_name, day__gte=start_day, day__lte=end_day).delete()
+        SentimentRollup.objects.bulk_create(rows, batch_size=500)
+
+        coverage.delete()
+        SentimentRollupCoverage.objects.bulk_create([
+            SentimentRollupCoverage(group_name=group_name, start_day=s, end_day=e, source_signature=signature)
+            for s, e in _merge_ranges(ranges + [(start_day, end_day)])
+        ])
+    return len(rows)
+
+
+def drop_rollups(group_name):
+    SentimentRollup.objects.filter(group_name=group_name).delete()
+    SentimentRollupCoverage.objects.filter(group_name=group_name).delete()
+
+
+def uncovered_ranges(group_name, start_date_str, end_date_str):
+    """Parts of the requested range that no finished analysis has covered, as ISO date pairs"""
+    start_day, end_day = _day_bounds(start_date_str, end_date_str)
+    signature = source_signature(group_name)
+    ranges = SentimentRollupCoverage.objects.filter(
+        group_name=group_name, source_signature=signature, end_day__gte=start_day, start_day__lte=end_day,
+    ).values_list('start_day', 'end_day')
+
+    gaps = []
+    cursor = start_day
+    for s, e in _merge_ranges(ranges):
+        if s > cursor:
+            gaps.append((cursor, s - timedelta(days=1)))
+        if e >= end_day:
+            cursor = None
+            break
+        cursor = max(cursor, e + timedelta(days=1))
+    if cursor is not None:
+        gaps.append((cursor, end_day))
+
+    def fmt(day):
+        return None if day in (date.min, date.max) else day.isoformat()
+    return [[fmt(s), fmt(e)] for s, e in gaps]
+
+
+def rollup_sentiment(group_name, start_date_str=None, end_date_str=None, user=None):
+    """Breakdown, daily trend, per-user and emotion counts for a range, from rollups only"""
+    started = time.time()
+    start_day, end_day = _day_bounds(start_date_str, end_date_str)
+    qs = SentimentRollup.objects.filter(group_name=group_name, day__gte=start_day, day__lte=end_day)
+    if user:
+        qs = qs.filter(sender=user)
+
+    overall = {s: 0 for s in SENTIMENTS}
+    daily = {}
+    daily_polarity = defaultdict(float)
+    user_sentiment = {}
+    emotions = Counter()
+    row_count = 0
+    for day, sender, sentiment, emotion, count, polarity_sum in qs.order_by('day').values_list(
+        'day', 'sender', 'sentiment', 'emotion', 'count', 'polarity_sum',
+    ):
+        row_count += 1
+        day = day.isoformat()
+        overall[sentiment] = overall.get(sentiment, 0) + count
+        daily.setdefault(day, {s: 0 for s in SENTIMENTS})[sentiment] += count
+        daily_polarity[day] += polarity_sum
+        user_sentiment.setdefault(sender, {s: 0 for s in SENTIMENTS})[sentiment] += count
+        emotions[emotion] += count
+
+    total = sum(overall.values())
+    trend = []
+    for day, day_counts in daily.items():
+        day_total = sum(day_counts.values())
+        trend.append({
+            'date': day,
+            **day_counts,
+            'total': day_total,
+            'avg_polarity': round(daily_polarity[day] / day_total, 3) if day_total else 0.0,
+        })
+
+    result = {
+        'overall_sentiment': overall,
+        'sentiment_breakdown': dict(overall),
+        'daily_sentiment': daily,
+        'sentiment_trend': trend,
+        'user_sentiment': user_sentiment,
+        'user_sentiments': user_sentiment,
+        'emotion_analysis': dict(emotions),
+        'total_analyzed': total,
+        'analysis_metadata': {
+            'source': 'rollup',
+            'rollup_rows': row_count,
+            'processing_time': round(time.time() - started, 3),
+            'api_calls_made': 0,
+        },
+    }
+    if total:
+        result['sentiment_percentages'] = {s: round(overall[s] / total * 100, 1) for s in SENTIMENTS}
+    return result
@@ -5,6 +5,17 @@ from dotenv import load_dotenv
 import os
 from django.conf import settings
 import logging
+import time
+from .config import (
+    SUMMARY_CONCURRENCY, SUMMARY_DEADLINE_SECONDS, SUMMARY_PROMPT_TOKEN_BUDGET, SUMMARY_FINAL_CALL_RESERVE_SECONDS,
+)
+from .circuit_breaker import CircuitOpenError
+from .llm_dispatch import dispatch
+from .llm_gateway import DeadlineExceeded, generate as llm_generate, generate_stream as llm_generate_stream
+from .local_summary import local_summary
+from .models import SummaryNode
+from .prompt_builder import build_chat_context
+from .summary_tree import content_hash, day_hash, day_prompt, load_nodes, store_nodes, summarize_range
 
 load_dotenv()
 
@@ -25,6 +36,15 @@ except Exception as e:
         logger.warning(f"Could not initialize gemini-flash-latest, falling back to gemini-pro-latest: {e2}")
         model = genai.GenerativeModel('gemini-pro-latest')
 
+SUMMARY_MODES = ('llm', 'local')
+
+def _summary_mode(mode):
+    """Validated summary mode; 'local' summarises offline without any model call"""
+    mode = mode or 'llm'
+    if mode not in SUMMARY_MODES:
+        raise ValueError(f"Unknown summary mode: {mode}")
+    return mode
+
 def generate_fallback_summary(messages):
     """Generate structured summary with actual message content when AI is unavailable"""
     if not messages:
@@ -125,11 +145,28 @@ def generate_fallback_summary(messages):
     
     return '\n'.join(summary_parts)
 
-def generate_with_gemini(prompt):
-    """Generate content using Google Gemini AI SDK"""
+def request_summary(prompt, on_token=None, deadline=None):
+    """
+    Generate content using Google Gemini AI SDK; with on_token, stream each chunk to it as it arrives.
+    Errors propagate, so calls run through dispatch are retried while rate
+    limited and give their rate token back while the circuit is open.
+    """
+    if on_token is None:
+        return llm_generate(prompt, model=model, deadline=deadline)
+    chunks = []
+    for chunk in llm_generate_stream(prompt, model=model, deadline=deadline):
+        chunks.append(chunk)
+        on_token(chunk)
+    return ''.join(chunks)
+
+def generate_with_gemini(prompt, on_token=None, deadline=None):
+    """request_summary(), with errors turned into the "QUOTA_EXCEEDED"/"API_ERROR" markers callers fall back on"""
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        return request_summary(prompt, on_token, deadline)
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        # Gemini is degraded or there is no time left: fall back like on an exhausted quota
+        logger.warning(f"Gemini call skipped: {e}")
+        return "QUOTA_EXCEEDED"
     except Exception as e:
         logger.error(f"Gemini API error: {e}")
         # Check if it's a quota exceeded error
@@ -155,15 +192,44 @@ def parse_timestamp(timestamp_str):
             pass
     return None
 
-def generate_total_summary(messages):
+def _summarize_node(prompt, deadline=None):
+    """Cleaned summary text for a summary tree node; model errors propagate to the tree's dispatch"""
+    return clean_summary_text(request_summary(prompt, deadline=deadline))
+
+def _range_digest(messages, start_date_str=None, end_date_str=None, deadline=None, group_name=None):
+    """
+    Period-by-period summaries of a long range, built from cached
+    day/week/month summaries, finishing early enough before deadline to
+    leave the final summary call its reserve
+    """
+    tree_deadline = None
+    if deadline is not None:
+        remaining = max(0.0, deadline - time.monotonic())
+        tree_deadline = deadline - min(SUMMARY_FINAL_CALL_RESERVE_SECONDS, remaining / 2)
+    nodes = summarize_range(
+        messages, lambda prompt: _summarize_node(prompt, tree_deadline), generate_fallback_summary,
+        start_date_str, end_date_str, tree_deadline, group_name,
+    )
+    return "\n\n".join(
+        f"{node['label']} ({node['message_count']} messages):\n{node['summary']}" for node in nodes
+    )
+
+def generate_total_summary(messages, start_date_str=None, end_date_str=None,
+                           deadline_seconds=SUMMARY_DEADLINE_SECONDS, mode=None, on_token=None, group_name=None):
+    mode = _summary_mode(mode)
     if not messages:
         return "No messages found in the selected date range."
-    
-    chat_text = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in messages])
+    if mode == 'local':
+        return local_summary(messages, 4) or generate_fallback_summary(messages)
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
     
     try:
+        # Ranges that don't fit one prompt are summarised from cached period summaries
+        chat_text, context_stats = build_chat_context(messages, SUMMARY_PROMPT_TOKEN_BUDGET)
+        if context_stats['truncated']:
+            chat_text = _range_digest(messages, start_date_str, end_date_str, deadline, group_name)
         prompt = "Generate a brief summary in 3-4 bullet points. Focus only on the most important topics and key events. Keep it concise and easy to understand. Use **bold** for important terms, *italic* for emphasis, and <span style='color:red'>red text</span> for critical information.\n\n" + chat_text
-        response = generate_with_gemini(prompt)
+        response = generate_with_gemini(prompt, on_token, deadline)
         
         # Check if API quota exceeded or error occurred
         if response == "QUOTA_EXCEEDED":
@@ -391,71 +457,122 @@ def clean_summary_text(summary):
     
     return '\n'.join(cleaned_lines)
 
-def generate_weekly_summary(messages, start_date_str=None, end_date_str=None):
-    """Generate comprehensive weekly summaries with detailed discussion points for filtered date range"""
-    if not messages:
-        return []
-    
-    # Parse start and end dates if provided
-    start_date = None
-    end_date = None
-    if start_date_str:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-    if end_date_str:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-        end_date = end_date.replace(hour=23, minute=59, second=59)
-    
-    # Group messages by week (messages are already filtered by views.py)
-    weeks = {}
-    for msg in messages:
-        dt = parse_timestamp(msg['timestamp'])
-        if not dt:
-            continue
-            
-        monday = dt - timedelta(days=dt.weekday())
-        week_key = monday.strftime('%Y-%m-%d')
-        if week_key not in weeks:
-            weeks[week_key] = []
-        weeks[week_key].append(msg)
-    
-    weekly_summaries = []
+def _memo_node(level, period_start, period_end, node_hash, bucket_messages):
+    """Summary node for one weekly/daily bucket, in the shape summary_tree stores"""
+    return {
+        'level': level,
+        'period_start': period_start,
+        'period_end': period_end,
+        'content_hash': node_hash,
+        'message_count': len(bucket_messages),
+        'summary': None,
+        'cached': False,
+    }
 
-    # Process all weeks that have messages within the filtered date range
-    for week_key, week_messages in sorted(weeks.items()):
-        # Only process weeks that have messages
-        if not week_messages:
-            continue
-            
-        # Check if this week falls within the specified date range
-        week_start = datetime.strptime(week_key, '%Y-%m-%d')
-        week_end = week_start + timedelta(days=6)
-        
-        # Skip weeks that are outside the specified date range
-        if start_date and week_end < start_date:
-            continue
-        if end_date and week_start > end_date:
-            continue
-            
-        # Basic statistics for this week
-        total_messages = len(week_messages)
-        users = set(msg['sender'] for msg in week_messages)
-        user_count = len(users)
-        
-        # User activity analysis
-        user_msg_count = {}
-        for msg in week_messages:
-            user = msg['sender']
-            user_msg_count[user] = user_msg_count.get(user, 0) + 1
-        
-        # Sort users by activity
-        sorted_users = sorted(user_msg_count.items(), key=lambda x: x[1], reverse=True)
-        most_active_user = sorted_users[0] if sorted_users else None
-        
-        week_text = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in week_messages])
+def _summarize_buckets(buckets, make_prompt, make_entry, progress, deadline_seconds, label,
+                       group_name=None, make_node=None, on_entry=None):
+    """
+    Summarise every (key, messages) bucket with make_prompt(key, messages),
+    running the model calls with bounded concurrency, and return
+    make_entry(key, messages, summary) in bucket order. Rate-limited calls
+    are retried with backoff; a bucket whose call still fails, or that is
+    still running at the deadline, gets a fallback summary, and the latter
+    are flagged with timed_out.
+
+    With group_name and make_node, model summaries are stored as summary
+    tree nodes (make_node(key, messages, prompt) gives each bucket's node)
+    and reused until the bucket's messages change.
+    on_entry(index, entry) is called on the calling thread as each entry is ready.
+    """
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    prompts = [make_prompt(key, bucket_messages) for key, bucket_messages in buckets]
+    nodes = None
+    if group_name and make_node:
+        nodes = [make_node(key, bucket_messages, prompt) for (key, bucket_messages), prompt in zip(buckets, prompts)]
+        load_nodes(nodes, group_name)
+
+    entries = [None] * len(buckets)
+    pending = []
+    for index, (key, bucket_messages) in enumerate(buckets):
+        if nodes and nodes[index]['summary'] is not None:
+            entries[index] = make_entry(key, bucket_messages, nodes[index]['summary'])
+            if on_entry:
+                on_entry(index, entries[index])
+        else:
+            pending.append(index)
+    completed = [len(buckets) - len(pending)]
+    if progress and completed[0]:
+        progress(completed[0], len(buckets), f"Reused {completed[0]} stored {label} summaries")
+
+    def bucket_done(position, response):
+        index = pending[position]
+        key, bucket_messages = buckets[index]
+        if response is None:
+            summary = generate_fallback_summary(bucket_messages)
+        else:
+            summary = clean_summary_text(response)
+            if nodes:
+                nodes[index]['summary'] = summary
+                store_nodes([nodes[index]], group_name)
+        entries[index] = make_entry(key, bucket_messages, summary)
+        if on_entry:
+            on_entry(index, entries[index])
+        completed[0] += 1
+        if progress:
+            progress(completed[0], len(buckets), f"Summarised {label} {key}")
+
+    def bucket_failed(index, error):
+        logger.error(f"Summary for {label} {buckets[index][0]} failed: {error}")
+        return None
+
+    dispatch(
+        pending, lambda index: request_summary(prompts[index], deadline=deadline), on_error=bucket_failed,
+        on_complete=bucket_done, concurrency=SUMMARY_CONCURRENCY, deadline=deadline,
+    )
+    for index, entry in enumerate(entries):
+        if entry is None:
+            key, bucket_messages = buckets[index]
+            entries[index] = make_entry(key, bucket_messages, generate_fallback_summary(bucket_messages))
+            entries[index]['timed_out'] = True
+            if on_entry:
+                on_entry(index, entries[index])
+    return entries
+
+def _week_entry(week_key, week_messages, summary):
+    user_msg_count = {}
+    for msg in week_messages:
+        user = msg['sender']
+        user_msg_count[user] = user_msg_count.get(user, 0) + 1
+    most_active_user = max(user_msg_count.items(), key=lambda x: x[1]) if user_msg_count else None
 
-        try:
-            # Enhanced prompt to extract EXACT conversation content and quotes
-            exact_content_prompt = f"""Analyze this week's WhatsApp conversation and create a detailed summary showing EXACTLY what was discussed with actual quotes and specific content.
+    monday = datetime.strptime(week_key, '%Y-%m-%d')
+    sunday = monday + timedelta(days=6)
+    date_range = f"{monday.strftime('%d %b %Y')} to {sunday.strftime('%d %b %Y')}"
+
+    return {
+        'week_start': week_key,
+        'date_range': date_range,
+        'summary': summary,
+        'message_count': len(week_messages),
+        'participant_count': len(user_msg_count),
+        'most_active_user': most_active_user[0] if most_active_user else None
+    }
+
+def _week_node(week_key, week_messages, prompt):
+    monday = datetime.strptime(week_key, '%Y-%m-%d').date()
+    # Keyed by the weekly prompt, which differs from the tree's week merge
+    return _memo_node(
+        SummaryNode.LEVEL_WEEK, monday, monday + timedelta(days=6), content_hash(['weekly', prompt]), week_messages,
+    )
+
+def _week_prompt(week_key, week_messages):
+    """Prompt for one week's summary"""
+    total_messages = len(week_messages)
+    user_count = len(set(msg['sender'] for msg in week_messages))
+    week_text, _ = build_chat_context(week_messages, SUMMARY_PROMPT_TOKEN_BUDGET)
+
+    # Enhanced prompt to extract EXACT conversation content and quotes
+    exact_content_prompt = f"""Analyze this week's WhatsApp conversation and create a detailed summary showing EXACTLY what was discussed with actual quotes and specific content.
 
 **CRITICAL INSTRUCTIONS**:
 1. Show ACTUAL messages, file names, and specific content shared
@@ -489,44 +606,66 @@ def generate_weekly_summary(messages, start_date_str=None, end_date_str=None):
 
 Week's conversation content:
 {week_text}"""
+    return exact_content_prompt
+
+def generate_weekly_summary(messages, start_date_str=None, end_date_str=None, progress=None,
+                            deadline_seconds=SUMMARY_DEADLINE_SECONDS, group_name=None, mode=None, on_entry=None):
+    """
+    Generate comprehensive weekly summaries with detailed discussion points for filtered date range.
+    With group_name, summaries of weeks whose messages are unchanged are reused.
+    """
+    mode = _summary_mode(mode)
+    if not messages:
+        return []
+    
+    # Parse start and end dates if provided
+    start_date = None
+    end_date = None
+    if start_date_str:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    if end_date_str:
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+    
+    # Group messages by week (messages are already filtered by views.py)
+    weeks = {}
+    for msg in messages:
+        dt = parse_timestamp(msg['timestamp'])
+        if not dt:
+            continue
             
-            response = generate_with_gemini(exact_content_prompt)
-            
-            # Check if API quota exceeded or error occurred
-            if response == "QUOTA_EXCEEDED":
-                summary = generate_fallback_summary(week_messages)
-            elif response == "API_ERROR":
-                summary = "Summary temporarily unavailable due to technical issues."
-            else:
-                summary = response
-                # Clean the summary text
-                summary = clean_summary_text(summary)
-
-        except Exception as e:
-            # Even if there's an error, we should still include this week in the results
-            # Use fallback summary
-            try:
-                summary = generate_fallback_summary(week_messages)
-            except Exception as fallback_error:
-                summary = f"Error generating summary: {str(e)}. Fallback error: {str(fallback_error)}"
-        
-        monday = datetime.strptime(week_key, '%Y-%m-%d')
-        sunday = monday + timedelta(days=6)
-        date_range = f"{monday.strftime('%d %b %Y')} to {sunday.strftime('%d %b %Y')}" 
-        
-        weekly_summaries.append({
-            'week_start': week_key,
-            'date_range': date_range,
-            'summary': summary,
-            'message_count': len(week_messages),
-            'participant_count': user_count,
-            'most_active_user': most_active_user[0] if most_active_user else None
-        })
-    
-    return weekly_summaries
-
-def generate_brief_summary(messages):
+        monday = dt - timedelta(days=dt.weekday())
+        week_key = monday.strftime('%Y-%m-%d')
+        if week_key not in weeks:
+            weeks[week_key] = []
+        weeks[week_key].append(msg)
+    
+    # Only weeks that have messages and overlap the requested range
+    buckets = []
+    for week_key, week_messages in sorted(weeks.items()):
+        if not week_messages:
+            continue
+        week_start = datetime.strptime(week_key, '%Y-%m-%d')
+        week_end = week_start + timedelta(days=6)
+        if start_date and week_end < start_date:
+            continue
+        if end_date and week_start > end_date:
+            continue
+        buckets.append((week_key, week_messages))
+
+    if mode == 'local':
+        return [
+            _week_entry(week_key, week_messages, local_summary(week_messages, 5) or generate_fallback_summary(week_messages))
+            for week_key, week_messages in buckets
+        ]
+    return _summarize_buckets(
+        buckets, _week_prompt, _week_entry, progress, deadline_seconds, "week of", group_name, _week_node, on_entry,
+    )
+
+def generate_brief_summary(messages, start_date_str=None, end_date_str=None,
+                           deadline_seconds=SUMMARY_DEADLINE_SECONDS, mode=None, on_token=None, group_name=None):
     """Generate a comprehensive brief summary with detailed insights"""
+    mode = _summary_mode(mode)
     if not messages:
         return "No messages found in the selected date range."
 
@@ -574,9 +713,24 @@ def generate_brief_summary(messages):
     peak_hour = max(hourly_activity.items(), key=lambda x: x[1])[0] if hourly_activity else None
     peak_day = max(daily_activity.items(), key=lambda x: x[1])[0] if daily_activity else None
 
-    chat_text = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in messages])
+    if mode == 'local':
+        topics = local_summary(messages, 8)
+        if topics:
+            overview = f"**OVERVIEW**: {total_messages} messages from {user_count} participants"
+            if most_active_user:
+                overview += f"\n**KEY PARTICIPANTS**: {most_active_user[0]} was most active with {most_active_user[1]} messages"
+            return f"{date_range_text}{overview}\n**MAIN DISCUSSION TOPICS**:\n{topics}"
+        return f"{date_range_text}{generate_fallback_summary(messages)}"
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
 
     try:
+        # When the chat doesn't fit the prompt budget, cover the whole range with cached period summaries
+        conversation_content, context_stats = build_chat_context(messages, SUMMARY_PROMPT_TOKEN_BUDGET)
+        if context_stats['truncated']:
+            conversation_content = "Summaries of each period, in date order:\n\n" + _range_digest(
+                messages, start_date_str, end_date_str, deadline, group_name,
+            )
+
         # Enhanced prompt to ensure comprehensive topic coverage from ALL participants
         comprehensive_prompt = f"""Analyze this extensive chat conversation (covering {start_date.strftime('%Y-%m-%d') if start_date else 'unknown'} to {end_date.strftime('%Y-%m-%d') if end_date else 'unknown'}) and create a comprehensive summary that captures the FULL DIVERSITY of discussions.
 
@@ -612,9 +766,9 @@ def generate_brief_summary(messages):
 **NOTABLE CONVERSATIONS**: Highlight significant discussions from different participants and time periods
 
 Conversation content spanning {total_messages} messages:
-{chat_text[:8000]}..."""
+{conversation_content}"""
 
-        response = generate_with_gemini(comprehensive_prompt)
+        response = generate_with_gemini(comprehensive_prompt, on_token, deadline)
 
         # Check if API quota exceeded or error occurred
         if response == "QUOTA_EXCEEDED":
@@ -732,8 +886,29 @@ Conversation content spanning {total_messages} messages:
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
-def generate_daily_user_messages(messages):
-    """Generate day-by-day user messages with short summaries"""
+def _day_entry(date_key, day_messages, summary):
+    date_obj = datetime.strptime(date_key, '%Y-%m-%d')
+    return {
+        'date': date_key,
+        'formatted_date': date_obj.strftime('%d %b %Y'),
+        'summary': summary,
+        'message_count': len(day_messages),
+        'messages': day_messages
+    }
+
+def _day_prompt(date_key, day_messages):
+    """Prompt for one day's summary, shared with the summary tree's day nodes"""
+    return day_prompt(day_messages)
+
+def _day_node(date_key, day_messages, prompt):
+    day = datetime.strptime(date_key, '%Y-%m-%d').date()
+    # The same key as the summary tree's node for this day
+    return _memo_node(SummaryNode.LEVEL_DAY, day, day, day_hash(day_messages), day_messages)
+
+def generate_daily_user_messages(messages, progress=None, deadline_seconds=SUMMARY_DEADLINE_SECONDS, group_name=None,
+                                 mode=None, on_entry=None):
+    """Generate day-by-day user messages with short summaries, reusing stored ones when group_name is given"""
+    mode = _summary_mode(mode)
     if not messages:
         return []
     
@@ -748,39 +923,15 @@ def generate_daily_user_messages(messages):
             daily_messages[date_key] = []
         daily_messages[date_key].append(msg)
     
-    daily_summaries = []
-    for date_key, day_messages in sorted(daily_messages.items()):
-        # Create short summary for the day
-        day_text = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in day_messages])
-        
-        try:
-            prompt = "Generate a very brief daily summary in 1-2 bullet points. Focus only on key topics or events discussed that day. Each bullet point must start with '*' and be concise. Use **bold** for important terms, *italic* for emphasis, and <span style='color:red'>red text</span> for critical information.\n\n" + day_text
-            response = generate_with_gemini(prompt)
-            
-            # Check if API quota exceeded or error occurred
-            if response == "QUOTA_EXCEEDED":
-                summary = generate_fallback_summary(day_messages)
-            elif response == "API_ERROR":
-                summary = "Summary temporarily unavailable due to technical issues."
-            else:
-                summary = response
-                summary = clean_summary_text(summary)
-        except Exception as e:
-            summary = f"Error generating summary: {str(e)}"
-        
-        # Format date nicely
-        date_obj = datetime.strptime(date_key, '%Y-%m-%d')
-        formatted_date = date_obj.strftime('%d %b %Y')
-        
-        daily_summaries.append({
-            'date': date_key,
-            'formatted_date': formatted_date,
-            'summary': summary,
-            'message_count': len(day_messages),
-            'messages': day_messages
-        })
-    
-    return daily_summaries
+    buckets = sorted(daily_messages.items())
+    if mode == 'local':
+        return [
+            _day_entry(date_key, day_messages, local_summary(day_messages, 2) or generate_fallback_summary(day_messages))
+            for date_key, day_messages in buckets
+        ]
+    return _summarize_buckets(
+        buckets, _day_prompt, _day_entry, progress, deadline_seconds, "day", group_name, _day_node, on_entry,
+    )
 
 def generate_user_wise_detailed_report(messages, user):
     """Generate detailed user-wise report with date and time for each message"""
@@ -0,0 +1,353 @@
+"""
+Hierarchical (map-reduce) summaries of long chat ranges.
+
+A range is split into the fewest calendar periods that cover it: whole
+months inside the range, then whole Monday-Sunday weeks, then single days.
+Each day is summarised once and stored as a node keyed by its group and a
+hash of its messages; week nodes are reduced from their day summaries, month nodes from
+any stored whole-week summaries plus the remaining days, and both are stored
+the same way. Later requests over overlapping ranges reuse the
+stored nodes, so only periods whose messages changed cost model calls.
+
+The weekly and daily summary views store their summaries as nodes too, and
+a daily summary is the same node (same prompt, same key) as the tree's day.
+"""
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from .config import SUMMARY_CONCURRENCY, SUMMARY_PROMPT_TOKEN_BUDGET, SUMMARY_TREE_MAP_SHARE
+from .llm_dispatch import dispatch
+from .models import SummaryNode
+from .prompt_builder import build_chat_context
+from .token_utils import count_tokens
+from .utils import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Bump when the node prompts change so stale summaries are not reused
+NODE_VERSION = '3'
+
+DAY_PROMPT = (
+    "Summarize this day's WhatsApp group conversation in 2-4 bullet points. Keep who said what, decisions, "
+    "announcements, documents shared and short exact quotes in the original language (Hindi/Marathi/English). "
+    "Each bullet point must start with '*'.\n\n"
+)
+
+MERGE_PROMPT = (
+    "Combine these summaries of a WhatsApp group for {label}, one per day or week, into one summary of 4-6 "
+    "bullet points. "
+    "Keep the most important topics, decisions and events with the participants' names and short quotes. "
+    "Each bullet point must start with '*'.\n\n"
+)
+
+
+def content_hash(parts):
+    digest = hashlib.sha256(NODE_VERSION.encode('utf-8'))
+    for part in parts:
+        digest.update(b'\x1e')
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def day_hash(day_messages):
+    """Node key of one day's messages"""
+    return content_hash(f"{msg['timestamp']}\x1f{msg['sender']}\x1f{msg['message']}" for msg in day_messages)
+
+
+def _month_bounds(day):
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def _week_bounds(day):
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+def _label(level, period_start):
+    if level == SummaryNode.LEVEL_MONTH:
+        return period_start.strftime('%B %Y')
+    if level == SummaryNode.LEVEL_WEEK:
+        return f"the week of {period_start.strftime('%d %b %Y')}"
+    return period_start.strftime('%a %d %b %Y')
+
+
+def plan_cover(days, start_bound=date.min, end_bound=date.max):
+    """
+    Split sorted message days into [(level, period_start, period_end, days)]:
+    whole calendar months inside the bounds, then whole weeks inside the
+    bounds that don't reach into such a month, then single days
+    """
+    def whole_month(day):
+        start, end = _month_bounds(day)
+        return start >= start_bound and end <= end_bound
+
+    cover = []
+    i = 0
+    while i < len(days):
+        day = days[i]
+        if whole_month(day):
+            level = SummaryNode.LEVEL_MONTH
+            start, end = _month_bounds(day)
+        else:
+            start, end = _week_bounds(day)
+            if start >= start_bound and end <= end_bound and not whole_month(start) and not whole_month(end):
+                level = SummaryNode.LEVEL_WEEK
+            else:
+                level, start, end = SummaryNode.LEVEL_DAY, day, day
+        j = i
+        while j < len(days) and days[j] <= end:
+            j += 1
+        cover.append((level, start, end, days[i:j]))
+        i = j
+    return cover
+
+
+def _node(level, start, end, node_days, by_day, day_hashes):
+    if level == SummaryNode.LEVEL_DAY:
+        node_hash = day_hashes[start]
+    else:
+        node_hash = content_hash([level] + [day_hashes[day] for day in node_days])
+    return {
+        'level': level,
+        'period_start': start,
+        'period_end': end,
+        'days': node_days,
+        'content_hash': node_hash,
+        'message_count': sum(len(by_day[day]) for day in node_days),
+        'summary': None,
+        'cached': False,
+        'fallback': False,
+    }
+
+
+def day_prompt(day_messages):
+    """Prompt for one day's summary node"""
+    return DAY_PROMPT + build_chat_context(day_messages, SUMMARY_PROMPT_TOKEN_BUDGET, include_dates=False)[0]
+
+
+def load_nodes(nodes, group_name=None):
+    """Fill in the summaries of group_name's nodes that are already stored"""
+    hashes = list({node['content_hash'] for node in nodes})
+    stored = {}
+    try:
+        for i in range(0, len(hashes), 500):
+            for level, start, node_hash, summary in SummaryNode.objects.filter(
+                group_name=group_name or '', content_hash__in=hashes[i:i + 500],
+            ).values_list('level', 'period_start', 'content_hash', 'summary'):
+                stored[(level, start, node_hash)] = summary
+    except Exception as e:
+        logger.warning(f"Summary node lookup failed: {e}")
+    for node in nodes:
+        summary = stored.get((node['level'], node['period_start'], node['content_hash']))
+        if summary is not None:
+            node['summary'] = summary
+            node['cached'] = True
+
+
+def store_nodes(nodes, group_name=None):
+    try:
+        SummaryNode.objects.bulk_create([
+            SummaryNode(
+                group_name=group_name or '',
+                level=node['level'],
+                period_start=node['period_start'],
+                period_end=node['period_end'],
+                content_hash=node['content_hash'],
+                summary=node['summary'],
+                message_count=node['message_count'],
+            )
+            for node in nodes
+        ], batch_size=500, ignore_conflicts=True)
+    except Exception as e:
+        logger.warning(f"Summary node write failed: {e}")
+
+
+def drop_nodes(group_name):
+    SummaryNode.objects.filter(group_name=group_name).delete()
+
+
+def _generate(nodes, make_prompt, summarize, fallback, deadline, group_name):
+    """
+    Summarise nodes concurrently. A node whose call fails, or that is still
+    running at the deadline, gets fallback(node) and is not stored.
+    Returns (nodes the model summarised, nodes that fell back).
+    """
+    def failed(node, error):
+        logger.error(f"Summary of {node['level']} {node['period_start']} failed: {error}")
+        return None
+
+    results = dispatch(
+        nodes, lambda node: summarize(make_prompt(node)), on_error=failed,
+        concurrency=SUMMARY_CONCURRENCY, deadline=deadline,
+    )
+    fresh = []
+    summarised = 0
+    for node, summary in zip(nodes, results):
+        if summary:
+            summarised += 1
+            node['summary'] = summary
+            if not node['fallback']:
+                fresh.append(node)
+        else:
+            node['summary'] = fallback(node)
+            node['fallback'] = True
+    if fresh:
+        store_nodes(fresh, group_name)
+    return summarised, len(nodes) - summarised
+
+
+def _fit_sections(sections, token_budget):
+    """
+    Join (label, summary) sections for a merge prompt. When the whole would
+    exceed token_budget, each summary keeps the leading lines that fit in
+    an equal share of the budget.
+    """
+    text = "\n\n".join(f"{label}:\n{summary}" for label, summary in sections)
+    if count_tokens(text) <= token_budget:
+        return text
+    share = max(1, token_budget // len(sections))
+    parts = []
+    for label, summary in sections:
+        lines = summary.splitlines()
+        kept = []
+        used = count_tokens(label) + 2
+        for line in lines:
+            cost = count_tokens(line) + 1
+            if used + cost > share:
+                break
+            kept.append(line)
+            used += cost
+        if not kept and lines:
+            # Roughly four characters per token
+            kept = [lines[0][:max(1, share - used) * 4]]
+        parts.append(f"{label}:\n" + "\n".join(kept))
+    return "\n\n".join(parts)
+
+
+def summarize_range(messages, summarize, fallback, start_date_str=None, end_date_str=None, deadline=None,
+                    group_name=None):
+    """
+    Summaries of the fewest day/week/month periods covering messages, in date order.
+
+    summarize(prompt) returns summary text and raises when the model fails
+    (rate-limited calls are retried first); fallback(messages) returns the
+    local summary used instead.
+    start_date_str/end_date_str are the requested range, so periods cut by
+    it are not treated as whole. Day nodes still unfinished after
+    SUMMARY_TREE_MAP_SHARE of the time to deadline (a time.monotonic()
+    value), and merges unfinished at deadline, get the fallback. Nodes are
+    stored under group_name. Each entry has level, period_start, period_end,
+    label, summary, message_count and cached.
+    """
+    started = time.time()
+    by_day = defaultdict(list)
+    for msg in messages:
+        timestamp = parse_timestamp(msg['timestamp'])
+        if timestamp:
+            by_day[timestamp.date()].append(msg)
+    days = sorted(by_day)
+    if not days:
+        return []
+    start_bound = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else date.min
+    end_bound = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else date.max
+    day_hashes = {day: day_hash(by_day[day]) for day in days}
+
+    def node_messages(node):
+        return [msg for day in node['days'] for msg in by_day[day]]
+
+    def fallback_node(node):
+        return fallback(node_messages(node))
+
+    nodes = [_node(*period, by_day, day_hashes) for period in plan_cover(days, start_bound, end_bound)]
+    load_nodes(nodes, group_name)
+
+    # Months reuse stored summaries of the whole weeks inside them
+    unbuilt = [node for node in nodes if node['summary'] is None]
+    week_candidates = []
+    for node in unbuilt:
+        if node['level'] != SummaryNode.LEVEL_MONTH:
+            continue
+        week_days = defaultdict(list)
+        for day in node['days']:
+            week_days[_week_bounds(day)].append(day)
+        for (start, end), node_days in week_days.items():
+            if start >= node['period_start'] and end <= node['period_end']:
+                week_candidates.append(_node(SummaryNode.LEVEL_WEEK, start, end, node_days, by_day, day_hashes))
+    load_nodes(week_candidates, group_name)
+    stored_weeks = {week['period_start']: week for week in week_candidates if week['summary'] is not None}
+
+    def stored_week(node, day):
+        if node['level'] != SummaryNode.LEVEL_MONTH:
+            return None
+        return stored_weeks.get(_week_bounds(day)[0])
+
+    # Map: day summaries for every period that still has to be built
+    needed_days = sorted({day for node in unbuilt for day in node['days'] if stored_week(node, day) is None})
+    day_nodes = {
+        day: _node(SummaryNode.LEVEL_DAY, day, day, [day], by_day, day_hashes)
+        for day in needed_days
+    }
+    load_nodes(list(day_nodes.values()), group_name)
+    missing_days = [node for node in day_nodes.values() if node['summary'] is None]
+    # The map stage leaves the rest of the time for the merges
+    map_deadline = None
+    if deadline is not None:
+        map_deadline = time.monotonic() + max(0.0, deadline - time.monotonic()) * SUMMARY_TREE_MAP_SHARE
+    calls, failures = _generate(
+        missing_days,
+        lambda node: day_prompt(node_messages(node)),
+        summarize, fallback_node, map_deadline, group_name,
+    )
+
+    def children_of(node):
+        """Day and stored week nodes a period is reduced from, in date order"""
+        children = []
+        for day in node['days']:
+            child = stored_week(node, day) or day_nodes[day]
+            if not children or children[-1] is not child:
+                children.append(child)
+        return children
+
+    # Reduce: weeks and months from their children's summaries
+    merges = []
+    for node in unbuilt:
+        node['children'] = children_of(node)
+        node['fallback'] = any(child['fallback'] for child in node['children'])
+        if len(node['children']) == 1:
+            # Nothing to merge; a one-day period reads the same as its day
+            node['summary'] = node['children'][0]['summary']
+            if node['level'] != SummaryNode.LEVEL_DAY and not node['fallback']:
+                store_nodes([node], group_name)
+        else:
+            merges.append(node)
+    merge_calls, merge_failures = _generate(
+        merges,
+        lambda node: MERGE_PROMPT.format(label=_label(node['level'], node['period_start'])) + _fit_sections(
+            [(_label(child['level'], child['period_start']), child['summary']) for child in node['children']],
+            SUMMARY_PROMPT_TOKEN_BUDGET,
+        ),
+        summarize, fallback_node, deadline, group_name,
+    )
+
+    logger.info(
+        f"Range summary from {len(nodes)} nodes ({sum(node['cached'] for node in nodes)} cached, "
+        f"{len(stored_weeks)} stored weeks reused) with {calls + merge_calls} model summaries "
+        f"({failures + merge_failures} fell back) in {time.time() - started:.2f}s"
+    )
+    return [
+        {
+            'level': node['level'],
+            'period_start': node['period_start'].isoformat(),
+            'period_end': node['period_end'].isoformat(),
+            'label': _label(node['level'], node['period_start']),
+            'summary': node['summary'],
+            'message_count': node['message_count'],
+            'cached': node['cached'],
+        }
+        for node in nodes
+    ]
@@ -1 +1,1445 @@
-from django.test import TestCase
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import Client, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .event_classifier import classify_line, classify_messages, split_targets
+from .group_event import get_event_counts, get_top_removers
+from . import jobs, llm_dispatch, llm_gateway, sentiment_analyzer, summary_generator, views
+from .management.commands.benchmark_http_client import RESPONSE, StandInHandler
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .event_index import decode_cursor, encode_cursor, page_events, query_events, to_epoch
+from .heavy_hitters import SpaceSaving, keyword_options
+from .message_dedup import group_duplicates, is_placeholder, normalize_text
+from .http_client import HttpClient, get_client
+from .local_summary import local_summary, rank_sentences
+from .prompt_builder import build_chat_context, compress_messages
+from .sentiment_estimate import proportion_interval, required_sample_size, select_sample, z_score
+from .sentiment_rollup import record_rollups, rollup_sentiment, uncovered_ranges
+from .sentiment_format import compact_sentiment_result, format_sentiment_result
+from .token_utils import count_tokens, plan_batches
+from .utils import parse_timestamp
+from .models import AnalysisJob, GroupEvent, LLMResponse, SummaryNode
+from .membership import DAY_SECONDS, build_membership, member_count_at, member_count_series, members_at
+from .summary_tree import drop_nodes, plan_cover
+
+
+# Real system-line shapes seen in Android and iOS exports:
+# (body, event_type, actor, target)
+SYSTEM_LINE_CORPUS = [
+    ('Sf Anand Kuyate Field added ~ Jay Hari', 'added', 'Sf Anand Kuyate Field', '~ Jay Hari'),
+    ('You added Mr Azan Marchand', 'added', 'You', 'Mr Azan Marchand'),
+    ('Sf Kalpanjay Nathe added Far Ganesh Nimba Deore - Vajgoan, (D)', 'added', 'Sf Kalpanjay Nathe', 'Far Ganesh Nimba Deore - Vajgoan, (D)'),
+    ('Sf Arra Abhi Medhane added Arra Rushikesh Uphade, Sf Kapil Medhane, and ~ Shubham Takate', 'added', 'Sf Arra Abhi Medhane', 'Arra Rushikesh Uphade, Sf Kapil Medhane, and ~ Shubham Takate'),
+    ('Priya added you', 'added', 'Priya', 'you'),
+    ('+91 98220 12345 joined using this group\'s invite link', 'added', '+91 98220 12345', '+91 98220 12345'),
+    ('Ravi joined using this group’s invite link', 'added', 'Ravi', 'Ravi'),
+    ('Far Chintaman Popat More - Jalkhed left', 'left', 'Far Chintaman Popat More - Jalkhed', None),
+    ('+91 99210 29212 left', 'left', '+91 99210 29212', None),
+    ('~ Jay Hari left', 'left', '~ Jay Hari', None),
+    ('You left', 'left', 'You', None),
+    ('Meera exited', 'left', 'Meera', None),
+    ('You removed Sf Akash Rahare FFC - Jopul', 'removed', 'You', 'Sf Akash Rahare FFC - Jopul'),
+    ('Admin removed you', 'removed', 'Admin', 'you'),
+    ('Ravi changed the subject from "Old Name" to "Grape Growers 2024"', 'changed_subject', 'Ravi', None),
+    ('You changed the subject to "Sahyadri ARRA-15"', 'changed_subject', 'You', None),
+    ('Ravi changed the subject from “A” to “B”', 'changed_subject', 'Ravi', None),
+    ('Ravi changed this group\'s icon', 'changed_icon', 'Ravi', None),
+    ('You deleted this group\'s icon', 'changed_icon', 'You', None),
+    ('Ravi created group "Sahyadri Farmers"', 'created', 'Ravi', None),
+    ('You created group “Test”', 'created', 'You', None),
+]
+
+NOT_EVENTS = [
+    'Messages and calls are end-to-end encrypted. Only people in this chat can read, listen to, or share them. Learn more.',
+    'Your security code with Ravi changed. Tap to learn more.',
+    'Ravi changed their phone number to a new number. Tap to message or add the new number.',
+    'This message was deleted',
+    '<Media omitted>',
+]
+
+
+class EventClassifierTests(SimpleTestCase):
+    def test_system_line_corpus(self):
+        for body, event_type, actor, target in SYSTEM_LINE_CORPUS:
+            with self.subTest(body=body):
+                event = classify_line(body, '1/2/23, 9:05 PM')
+                self.assertIsNotNone(event)
+                self.assertEqual(event['event_type'], event_type)
+                self.assertEqual(event['actor'], actor)
+                self.assertEqual(event['target'], target)
+                self.assertEqual(event['timestamp'], '1/2/23, 9:05 PM')
+
+    def test_subject_is_extracted(self):
+        event = classify_line('Ravi changed the subject from "Old" to "New Name"')
+        self.assertEqual(event['details'], 'New subject: New Name')
+
+    def test_non_events_are_ignored(self):
+        for body in NOT_EVENTS:
+            with self.subTest(body=body):
+                self.assertIsNone(classify_line(body))
+
+    def test_android_continuation_lines(self):
+        messages = [{
+            'timestamp': '11/14/22, 8:10 PM',
+            'sender': 'Sf Sachin Waluj',
+            'message': 'Spray schedule attached\n'
+                       '11/14/22, 8:16 PM - Sf Anand Kuyate Field added ~ Jay Hari\n'
+                       '11/17/22, 8:28 PM - Far Chintaman Popat More - Jalkhed left',
+        }]
+        events = classify_messages(messages)
+        self.assertEqual([e['event_type'] for e in events], ['added', 'left'])
+        self.assertEqual(events[0]['timestamp'], '11/14/22, 8:16 PM')
+        self.assertEqual(events[1]['actor'], 'Far Chintaman Popat More - Jalkhed')
+        self.assertEqual(events[1]['raw_message'], 'Far Chintaman Popat More - Jalkhed left')
+
+    def test_ios_system_message(self):
+        messages = [{'timestamp': '1/2/23, 9:05:11 PM', 'sender': 'Farmers', 'message': '\u200eRavi added Priya'}]
+        events = classify_messages(messages)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['target'], 'Priya')
+
+    def test_regular_chat_text_is_not_an_event(self):
+        messages = [
+            {'timestamp': '1/2/23, 9:05 PM', 'sender': 'Ravi', 'message': 'I added fertilizer and left early'},
+            {'timestamp': '1/2/23, 9:06 PM', 'sender': 'Priya', 'message': 'Who removed the old pipes?'},
+        ]
+        self.assertEqual(classify_messages(messages), [])
+
+    def test_counts_and_top_removers(self):
+        messages = [{
+            'timestamp': '1/1/23, 9:00 AM',
+            'sender': 'Ravi',
+            'message': 'hello\n'
+                       '1/2/23, 9:05 AM - Admin removed A\n'
+                       '1/2/23, 9:06 AM - Admin removed B\n'
+                       '1/3/23, 9:06 AM - Ravi removed C',
+        }]
+        events = classify_messages(messages)
+        self.assertEqual(get_event_counts(events)['removed'], 3)
+        self.assertEqual(get_top_removers(events), [{'user': 'Admin', 'count': 2}, {'user': 'Ravi', 'count': 1}])
+
+    def test_split_targets(self):
+        self.assertEqual(
+            split_targets('Arra Rushikesh Uphade, Sf Kapil Medhane, and ~ Shubham Takate'),
+            ['Arra Rushikesh Uphade', 'Sf Kapil Medhane', '~ Shubham Takate'],
+        )
+        self.assertEqual(split_targets('Priya and Ravi'), ['Priya', 'Ravi'])
+
+
+class SpaceSavingTests(SimpleTestCase):
+    def test_counts_stay_within_error_bound(self):
+        rng = random.Random(7)
+        # Zipf-like stream: a few heavy words and a long tail
+        vocabulary = [f"w{i}" for i in range(500)]
+        weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+        stream = rng.choices(vocabulary, weights, k=20000)
+        summary = SpaceSaving.from_error_rate(0.01)
+        summary.update(stream)
+        truth = Counter(stream)
+        bound = summary.stream_length / summary.capacity
+
+        self.assertEqual(summary.capacity, 100)
+        self.assertLessEqual(len(summary.most_common()), summary.capacity)
+        for item, count, error in summary.most_common():
+            with self.subTest(item=item):
+                self.assertGreaterEqual(count, truth[item])
+                self.assertLessEqual(count - truth[item], error)
+                self.assertLessEqual(error, bound)
+        tracked = {item for item, _, _ in summary.most_common()}
+        for item, count in truth.items():
+            if count > bound:
+                self.assertIn(item, tracked)
+
+    def test_eviction_replaces_a_minimum_counter(self):
+        summary = SpaceSaving(2)
+        summary.update(['a', 'a', 'b', 'c'])
+        # 'b' held the minimum count (1), so 'c' takes over its counter
+        self.assertEqual(summary.most_common(), [('a', 2, 0), ('c', 2, 1)])
+        # Both counters now hold 2; either may be evicted for 'b'
+        summary.add('b')
+        counts = {item: (count, error) for item, count, error in summary.most_common()}
+        self.assertEqual(counts['b'], (3, 2))
+        self.assertEqual(len(counts), 2)
+        self.assertEqual(len(counts.keys() & {'a', 'c'}), 1)
+        self.assertEqual(summary.metadata()['max_overestimate'], 2)
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            SpaceSaving(0)
+        for rate in (0, 1, 1.5):
+            with self.assertRaises(ValueError):
+                SpaceSaving.from_error_rate(rate)
+
+    def test_keyword_options(self):
+        self.assertEqual(keyword_options(None, None), (None, None))
+        self.assertEqual(keyword_options('approximate', '0.01'), ('approximate', 0.01))
+        for mode, rate in (('fuzzy', None), ('exact', 0), ('exact', 1), ('exact', 'x')):
+            with self.assertRaises(ValueError):
+                keyword_options(mode, rate)
+
+
+def _epoch(text):
+    return to_epoch(datetime.strptime(text, '%Y-%m-%d %H:%M'))
+
+
+class MembershipTimelineTests(TestCase):
+    group = 'Farmers'
+
+    def setUp(self):
+        events = [
+            SimpleNamespace(epoch=_epoch('2023-01-02 09:00'), event_type='added', actor='Ravi', target='Priya'),
+            SimpleNamespace(epoch=_epoch('2023-01-02 18:00'), event_type='left', actor='Priya', target=None),
+            SimpleNamespace(epoch=_epoch('2023-01-04 12:00'), event_type='added', actor='Ravi', target='Amit and Meera'),
+        ]
+        # Ravi posts before any event, so he was already a member
+        messages = [{'timestamp': '2023-01-01, 10:00', 'sender': 'Ravi', 'message': 'Good morning'}]
+        self.stats = build_membership(self.group, events, messages, to_epoch)
+
+    def test_members_at(self):
+        def names(text):
+            return [interval.member for interval in members_at(self.group, _epoch(text))]
+
+        self.assertEqual(names('2023-01-01 12:00'), ['Ravi'])
+        self.assertEqual(names('2023-01-02 12:00'), ['Priya', 'Ravi'])
+        self.assertEqual(names('2023-01-02 18:00'), ['Ravi'])
+        self.assertEqual(names('2023-01-05 00:00'), ['Amit', 'Meera', 'Ravi'])
+
+    def test_member_count_at(self):
+        self.assertEqual(member_count_at(self.group, _epoch('2023-01-01 09:00')), 0)
+        self.assertEqual(member_count_at(self.group, _epoch('2023-01-02 12:00')), 2)
+        self.assertEqual(member_count_at(self.group, _epoch('2023-01-03 00:00')), 1)
+        self.assertEqual(member_count_at(self.group, _epoch('2023-01-04 12:00')), 3)
+
+    def test_series_has_one_point_per_day(self):
+        self.assertEqual(member_count_series(self.group), [
+            (_epoch('2023-01-01 10:00'), 1),
+            (_epoch('2023-01-02 18:00'), 1),
+            (_epoch('2023-01-04 12:00'), 3),
+        ])
+
+    def test_series_collapses_carried_in_point(self):
+        # The count carried in at midnight and the changes that day make one point
+        series = member_count_series(self.group, start_epoch=_epoch('2023-01-02 00:00'))
+        self.assertEqual(series, [(_epoch('2023-01-02 18:00'), 1), (_epoch('2023-01-04 12:00'), 3)])
+        days = [epoch // DAY_SECONDS for epoch, _ in series]
+        self.assertEqual(len(days), len(set(days)))
+
+        series = member_count_series(self.group, start_epoch=_epoch('2023-01-03 00:00'), end_epoch=_epoch('2023-01-03 23:59'))
+        self.assertEqual(series, [(_epoch('2023-01-03 00:00'), 1)])
+
+    def test_tenure_stats(self):
+        self.assertEqual(self.stats['current_members'], 3)
+        self.assertEqual(self.stats['distinct_members'], 4)
+        self.assertEqual(self.stats['departures'], 1)
+        self.assertEqual(self.stats['completed_tenure']['max_days'], 0.38)
+
+
+class EventPagingTests(TestCase):
+    group = 'Farmers'
+
+    def setUp(self):
+        base = _epoch('2023-01-01 09:00')
+        # Pairs of rows share an epoch so pages have to break ties on id
+        GroupEvent.objects.bulk_create([
+            GroupEvent(
+                group_name=self.group, epoch=base + (i // 2) * 60, day=datetime(2023, 1, 1).date(),
+                event_type='joined', actor=f'member{i}', timestamp='2023-01-01, 09:00',
+            )
+            for i in range(11)
+        ])
+        GroupEvent.objects.create(
+            group_name='Other', epoch=base, day=datetime(2023, 1, 1).date(), event_type='joined',
+            actor='outsider', timestamp='2023-01-01, 09:00',
+        )
+        self.qs = query_events(self.group)
+
+    def _walk(self, page_size, descending=False):
+        pages, cursor = [], None
+        while True:
+            rows, cursor = page_events(self.qs, cursor=cursor, page_size=page_size, descending=descending)
+            pages.append([row['id'] for row in rows])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_row_once(self):
+        expected = list(self.qs.values_list('id', flat=True))
+        for page_size in (1, 2, 3, 4, 11, 50):
+            pages = self._walk(page_size)
+            self.assertEqual([row_id for page in pages for row_id in page], expected)
+            self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+
+    def test_descending_pages(self):
+        expected = list(self.qs.order_by('-epoch', '-id').values_list('id', flat=True))
+        pages = self._walk(3, descending=True)
+        self.assertEqual([row_id for page in pages for row_id in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        rows, cursor = page_events(self.qs, page_size=11)
+        self.assertEqual(len(rows), 11)
+        self.assertIsNone(cursor)
+        rows, cursor = page_events(self.qs, page_size=10)
+        self.assertIsNotNone(cursor)
+        rows, cursor = page_events(self.qs, cursor=cursor, page_size=10)
+        self.assertEqual(len(rows), 1)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip(self):
+        for epoch, row_id in ((0, 1), (1672563600, 42), (-86400, 7), (2 ** 40, 10 ** 9)):
+            cursor = encode_cursor(epoch, row_id)
+            self.assertNotIn('=', cursor)
+            self.assertEqual(decode_cursor(cursor), (epoch, row_id))
+
+    def test_malformed_cursor(self):
+        for cursor in ('', 'not a cursor', encode_cursor(1, 2)[:-2], 'MTp4'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+        with self.assertRaises(ValueError):
+            page_events(self.qs, cursor='%%%')
+
+
+class PlanCoverTests(SimpleTestCase):
+    DAY, WEEK, MONTH = SummaryNode.LEVEL_DAY, SummaryNode.LEVEL_WEEK, SummaryNode.LEVEL_MONTH
+
+    def test_unbounded_days_fall_in_months(self):
+        days = [date(2023, 1, 31), date(2023, 2, 1), date(2023, 2, 28)]
+        self.assertEqual(plan_cover(days), [
+            (self.MONTH, date(2023, 1, 1), date(2023, 1, 31), [date(2023, 1, 31)]),
+            (self.MONTH, date(2023, 2, 1), date(2023, 2, 28), [date(2023, 2, 1), date(2023, 2, 28)]),
+        ])
+        self.assertEqual(plan_cover([]), [])
+
+    def test_bounded_range_mixes_levels(self):
+        # Mon 2023-02-20 to Wed 2023-04-05: March is whole, Feb 20-26 is a whole week
+        days = [date(2023, 2, d) for d in (20, 22, 27)] + [date(2023, 3, d) for d in (1, 15, 31)]
+        days += [date(2023, 4, 1), date(2023, 4, 4)]
+        cover = plan_cover(days, date(2023, 2, 20), date(2023, 4, 5))
+        self.assertEqual(cover, [
+            (self.WEEK, date(2023, 2, 20), date(2023, 2, 26), [date(2023, 2, 20), date(2023, 2, 22)]),
+            # Feb 27 - Mar 5 reaches into whole March, so its days stay single
+            (self.DAY, date(2023, 2, 27), date(2023, 2, 27), [date(2023, 2, 27)]),
+            (self.MONTH, date(2023, 3, 1), date(2023, 3, 31), [date(2023, 3, d) for d in (1, 15, 31)]),
+            (self.DAY, date(2023, 4, 1), date(2023, 4, 1), [date(2023, 4, 1)]),
+            # Apr 3-9 runs past the end bound
+            (self.DAY, date(2023, 4, 4), date(2023, 4, 4), [date(2023, 4, 4)]),
+        ])
+        self.assertEqual([day for *_, node_days in cover for day in node_days], days)
+
+    def test_partial_week_is_days(self):
+        days = [date(2023, 6, 6), date(2023, 6, 7)]
+        cover = plan_cover(days, date(2023, 6, 6), date(2023, 6, 11))
+        self.assertEqual([level for level, *_ in cover], [self.DAY, self.DAY])
+        cover = plan_cover(days, date(2023, 6, 5), date(2023, 6, 11))
+        self.assertEqual(cover, [(self.WEEK, date(2023, 6, 5), date(2023, 6, 11), days)])
+
+
+class _CountingEvent(threading.Event):
+    """Event that lets a test wait until a number of threads are blocked on it"""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiting.release()
+        return super().wait(timeout)
+
+
+@mock.patch.object(llm_gateway, 'LLM_SINGLE_FLIGHT', True)
+class SingleFlightTests(SimpleTestCase):
+    model_name = 'test-single-flight'
+    followers = 4
+
+    def _run(self, answer):
+        """Start a leader blocked in its transport, then followers; returns (calls, results) once all finish"""
+        prompt = f'prompt for {self.id()}'
+        started, release = threading.Event(), threading.Event()
+        calls = []
+        results = {}
+
+        def transport(prompt, timeout):
+            calls.append(prompt)
+            started.set()
+            release.wait(5)
+            return answer()
+
+        def worker(name):
+            try:
+                results[name] = llm_gateway.generate(prompt, call=transport, model_name=self.model_name, use_cache=False)
+            except Exception as e:
+                results[name] = e
+
+        leader = threading.Thread(target=worker, args=('leader',))
+        leader.start()
+        self.assertTrue(started.wait(5))
+        key = llm_gateway.cache_key(self.model_name, prompt)
+        with llm_gateway._flights_lock:
+            flight = llm_gateway._flights[key]
+            flight.done = _CountingEvent()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.followers)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            self.assertTrue(flight.done.waiting.acquire(timeout=5))
+        release.set()
+        for thread in [leader] + threads:
+            thread.join(5)
+        self.assertNotIn(key, llm_gateway._flights)
+        return calls, results
+
+    def test_followers_share_the_leaders_response(self):
+        coalesced = llm_gateway._stats['coalesced']
+        calls, results = self._run(lambda: 'shared answer')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), self.followers + 1)
+        self.assertEqual(set(results.values()), {'shared answer'})
+        self.assertEqual(llm_gateway._stats['coalesced'] - coalesced, self.followers)
+
+    def test_followers_get_the_leaders_error(self):
+        def fail():
+            raise RuntimeError('model unavailable')
+
+        calls, results = self._run(fail)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), self.followers + 1)
+        for result in results.values():
+            self.assertIsInstance(result, RuntimeError)
+            self.assertEqual(str(result), 'model unavailable')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('chatapp.circuit_breaker.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(
+            'test', window_seconds=60, min_calls=4, error_rate=0.5, slow_call_seconds=10,
+            slow_call_rate=0.5, open_seconds=30, half_open_probes=2,
+        )
+
+    def _call(self, ok=True, latency=0.1):
+        probe = self.breaker.allow()
+        self.breaker.record(ok, latency, probe)
+        return probe
+
+    def _trip(self):
+        for ok in (True, False, True, False):
+            self._call(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_stays_closed_below_thresholds(self):
+        for ok in (False, False, False):
+            self._call(ok)
+        # Too few calls in the window to judge
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.now += 61
+        for ok in (True, False, True, True, True):
+            self._call(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_old_calls_leave_the_window(self):
+        for _ in range(3):
+            self._call(False)
+        self.now += 61
+        for _ in range(3):
+            self._call(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.snapshot()['calls'], 3)
+
+    def test_error_rate_opens_and_rejects(self):
+        self._trip()
+        self.now += 12
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.allow()
+        self.assertAlmostEqual(raised.exception.retry_in, 18)
+        self.assertEqual(self.breaker.snapshot()['retry_in'], 18)
+
+    def test_slow_calls_open(self):
+        for latency in (0.1, 12, 0.1, 15):
+            self._call(True, latency)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_limits_probes(self):
+        self._trip()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.allow()
+        # An abandoned probe frees its slot
+        self.breaker.release(True)
+        self.assertTrue(self.breaker.allow())
+
+    def test_successful_probe_closes(self):
+        self._trip()
+        self.now += 30
+        self.assertTrue(self._call(True))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.snapshot()['calls'], 0)
+
+    def test_failed_or_slow_probe_reopens(self):
+        self._trip()
+        self.now += 30
+        self._call(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.allow()
+
+        self.now += 30
+        self._call(True, latency=11)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 29
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.allow()
+
+
+class SentimentDeadlineTests(TestCase):
+
+    def setUp(self):
+        self.messages = [
+            {'timestamp': '2023-03-01, 10:00', 'sender': 'Ravi', 'message': 'Great harvest this year, thank you all'},
+            {'timestamp': '2023-03-01, 10:05', 'sender': 'Priya', 'message': 'The seeds arrived late and damaged'},
+            {'timestamp': '2023-03-02, 09:00', 'sender': 'Amit', 'message': 'Meeting moved to Friday'},
+        ]
+        self.model = mock.Mock(model_name='test-sentiment-deadline')
+        patcher = mock.patch.object(sentiment_analyzer, 'model', self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_past_deadline_falls_back_without_a_model_call(self):
+        result = sentiment_analyzer.analyze_sentiment(self.messages, engine='llm', deadline=time.monotonic() - 1)
+        self.model.generate_content.assert_not_called()
+        self.assertEqual(result['total_analyzed'], len(self.messages))
+        self.assertEqual(sum(result['overall_sentiment'].values()), len(self.messages))
+        for message in result['all_messages_with_sentiment']:
+            self.assertTrue(message['reason'].startswith('Fallback analysis'))
+        metadata = result['analysis_metadata']
+        self.assertEqual(metadata['failed_batches'], metadata['batching']['planned_batches'])
+        self.assertEqual(metadata['api_calls_made'], 0)
+        # Fallback labels are not cached, so a later request can still reach the model
+        self.assertEqual(sentiment_analyzer.load_cached_results(
+            [sentiment_analyzer.message_key(m) for m in self.messages], sentiment_analyzer.SENTIMENT_MODEL_VERSION,
+        ), {})
+
+    def test_stream_past_deadline_completes(self):
+        events = list(sentiment_analyzer.stream_sentiment(
+            self.messages, engine='llm', deadline=time.monotonic() - 1,
+        ))
+        self.model.generate_content.assert_not_called()
+        self.assertEqual(events[0][0], 'start')
+        self.assertEqual(events[-1][0], 'complete')
+        self.assertEqual(events[-1][1]['total_analyzed'], len(self.messages))
+
+
+class SentimentEngineTests(TestCase):
+
+    def setUp(self):
+        self.messages = [
+            {'timestamp': '2023-03-01, 10:00', 'sender': 'Ravi', 'message': 'Great harvest, thank you all, very happy'},
+            {'timestamp': '2023-03-02, 10:05', 'sender': 'Priya', 'message': 'Terrible service, the seeds were bad'},
+        ]
+        self.model = mock.Mock(model_name='test-sentiment-engine')
+        patcher = mock.patch.object(sentiment_analyzer, 'model', self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_engine_makes_no_model_call(self):
+        result = sentiment_analyzer.analyze_sentiment(self.messages, engine='local')
+        self.model.generate_content.assert_not_called()
+        self.assertEqual(result['analysis_metadata']['api_calls_made'], 0)
+        self.assertEqual(result['analysis_metadata']['tiering']['local_classified'], 2)
+        insights = result['gemini_insights']
+        self.assertEqual(
+            set(insights), {'communication_style', 'mood_patterns', 'key_findings', 'recommendations', 'top_emotions'},
+        )
+        self.assertIn('of 2 messages', insights['communication_style'])
+
+    def test_unknown_engine_is_rejected(self):
+        self.assertIsNone(sentiment_analyzer.sentiment_engine(''))
+        self.assertEqual(sentiment_analyzer.sentiment_engine('tiered'), 'tiered')
+        with self.assertRaises(ValueError):
+            sentiment_analyzer.analyze_sentiment(self.messages, engine='foo')
+        self.model.generate_content.assert_not_called()
+
+        client = Client(HTTP_HOST='localhost')
+        for url, body in (
+            ('/sentiment/', {'group_name': 'Farmers', 'engine': 'foo'}),
+            ('/sentiment/stream/', {'group_name': 'Farmers', 'engine': 'foo'}),
+            ('/api/jobs/submit/', {'kind': 'sentiment', 'params': {'group_name': 'Farmers', 'engine': 'foo'}}),
+        ):
+            response = client.post(url, json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json()['error'], 'Unknown engine: foo')
+
+
+class SummaryTreeUseTests(SimpleTestCase):
+
+    def setUp(self):
+        self.messages = [
+            {'timestamp': f'2023-03-{day:02d}, 10:00', 'sender': f'member{day % 3}',
+             'message': f'Update for day {day}: the irrigation schedule and fertiliser orders were discussed'}
+            for day in range(1, 21)
+        ]
+        self.generate = mock.Mock(return_value='- short summary')
+        self.summarize_range = mock.Mock(return_value=[])
+        for name, value in (('llm_generate', self.generate), ('summarize_range', self.summarize_range)):
+            patcher = mock.patch.object(summary_generator, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_chat_that_fits_the_prompt_makes_one_call(self):
+        summary_generator.generate_total_summary(self.messages)
+        summary_generator.generate_brief_summary(self.messages)
+        self.summarize_range.assert_not_called()
+        self.assertEqual(self.generate.call_count, 2)
+
+    @mock.patch.object(summary_generator, 'SUMMARY_PROMPT_TOKEN_BUDGET', 40)
+    def test_tree_leaves_the_final_call_its_reserve(self):
+        summary_generator.generate_total_summary(self.messages, deadline_seconds=90)
+        self.summarize_range.assert_called_once()
+        tree_deadline = self.summarize_range.call_args.args[5]
+        final_deadline = self.generate.call_args.kwargs['deadline']
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertAlmostEqual(final_deadline - tree_deadline, summary_generator.SUMMARY_FINAL_CALL_RESERVE_SECONDS)
+
+        # A short deadline is split in half rather than leaving the tree no time
+        summary_generator.generate_total_summary(self.messages, deadline_seconds=20)
+        tree_deadline = self.summarize_range.call_args.args[5]
+        final_deadline = self.generate.call_args.kwargs['deadline']
+        self.assertAlmostEqual(final_deadline - tree_deadline, 10, places=2)
+
+
+@mock.patch.object(llm_dispatch, 'backoff_delay', lambda attempt: 0)
+class SummaryBucketRetryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.buckets = [('2023-03-06', [
+            {'timestamp': '2023-03-06, 10:00', 'sender': 'Ravi', 'message': 'Tractor service booked for Friday'},
+        ])]
+
+    def _summarize(self, generate):
+        with mock.patch.object(summary_generator, 'llm_generate', generate):
+            return summary_generator._summarize_buckets(
+                self.buckets, lambda key, messages: f'Summarise {key}', lambda key, messages, summary: {'summary': summary},
+                None, None, 'week of',
+            )
+
+    def test_rate_limited_bucket_is_retried(self):
+        generate = mock.Mock(side_effect=[Exception('429 Resource exhausted'), '* Tractor service booked for Friday'])
+        entries = self._summarize(generate)
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(entries, [{'summary': '* Tractor service booked for Friday'}])
+
+    def test_failed_bucket_falls_back(self):
+        generate = mock.Mock(side_effect=ValueError('bad response'))
+        entries = self._summarize(generate)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(entries, [{'summary': summary_generator.generate_fallback_summary(self.buckets[0][1])}])
+
+    def test_generate_with_gemini_keeps_the_markers(self):
+        for error, marker in ((Exception('429 quota exhausted'), 'QUOTA_EXCEEDED'), (ValueError('boom'), 'API_ERROR')):
+            with mock.patch.object(summary_generator, 'llm_generate', mock.Mock(side_effect=error)):
+                self.assertEqual(summary_generator.generate_with_gemini('prompt'), marker)
+
+
+class SummaryNodeGroupTests(TestCase):
+
+    def setUp(self):
+        self.messages = [
+            {'timestamp': '2023-03-06, 10:00', 'sender': 'Ravi', 'message': 'Tractor service booked for Friday'},
+            {'timestamp': '2023-03-07, 09:30', 'sender': 'Priya', 'message': 'Fertiliser prices went up again'},
+        ]
+        self.generate = mock.Mock(return_value='* Day summary')
+        patcher = mock.patch.object(summary_generator, 'llm_generate', self.generate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _daily(self, group_name):
+        calls = self.generate.call_count
+        summary_generator.generate_daily_user_messages(self.messages, deadline_seconds=None, group_name=group_name)
+        return self.generate.call_count - calls
+
+    def test_nodes_are_kept_per_group(self):
+        self.assertEqual(self._daily('Farmers'), 2)
+        # Identical days in another group are summarised and stored separately
+        self.assertEqual(self._daily('Traders'), 2)
+        self.assertEqual(self._daily('Farmers'), 0)
+        self.assertEqual(SummaryNode.objects.filter(group_name='Farmers').count(), 2)
+        self.assertEqual(SummaryNode.objects.filter(group_name='Traders').count(), 2)
+
+        drop_nodes('Farmers')
+        self.assertFalse(SummaryNode.objects.filter(group_name='Farmers').exists())
+        self.assertEqual(SummaryNode.objects.filter(group_name='Traders').count(), 2)
+        self.assertEqual(self._daily('Farmers'), 2)
+
+
+class JobRecoveryTests(TestCase):
+
+    def _job(self, job_id, status, heartbeat_age=None):
+        heartbeat = None if heartbeat_age is None else timezone.now() - timedelta(seconds=heartbeat_age)
+        return AnalysisJob.objects.create(
+            id=job_id, kind='sentiment', status=status, heartbeat_at=heartbeat,
+            started_at=heartbeat if status == AnalysisJob.STATUS_RUNNING else None,
+        )
+
+    def test_sweep_fails_lapsed_leases_and_returns_queued_jobs(self):
+        self._job('orphan', AnalysisJob.STATUS_QUEUED)
+        self._job('lapsed', AnalysisJob.STATUS_RUNNING, heartbeat_age=jobs.JOB_LEASE_SECONDS + 5)
+        self._job('live', AnalysisJob.STATUS_RUNNING, heartbeat_age=1)
+        self.assertEqual(jobs._recover_interrupted_jobs(), ['orphan'])
+        statuses = dict(AnalysisJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses['lapsed'], AnalysisJob.STATUS_FAILED)
+        self.assertEqual(statuses['live'], AnalysisJob.STATUS_RUNNING)
+
+    def test_each_sweep_queues_a_job_once(self):
+        executor = mock.Mock()
+        with mock.patch.object(jobs, '_get_executor', return_value=executor), mock.patch.object(jobs, '_queued', set()):
+            jobs._submit('orphan')
+            jobs._submit('orphan')
+            executor.submit.assert_called_once_with(jobs._run_job, 'orphan')
+            # Once it has run (or found the job already taken) a later sweep may queue it again
+            jobs._run_job('orphan')
+            jobs._submit('orphan')
+            self.assertEqual(executor.submit.call_count, 2)
+
+    def test_export_job_keeps_the_keyword_error_rate(self):
+        client = Client(HTTP_HOST='localhost')
+        submitted = AnalysisJob(id='export', kind='export')
+        with mock.patch.object(views, 'submit_job', return_value=submitted) as submit:
+            response = client.post('/api/jobs/submit/', json.dumps({'kind': 'export', 'params': {
+                'group_name': 'Farmers', 'keyword_mode': 'approximate', 'keyword_error_rate': '0.01',
+            }}), content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        params = submit.call_args.args[1]
+        self.assertEqual((params['keyword_mode'], params['keyword_error_rate']), ('approximate', 0.01))
+
+        response = client.post('/api/jobs/submit/', json.dumps({'kind': 'export', 'params': {
+            'group_name': 'Farmers', 'keyword_error_rate': '2',
+        }}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class _FakeSentimentModel:
+    """Answers batch sentiment prompts like Gemini and records every message text it was sent"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.sent = []
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        texts = re.findall(r'^Message \d+: (.*)$', prompt, re.MULTILINE)
+        if not texts:
+            # The insights prompt
+            return SimpleNamespace(text=json.dumps({
+                'communication_style': 'Friendly', 'mood_patterns': [], 'key_findings': [], 'recommendations': [],
+            }))
+        self.sent.extend(texts)
+        return SimpleNamespace(text=json.dumps({'results': [
+            dict(self.label(text), message_index=i, confidence=0.9, reason=f'label for {text}')
+            for i, text in enumerate(texts, start=1)
+        ]}))
+
+    @staticmethod
+    def label(text):
+        words = text.lower().split()
+        if 'great' in words:
+            return {'sentiment': 'positive', 'emotion': 'joy', 'emotional_indicators': ['great'], 'polarity_score': 0.5}
+        if 'loss' in words:
+            return {'sentiment': 'negative', 'emotion': 'sadness', 'emotional_indicators': ['loss'], 'polarity_score': -0.5}
+        return {'sentiment': 'neutral', 'emotion': 'neutral', 'emotional_indicators': [], 'polarity_score': 0.0}
+
+
+class _FakeModelTestCase(TestCase):
+    """Sentiment analysis against _FakeSentimentModel, with the LLM response cache off"""
+
+    def setUp(self):
+        self.model = _FakeSentimentModel(f'fake-{self.id()}')
+        for target, name, value in (
+            (sentiment_analyzer, 'model', self.model),
+            (llm_gateway, 'LLM_CACHE_ENABLED', False),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _message(self, minute, text, sender='Ravi'):
+        return {'timestamp': f'2023-03-01, 10:{minute:02d}', 'sender': sender, 'message': text}
+
+
+class SentimentCacheTests(_FakeModelTestCase):
+
+    def test_cached_messages_are_not_sent_again(self):
+        messages = [self._message(0, 'Great harvest'), self._message(1, 'Rain expected tomorrow')]
+        first = sentiment_analyzer.analyze_sentiment(messages, engine='llm')
+        self.assertEqual(sorted(self.model.sent), ['Great harvest', 'Rain expected tomorrow'])
+        self.assertEqual(first['analysis_metadata']['cache_misses'], 2)
+
+        # Widening the range only sends the new message
+        self.model.sent.clear()
+        wider = messages + [self._message(2, 'Market closed on Monday')]
+        second = sentiment_analyzer.analyze_sentiment(wider, engine='llm')
+        self.assertEqual(self.model.sent, ['Market closed on Monday'])
+        metadata = second['analysis_metadata']
+        self.assertEqual((metadata['cache_hits'], metadata['cache_misses']), (2, 1))
+        self.assertEqual(metadata['api_calls_made'], 1)
+        # Two cached messages at this run's one message per batch
+        self.assertEqual(metadata['api_calls_saved'], 2)
+
+        # A repeat run is answered entirely from the cache
+        self.model.sent.clear()
+        third = sentiment_analyzer.analyze_sentiment(wider, engine='llm')
+        self.assertEqual(self.model.sent, [])
+        self.assertEqual(third['analysis_metadata']['cache_hits'], 3)
+        self.assertEqual(third['analysis_metadata']['api_calls_made'], 0)
+        self.assertEqual(third['analysis_metadata']['api_calls_saved'], 1)
+        self.assertEqual(
+            [m['sentiment'] for m in second['all_messages_with_sentiment']], ['positive', 'neutral', 'neutral'],
+        )
+        self.assertEqual(
+            second['all_messages_with_sentiment'][0]['reason'], first['all_messages_with_sentiment'][0]['reason'],
+        )
+
+    def test_key_covers_timestamp_sender_and_text(self):
+        message = self._message(0, 'Great harvest')
+        key = sentiment_analyzer.message_key(message)
+        self.assertEqual(key, sentiment_analyzer.message_key(dict(message)))
+        for field, value in (('timestamp', '2023-03-01, 10:01'), ('sender', 'Priya'), ('message', 'Great harvests')):
+            self.assertNotEqual(key, sentiment_analyzer.message_key(dict(message, **{field: value})))
+
+    def test_labels_are_scoped_by_model_version(self):
+        messages = [self._message(0, 'Great harvest')]
+        sentiment_analyzer.analyze_sentiment(messages, engine='llm')
+        self.model.sent.clear()
+        with mock.patch.object(sentiment_analyzer, 'SENTIMENT_MODEL_VERSION', 'other-model:v1'):
+            sentiment_analyzer.analyze_sentiment(messages, engine='llm')
+        self.assertEqual(self.model.sent, ['Great harvest'])
+
+
+class PlanBatchesTests(SimpleTestCase):
+
+    def _texts(self, seed):
+        rng = random.Random(seed)
+        words = ['ok', 'harvest', 'rain', 'tomorrow', 'market', 'मंडी', 'बारिश', '👍', 'price', 'seeds']
+        return [' '.join(rng.choice(words) for _ in range(rng.randint(1, 60))) for _ in range(300)]
+
+    def test_batches_stay_within_budget_and_item_cap(self):
+        for seed in range(5):
+            texts = self._texts(seed)
+            batches = plan_batches(texts, token_budget=200, max_items=12)
+            # Every position once, in order
+            self.assertEqual([position for batch in batches for position in batch], list(range(len(texts))))
+            for batch in batches:
+                self.assertLessEqual(len(batch), 12)
+                cost = sum(count_tokens(texts[position]) + 6 for position in batch)
+                if len(batch) > 1:
+                    self.assertLessEqual(cost, 200)
+
+    def test_oversize_text_gets_its_own_batch(self):
+        texts = ['short', 'word ' * 500, 'short again']
+        self.assertEqual(plan_batches(texts, token_budget=100, max_items=10), [[0], [1], [2]])
+
+    def test_item_cap_splits_small_texts(self):
+        self.assertEqual(plan_batches(['ok'] * 5, token_budget=10_000, max_items=2), [[0, 1], [2, 3], [4]])
+        self.assertEqual(plan_batches([], token_budget=100, max_items=2), [])
+
+
+class MessageDedupTests(_FakeModelTestCase):
+
+    def test_copies_expand_back_to_every_index(self):
+        rng = random.Random(3)
+        variants = ['Good morning', 'good  MORNING', '\u200eGood morning', 'Jai Kisan', 'jai kisan <This message was edited>', 'Rain']
+        messages = [{'message': rng.choice(variants)} for _ in range(200)]
+        indices = [i for i in range(len(messages)) if i % 7]
+        representatives, copies = group_duplicates(messages, indices)
+
+        self.assertEqual(len(representatives), 3)
+        expanded = sorted(representatives + [i for others in copies.values() for i in others])
+        self.assertEqual(expanded, indices)
+        for representative, others in copies.items():
+            self.assertTrue(all(i > representative for i in others))
+            key = normalize_text(messages[representative]['message'])
+            self.assertTrue(all(normalize_text(messages[i]['message']) == key for i in others))
+
+    def test_placeholders(self):
+        for text in ('<Media omitted>', '\u200eimage omitted', 'This message was deleted',
+                     '<attached: 00000012-PHOTO-2023-03-01.jpg>', 'IMG-2023.jpg (file attached)', '', None):
+            self.assertTrue(is_placeholder(text), text)
+        for text in ('Media was omitted from the report', 'deleted the old group', 'ok'):
+            self.assertFalse(is_placeholder(text), text)
+
+    def test_duplicates_are_sent_once_and_share_the_label(self):
+        messages = [
+            self._message(0, 'Great rain today'),
+            self._message(1, '<Media omitted>'),
+            self._message(2, 'great rain   today', sender='Priya'),
+            self._message(3, 'Seeds arrive Monday'),
+            self._message(4, 'Great rain today'),
+        ]
+        result = sentiment_analyzer.analyze_sentiment(messages, engine='llm')
+
+        self.assertEqual(sorted(self.model.sent), ['Great rain today', 'Seeds arrive Monday'])
+        labelled = result['all_messages_with_sentiment']
+        self.assertEqual([m['sentiment'] for m in labelled], ['positive', 'neutral', 'positive', 'neutral', 'positive'])
+        self.assertEqual(labelled[2]['reason'], labelled[0]['reason'])
+        self.assertEqual(labelled[1]['reason'], 'System or media placeholder')
+        self.assertEqual(result['analysis_metadata']['placeholders'], 1)
+
+
+class SentimentStreamTests(_FakeModelTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sentiment_analyzer, 'SENTIMENT_BATCH_MAX_ITEMS', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.messages = [
+            self._message(0, 'Great harvest'),
+            self._message(1, '<Media omitted>'),
+            self._message(2, 'Rain expected tomorrow'),
+            self._message(3, 'Great prices at the mandi'),
+            self._message(4, 'Seeds arrive Monday'),
+            self._message(5, 'Great news from the cooperative'),
+        ]
+
+    def test_events_build_up_to_the_full_result(self):
+        events = list(sentiment_analyzer.stream_sentiment(self.messages, engine='llm'))
+        names = [event for event, _ in events]
+        self.assertEqual(names[0], 'start')
+        self.assertEqual(names[-1], 'complete')
+        self.assertEqual(set(names[1:-1]), {'update'})
+
+        start = events[0][1]
+        self.assertEqual((start['total_messages'], start['resolved_without_llm'], start['total_batches']), (6, 1, 3))
+        updates = [payload for event, payload in events if event == 'update']
+        # The placeholder, then one update per batch
+        self.assertEqual([u['stage'] for u in updates], ['resolved', 'llm', 'llm', 'llm'])
+        self.assertEqual([u['batches_done'] for u in updates], [0, 1, 2, 3])
+        processed = [u['processed'] for u in updates]
+        self.assertEqual(processed, sorted(processed))
+        self.assertEqual(processed[-1], 6)
+
+        complete = events[-1][1]
+        self.assertEqual(updates[-1]['sentiment_breakdown'], complete['sentiment_breakdown'])
+        self.assertEqual(complete['sentiment_breakdown'], {'positive': 3, 'neutral': 3, 'negative': 0})
+
+        # Same result as the non-streaming call (now served from the cache)
+        result = sentiment_analyzer.analyze_sentiment(self.messages, engine='llm')
+        for key in ('sentiment_breakdown', 'daily_sentiment', 'user_sentiment'):
+            self.assertEqual(json.loads(json.dumps(complete[key])), json.loads(json.dumps(result[key])), key)
+        self.assertEqual(
+            [m['sentiment'] for m in complete['all_messages_with_sentiment']],
+            [m['sentiment'] for m in result['all_messages_with_sentiment']],
+        )
+
+    def test_sse_frames(self):
+        frame = views._sse('update', {'processed': 2})
+        self.assertEqual(frame, 'event: update\ndata: {"processed": 2}\n\n')
+
+
+class CompactFormatTests(_FakeModelTestCase):
+
+    def setUp(self):
+        super().setUp()
+        messages = [
+            self._message(0, 'Great harvest'),
+            {'timestamp': '2023-03-01, 10:00', 'sender': 'Priya', 'message': 'Crop loss after the hail'},
+            self._message(2, 'Rain expected tomorrow', sender='Priya'),
+            {'timestamp': '2023-03-02, 09:15', 'sender': 'Ravi', 'message': 'Great prices at the mandi'},
+            {'timestamp': '2023-03-02, 09:20', 'sender': 'Anil', 'message': 'Another loss for us'},
+        ]
+        self.full = sentiment_analyzer.analyze_sentiment(messages, engine='llm')
+
+    def test_rows_rebuild_the_full_messages(self):
+        compact = format_sentiment_result(self.full, 'compact', include_text=True)
+        names = compact['dictionaries']
+        columns = compact['messages']
+        self.assertEqual(names['sentiment'], ['positive', 'neutral', 'negative'])
+
+        rebuilt = [
+            {
+                'timestamp': columns['timestamp'][row],
+                'sender': names['sender'][columns['sender'][row]],
+                'date': names['date'][columns['date'][row]],
+                'sentiment': names['sentiment'][columns['sentiment'][row]],
+                'emotion': names['emotion'][columns['emotion'][row]],
+                'confidence': columns['confidence'][row],
+                'polarity': columns['polarity'][row],
+                'message': columns['message'][row],
+                'reason': columns['reason'][row],
+            }
+            for row in range(len(columns['timestamp']))
+        ]
+        expected = [
+            {
+                'timestamp': to_epoch(parse_timestamp(msg['timestamp'])),
+                'sender': msg['sender'],
+                'date': msg['date'],
+                'sentiment': msg['sentiment'],
+                'emotion': msg['emotion'],
+                'confidence': round(msg['confidence'], 3),
+                'polarity': round(msg['polarity'], 3),
+                'message': msg['message'],
+                'reason': msg['reason'],
+            }
+            for msg in self.full['all_messages_with_sentiment']
+        ]
+        self.assertEqual(rebuilt, expected)
+
+        views_ = compact['views']
+        self.assertEqual(
+            [columns['message'][row] for row in views_['negative_messages']],
+            [msg['message'] for msg in self.full['negative_messages']],
+        )
+        self.assertEqual(views_['sentiment_trend'], list(range(len(rebuilt))))
+        keywords = {
+            sentiment: [(columns['message'][row], names['keyword'][k]) for row, k in pairs]
+            for sentiment, pairs in views_['emotional_keywords'].items()
+        }
+        self.assertEqual(keywords, {
+            'positive': [('Great harvest', 'great'), ('Great prices at the mandi', 'great')],
+            'negative': [('Crop loss after the hail', 'loss'), ('Another loss for us', 'loss')],
+        })
+        for key in ('sentiment_breakdown', 'daily_sentiment', 'user_sentiment', 'analysis_metadata'):
+            self.assertEqual(compact[key], self.full[key])
+        self.assertNotIn('user_sentiments', compact)
+
+    def test_text_is_opt_in(self):
+        compact = compact_sentiment_result(self.full)
+        self.assertNotIn('message', compact['messages'])
+        self.assertNotIn('reason', compact['messages'])
+        self.assertIs(format_sentiment_result(self.full), self.full)
+        with self.assertRaises(ValueError):
+            format_sentiment_result(self.full, 'xml')
+
+
+class ParseTimestampCacheTests(SimpleTestCase):
+
+    def test_repeated_strings_are_parsed_once(self):
+        parse_timestamp.cache_clear()
+        first = parse_timestamp('25/12/23, 10:15 PM')
+        self.assertEqual(first, datetime(2023, 12, 25, 22, 15))
+        self.assertIs(parse_timestamp('25/12/23, 10:15 PM'), first)
+        info = parse_timestamp.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+        self.assertEqual(parse_timestamp.__wrapped__('25/12/23, 10:15 PM'), first)
+        self.assertIsNone(parse_timestamp(''))
+
+
+class SentimentRollupTests(_FakeModelTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.signature = 'files-v1'
+        patcher = mock.patch('chatapp.sentiment_rollup.source_signature', side_effect=lambda group: self.signature)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _analysed(self, *days):
+        texts = {1: ['Great harvest', 'Crop loss after the hail'], 2: ['Great rain', 'Seeds arrive'], 3: ['Another loss']}
+        messages = [
+            {'timestamp': f'2023-03-0{day}, 10:{i:02d}', 'sender': 'Ravi' if i % 2 == 0 else 'Priya', 'message': text}
+            for day in days for i, text in enumerate(texts[day])
+        ]
+        return sentiment_analyzer.analyze_sentiment(messages, engine='llm')
+
+    def test_overlapping_analyses_replace_days_instead_of_adding(self):
+        record_rollups('Farmers', '2023-03-01', '2023-03-02', self._analysed(1, 2))
+        self.assertEqual(uncovered_ranges('Farmers', '2023-03-01', '2023-03-04'), [['2023-03-03', '2023-03-04']])
+
+        # Day 2 is analysed again alongside day 3
+        record_rollups('Farmers', '2023-03-02', '2023-03-03', self._analysed(2, 3))
+        self.assertEqual(uncovered_ranges('Farmers', '2023-03-01', '2023-03-03'), [])
+        self.assertEqual(uncovered_ranges('Farmers', None, '2023-03-03'), [[None, '2023-02-28']])
+
+        result = rollup_sentiment('Farmers', '2023-03-01', '2023-03-03')
+        self.assertEqual(result['total_analyzed'], 5)
+        self.assertEqual(result['sentiment_breakdown'], {'positive': 2, 'neutral': 1, 'negative': 2})
+        self.assertEqual(result['daily_sentiment']['2023-03-02'], {'positive': 1, 'neutral': 1, 'negative': 0})
+        self.assertEqual(result['analysis_metadata']['api_calls_made'], 0)
+
+        # Same counts the full analysis of the range gives
+        full = self._analysed(1, 2, 3)
+        self.assertEqual(result['daily_sentiment'], full['daily_sentiment'])
+        self.assertEqual(result['user_sentiment'], full['user_sentiment'])
+
+        by_user = rollup_sentiment('Farmers', '2023-03-01', '2023-03-03', user='Priya')
+        self.assertEqual(by_user['sentiment_breakdown'], {'positive': 0, 'neutral': 1, 'negative': 1})
+
+    def test_changed_source_files_drop_old_rollups(self):
+        record_rollups('Farmers', '2023-03-01', '2023-03-02', self._analysed(1, 2))
+        self.signature = 'files-v2'
+        self.assertEqual(uncovered_ranges('Farmers', '2023-03-01', '2023-03-02'), [['2023-03-01', '2023-03-02']])
+        record_rollups('Farmers', '2023-03-03', '2023-03-03', self._analysed(3))
+        self.assertEqual(rollup_sentiment('Farmers', '2023-03-01', '2023-03-03')['total_analyzed'], 1)
+
+    def test_estimates_are_not_recorded(self):
+        estimate = dict(self._analysed(1), estimate={'sampled': 2})
+        self.assertEqual(record_rollups('Farmers', '2023-03-01', '2023-03-01', estimate), 0)
+        self.assertEqual(rollup_sentiment('Farmers')['total_analyzed'], 0)
+
+
+class ProportionIntervalTests(SimpleTestCase):
+
+    def test_interval_contains_the_estimate_and_stays_in_unit_range(self):
+        rng = random.Random(11)
+        for _ in range(5000):
+            population = rng.randint(2, 100_000)
+            sampled = rng.randint(1, population)
+            hits = rng.choice([0, sampled, rng.randint(0, sampled)])
+            p, low, high = proportion_interval(hits, sampled, population, z_score(rng.choice([0.9, 0.95, 0.99])))
+            self.assertTrue(0.0 <= low <= p <= high <= 1.0, (hits, sampled, population, low, p, high))
+
+    def test_known_values_and_edges(self):
+        p, low, high = proportion_interval(50, 100, 10**12, z_score(0.95))
+        self.assertEqual((p, round(low, 4), round(high, 4)), (0.5, 0.4038, 0.5962))
+        self.assertIsNone(proportion_interval(0, 0, 100, 1.96))
+        # A census has no sampling error
+        self.assertEqual(proportion_interval(30, 120, 120, 1.96), (0.25, 0.25, 0.25))
+        _, low, high = proportion_interval(0, 40, 1000, 1.96)
+        self.assertEqual(low, 0.0)
+        self.assertGreater(high, 0.0)
+
+    def test_larger_samples_narrow_the_interval(self):
+        widths = []
+        for sampled in (50, 200, 800, 3200):
+            _, low, high = proportion_interval(sampled // 4, sampled, 10_000, 1.96)
+            widths.append(high - low)
+        self.assertEqual(widths, sorted(widths, reverse=True))
+
+    def test_sample_size_and_selection(self):
+        self.assertEqual(required_sample_size(10**9, 0.05, 0.95), 385)
+        self.assertEqual(required_sample_size(100, 0.05, 0.95), 80)
+        self.assertEqual(required_sample_size(0, 0.05, 0.95), 0)
+
+        messages = [
+            {'timestamp': f'2023-03-{day:02d}, 10:{i:02d}', 'sender': f'user{i % 3}', 'message': 'hi'}
+            for day in range(1, 11) for i in range(30)
+        ]
+        positions = select_sample(messages, 60)
+        self.assertEqual(positions, select_sample(messages, 60))
+        self.assertEqual(positions, sorted(set(positions)))
+        self.assertEqual(len(positions), 60)
+        # Systematic over (day, sender): every day gets its share
+        per_day = Counter(messages[i]['timestamp'][:10] for i in positions)
+        self.assertEqual(set(per_day.values()), {6})
+        self.assertEqual(select_sample(messages[:5], 10), [0, 1, 2, 3, 4])
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.model_name = f'fake-{self.id()}'
+        patcher = mock.patch.object(llm_gateway, 'LLM_CACHE_EVICT_EVERY', 10**9)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _generate(self, prompt, **kwargs):
+        def call(prompt, timeout):
+            self.sent.append(prompt)
+            return f'answer to {prompt}'
+        return llm_gateway.generate(prompt, call=call, model_name=self.model_name, **kwargs)
+
+    def test_identical_requests_are_served_from_the_cache(self):
+        self.assertEqual(self._generate('What did Ravi say?'), 'answer to What did Ravi say?')
+        self.assertEqual(self._generate('What did Ravi say?'), 'answer to What did Ravi say?')
+        self.assertEqual(self.sent, ['What did Ravi say?'])
+
+        # Model, params and the cache opt-out all keep requests apart
+        self._generate('What did Ravi say?', params={'temperature': 0.2})
+        self._generate('What did Ravi say?', use_cache=False)
+        self.model_name += '-v2'
+        self._generate('What did Ravi say?')
+        self.assertEqual(len(self.sent), 4)
+
+    def test_unparseable_responses_are_not_cached(self):
+        with self.assertRaises(json.JSONDecodeError):
+            self._generate('Summarise', parse=json.loads)
+        self.assertFalse(LLMResponse.objects.exists())
+
+    def test_entries_expire_after_their_ttl(self):
+        with mock.patch.object(llm_gateway, 'LLM_CACHE_TTL_SECONDS', 3600):
+            self._generate('Summarise March')
+            LLMResponse.objects.update(created_at=timezone.now() - timedelta(minutes=59))
+            self._generate('Summarise March')
+            self.assertEqual(len(self.sent), 1)
+
+            LLMResponse.objects.update(created_at=timezone.now() - timedelta(minutes=61))
+            self._generate('Summarise March')
+            self.assertEqual(len(self.sent), 2)
+
+            # The refreshed entry survives eviction; an expired one does not
+            self._generate('Summarise April')
+            LLMResponse.objects.filter(response__endswith='April').update(
+                created_at=timezone.now() - timedelta(hours=2),
+            )
+            self.assertEqual(llm_gateway.evict(), 1)
+            self.assertEqual(list(LLMResponse.objects.values_list('response', flat=True)), ['answer to Summarise March'])
+
+    def test_least_recently_used_entries_go_first(self):
+        prompts = ['p1', 'p2', 'p3', 'p4']
+        for prompt in prompts:
+            self._generate(prompt)
+        now = timezone.now()
+        for age, prompt in zip((1, 4, 2, 3), prompts):
+            LLMResponse.objects.filter(key=llm_gateway.cache_key(self.model_name, prompt)).update(
+                last_used_at=now - timedelta(minutes=age),
+            )
+        size = len('answer to p1'.encode('utf-8'))
+
+        with mock.patch.object(llm_gateway, 'LLM_CACHE_MAX_BYTES', 2 * size + 1):
+            self.assertEqual(llm_gateway.evict(), 2)
+        self.assertEqual(
+            sorted(LLMResponse.objects.values_list('response', flat=True)), ['answer to p1', 'answer to p3'],
+        )
+
+        # A hit refreshes last_used_at
+        self._generate('p3')
+        LLMResponse.objects.filter(response='answer to p1').update(last_used_at=now)
+        with mock.patch.object(llm_gateway, 'LLM_CACHE_MAX_BYTES', size):
+            llm_gateway.evict()
+        self.assertEqual(list(LLMResponse.objects.values_list('response', flat=True)), ['answer to p3'])
+        self.assertEqual(self.sent, prompts)
+
+
+class ChatContextTests(SimpleTestCase):
+
+    def _chat(self, seed, count=300):
+        rng = random.Random(seed)
+        words = ['rain', 'harvest', 'price', 'mandi', 'seeds', 'tractor', 'loan', 'tomorrow', 'बारिश', 'fertiliser']
+        texts = [f'{i}. ' + ' '.join(rng.choice(words) for _ in range(rng.randint(1, 25))) for i in range(count)]
+        texts += ['Jai Kisan'] * 20 + ['<Media omitted>'] * 10
+        rng.shuffle(texts)
+        return [
+            {'timestamp': f'2023-03-{1 + i // 40:02d}, 10:{i % 60:02d}', 'sender': rng.choice(['Ravi', 'Priya', 'Anil']),
+             'message': text}
+            for i, text in enumerate(texts)
+        ]
+
+    def test_context_fits_the_budget(self):
+        for seed, budget in ((1, 50), (2, 400), (3, 1500), (4, 10**6)):
+            messages = self._chat(seed)
+            text, stats = build_chat_context(messages, budget, query='mandi price')
+            self.assertLessEqual(stats['tokens_final'], budget)
+            self.assertEqual(stats['tokens_final'], count_tokens(text))
+            self.assertEqual(stats['noise_dropped'], 10)
+            self.assertEqual(stats['duplicates_collapsed'], 19)
+            self.assertEqual(stats['truncated'], stats['tokens_compressed'] > budget)
+            self.assertLess(stats['tokens_compressed'], stats['tokens_raw'])
+
+    def test_kept_lines_stay_in_chat_order(self):
+        messages = self._chat(5)
+        items, _ = compress_messages(messages)
+        text, stats = build_chat_context(messages, 300, include_dates=False)
+        self.assertTrue(stats['truncated'])
+        body = [re.sub(r' \(shared \d+x\)$', '', line.split(': ', 1)[-1].strip()) for line in text.split('\n')]
+        positions = [next(i for i, item in enumerate(items) if item['text'] == line) for line in body]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(len(positions), stats['lines_kept'])
+
+    def test_query_keeps_matching_lines(self):
+        messages = [
+            {'timestamp': f'2023-03-01, 10:{i:02d}', 'sender': 'Ravi', 'message': f'Update number {i} about the weather today'}
+            for i in range(40)
+        ]
+        messages[3]['message'] = 'The tractor loan office opens Monday'
+        text, stats = build_chat_context(messages, 60, query='When does the tractor loan office open?')
+        self.assertTrue(stats['truncated'])
+        self.assertIn('tractor loan office', text)
+
+    def test_compression(self):
+        messages = [
+            {'timestamp': '2023-03-01, 10:00', 'sender': 'Ravi', 'message': 'Jai Kisan'},
+            {'timestamp': '2023-03-01, 10:01', 'sender': 'Ravi', 'message': 'Meeting at noon <This message was edited>'},
+            {'timestamp': '2023-03-01, 10:02', 'sender': 'Priya', 'message': '<Media omitted>'},
+            {'timestamp': '2023-03-02, 09:00', 'sender': 'Priya', 'message': 'jai  kisan'},
+            {'timestamp': '2023-03-02, 09:01', 'sender': 'Priya', 'message': 'This message was deleted'},
+            {'timestamp': '2023-03-02, 09:02', 'sender': 'Priya', 'message': 'See you there'},
+        ]
+        text, stats = build_chat_context(messages, 1000)
+        self.assertEqual(text, '[2023-03-01]\nRavi: Jai Kisan (shared 2x)\n  Meeting at noon\n[2023-03-02]\nPriya: See you there')
+        self.assertEqual((stats['noise_dropped'], stats['duplicates_collapsed'], stats['truncated']), (2, 1, False))
+
+
+class LocalSummaryTests(SimpleTestCase):
+
+    def setUp(self):
+        texts = [
+            'Good morning everyone',
+            'Soybean prices at the Latur mandi rose to 4800 rupees per quintal today',
+            'ok',
+            'Soybean prices at Latur mandi rose to 4800 per quintal',
+            'Heavy rain expected across Marathwada, postpone soybean spraying this week',
+            'Who has the tractor number for the cooperative?',
+            'The cooperative will distribute soybean seeds at the mandi on Monday',
+            '<Media omitted>',
+            'मंडी में सोयाबीन का भाव 4800 रुपये प्रति क्विंटल हो गया',
+            'Soybean spraying should wait until the rain passes, says the agriculture officer',
+        ]
+        self.messages = [
+            {'timestamp': f'2023-03-{1 + i // 4:02d}, 10:{i:02d}', 'sender': ['Ravi', 'Priya', 'Anil'][i % 3],
+             'message': text}
+            for i, text in enumerate(texts)
+        ]
+
+    def _positions(self, summary):
+        bullets = summary.split('\n')
+        return [
+            next(i for i, msg in enumerate(self.messages) if bullet.endswith(': ' + msg['message']))
+            for bullet in bullets
+        ]
+
+    def test_bullets_follow_chat_order(self):
+        for count in (1, 2, 3, 4):
+            summary = local_summary(self.messages, sentence_count=count)
+            positions = self._positions(summary)
+            self.assertEqual(len(positions), count)
+            self.assertEqual(positions, sorted(positions))
+        self.assertEqual(local_summary(self.messages), local_summary(list(self.messages)))
+
+    def test_ranking_picks_central_sentences_once(self):
+        ranked = rank_sentences(self.messages, 4)
+        sentences = [sentence for _, sentence in ranked]
+        self.assertIn('soybean', sentences[0].lower())
+        # The two price reports are near-duplicates; only one is quoted
+        self.assertEqual(sum('4800' in sentence and 'Latur' in sentence for sentence in sentences), 1)
+        for text in ('Good morning everyone', 'ok', '<Media omitted>'):
+            self.assertNotIn(text, sentences)
+        bullet = local_summary(self.messages, sentence_count=1)
+        self.assertRegex(bullet, r'^\* \*\*(Ravi|Priya|Anil)\*\* \(2023-03-0\d\): ')
+
+    def test_nothing_to_quote(self):
+        messages = [{'timestamp': '2023-03-01, 10:00', 'sender': 'Ravi', 'message': text} for text in ('ok', 'hi all')]
+        self.assertIsNone(local_summary(messages))
+
+
+class StreamingOutputTests(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.model_name = f'fake-{self.id()}'
+
+    def _chunks(self, prompt, timeout, delay=0.0):
+        self.calls += 1
+        for word in ('The ', 'group ', 'discussed ', 'soybean ', 'prices.'):
+            yield word
+            time.sleep(delay)
+
+    def test_chunks_join_to_the_cached_response(self):
+        stream = llm_gateway.generate_stream('Summarise', call=self._chunks, model_name=self.model_name)
+        self.assertEqual(next(stream), 'The ')
+        self.assertFalse(LLMResponse.objects.exists())
+        chunks = ['The '] + list(stream)
+        self.assertEqual(len(chunks), 5)
+
+        # The completed stream is shared with generate() and later streams
+        text = llm_gateway.generate('Summarise', call=self._chunks, model_name=self.model_name)
+        self.assertEqual(text, ''.join(chunks))
+        self.assertEqual(
+            list(llm_gateway.generate_stream('Summarise', call=self._chunks, model_name=self.model_name)), [text],
+        )
+        self.assertEqual(self.calls, 1)
+
+    def test_abandoned_and_late_streams_are_not_cached(self):
+        stream = llm_gateway.generate_stream('Summarise', call=self._chunks, model_name=self.model_name)
+        next(stream)
+        stream.close()
+        self.assertFalse(LLMResponse.objects.exists())
+
+        slow = llm_gateway.generate_stream(
+            'Summarise', call=lambda prompt, timeout: self._chunks(prompt, timeout, delay=0.05),
+            model_name=self.model_name, deadline=time.monotonic() + 0.12,
+        )
+        received = []
+        with self.assertRaises(llm_gateway.DeadlineExceeded):
+            for chunk in slow:
+                received.append(chunk)
+        self.assertTrue(0 < len(received) < 5)
+        self.assertFalse(LLMResponse.objects.exists())
+
+    def test_run_streaming_relays_events_then_completes(self):
+        def produce(emit):
+            for chunk in self._chunks('Summarise', None):
+                emit('token', {'text': chunk})
+            return {'summary': 'done'}
+
+        events = list(views._run_streaming(produce))
+        self.assertEqual([event for event, _ in events], ['token'] * 5 + ['complete'])
+        self.assertEqual(''.join(payload['text'] for _, payload in events[:-1]), 'The group discussed soybean prices.')
+        self.assertEqual(events[-1][1], {'summary': 'done'})
+
+        def fail(emit):
+            emit('token', {'text': 'The '})
+            raise RuntimeError('quota exhausted')
+
+        events = list(views._run_streaming(fail))
+        self.assertEqual([event for event, _ in events], ['token', 'error'])
+        self.assertIn('quota exhausted', events[-1][1]['error'])
+
+
+class _CountingServer(ThreadingHTTPServer):
+    """Plain-HTTP stand-in for the Gemini API that counts accepted connections"""
+    daemon_threads = True
+    latency = 0.0
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+
+class PooledClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = _CountingServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1/models/gemini:generateContent'
+
+    def test_calls_reuse_one_connection(self):
+        expected = json.loads(RESPONSE)
+        for backend in ('requests', 'httpx'):
+            self.server.connections = 0
+            client = HttpClient(backend=backend, http2=False, pool_size=4)
+            try:
+                for _ in range(20):
+                    self.assertEqual(client.post_json(self.url, params={'key': 'k'}, json={'q': 1}, timeout=5), expected)
+                self.assertEqual(list(client.stream_lines(self.url, json={'q': 1}, timeout=5)), [RESPONSE.decode()])
+            finally:
+                client.close()
+            self.assertEqual(self.server.connections, 1, backend)
+
+    def test_call_timeout_caps_both_timeouts(self):
+        client = HttpClient(backend='requests', connect_timeout=10, read_timeout=60)
+        self.assertEqual(client._timeout(None), (10, 60))
+        self.assertEqual(client._timeout(4), (4, 4))
+        client.close()
+        with self.assertRaises(ValueError):
+            HttpClient(backend='urllib')
+
+    def test_one_client_per_process(self):
+        with mock.patch('chatapp.http_client._client', None):
+            first = get_client()
+            self.addCleanup(first.close)
+            self.assertIs(get_client(), first)
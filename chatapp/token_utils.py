@@ -0,0 +1,77 @@
+"""
+Token counting and token-budgeted batch planning for LLM prompts.
+
+tiktoken is used when its encoding can be loaded; otherwise (offline
+deployments, missing package) a cheap estimator is used: about four ASCII
+characters per token, and one token per non-ASCII character, which keeps
+Devanagari text and emoji on the safe side.
+"""
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                logger.info(f"tiktoken unavailable, estimating token counts: {e}")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def tokenizer_name():
+    """'tiktoken' when real token counts are available, else 'estimate'"""
+    return 'tiktoken' if _get_encoding() is not None else 'estimate'
+
+
+def estimate_tokens(text):
+    """Cheap token estimate without a tokenizer"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def plan_batches(texts, token_budget, max_items, per_item_overhead=6):
+    """
+    Greedily pack texts, in order, into batches of positions whose summed
+    token cost stays within token_budget and max_items. A text that is over
+    budget on its own gets a batch to itself.
+    """
+    batches = []
+    current = []
+    used = 0
+    for position, text in enumerate(texts):
+        cost = count_tokens(text) + per_item_overhead
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(position)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
@@ -4,9 +4,66 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 import numpy as np
 from datetime import datetime
-from .config import TOPIC_MIN_WORD_LENGTH, TOPIC_MAX_TOPICS
+from .config import TOPIC_MIN_WORD_LENGTH, TOPIC_MAX_TOPICS, KEYWORD_MODE, KEYWORD_TOPK_ERROR_RATE
+from .heavy_hitters import SpaceSaving, keyword_options
 
-def extract_topics(messages, top_n=5):
+URL_RE = re.compile(r'http\S+|www\S+|https\S+', re.MULTILINE)
+MENTION_RE = re.compile(r'@\w+')
+NON_ALPHA_RE = re.compile(r'[^a-z ]')
+
+
+def _clean_text(text):
+    text = URL_RE.sub('', text.lower())
+    text = MENTION_RE.sub('', text)
+    return NON_ALPHA_RE.sub(' ', text)
+
+
+def _find_examples(valid_messages, keyword):
+    examples = []
+    pattern = re.compile(r'\b' + re.escape(keyword) + r'\b')
+    for msg in valid_messages:
+        if pattern.search(msg.get('message', '').lower()):
+            examples.append({
+                'sender': msg['sender'],
+                'timestamp': msg['timestamp'],
+                'message': msg['message'][:100] + '...' if len(msg['message']) > 100 else msg['message']
+            })
+            if len(examples) >= 2:
+                break
+    return examples
+
+
+def extract_topics_streaming(valid_messages, stopwords, top_n=5, error_rate=KEYWORD_TOPK_ERROR_RATE):
+    """
+    Approximate keyword topics in constant memory using Space-Saving counts.
+
+    LDA needs the full document-term matrix, so only frequency keywords are
+    produced in this mode. Each topic carries its overestimate bound.
+    """
+    summary = SpaceSaving.from_error_rate(error_rate)
+    for msg in valid_messages:
+        for word in _clean_text(msg.get('message', '')).split():
+            if word not in stopwords and len(word) > TOPIC_MIN_WORD_LENGTH:
+                summary.add(word)
+
+    metadata = summary.metadata()
+    topics = []
+    for keyword, count, error in summary.most_common(top_n):
+        examples = _find_examples(valid_messages, keyword)
+        if examples:
+            topics.append({
+                'topic': keyword,
+                'method': 'space_saving',
+                'score': float(count),
+                'error': error,
+                'approximation': metadata,
+                'examples': examples
+            })
+    return topics
+
+
+def extract_topics(messages, top_n=5, keyword_mode=None, keyword_error_rate=None):
+    keyword_mode, keyword_error_rate = keyword_options(keyword_mode, keyword_error_rate)
     # Check if messages list is empty
     if not messages:
         return []
@@ -38,23 +95,23 @@ def extract_topics(messages, top_n=5):
         'upon', 'via', 'within', 'without'
     ])
     
-    processed_messages = []
-    for msg in valid_messages:
-        text = msg.get('message', '').lower()
-        text = re.sub(r'http\S+|www\S+|https\S+', '', text, flags=re.MULTILINE)
-        text = re.sub(r'@\w+', '', text)
-        text = re.sub(r'[^a-z ]', ' ', text)
-        processed_messages.append(text)
+    if (keyword_mode or KEYWORD_MODE) == 'approximate':
+        return extract_topics_streaming(
+            valid_messages, stopwords, top_n=top_n,
+            error_rate=keyword_error_rate or KEYWORD_TOPK_ERROR_RATE
+        )
+    
+    processed_messages = [_clean_text(msg.get('message', '')) for msg in valid_messages]
     
     # If after processing we have no valid text, return empty list
     if not any(processed_messages):
         return []
     
-    all_text = ' '.join(processed_messages)
-    words = [word for word in all_text.split() if word not in stopwords and len(word) > TOPIC_MIN_WORD_LENGTH]
-    
-    # If no words after filtering, return empty list
-    if not words:
+    # If no words survive filtering, return empty list
+    if not any(
+        word not in stopwords and len(word) > TOPIC_MIN_WORD_LENGTH
+        for text in processed_messages for word in text.split()
+    ):
         return []
     
     vectorizer = TfidfVectorizer(max_features=1000, stop_words=list(stopwords))
@@ -81,17 +138,8 @@ def extract_topics(messages, top_n=5):
     
     # Add TF-IDF keywords
     for i, (keyword, score) in enumerate(tfidf_keywords[:top_n]):
-        examples = []
-        for msg in valid_messages:
-            # Use word boundaries to match whole words only
-            if re.search(r'\b' + re.escape(keyword) + r'\b', msg.get('message', '').lower()):
-                examples.append({
-                    'sender': msg['sender'],
-                    'timestamp': msg['timestamp'],
-                    'message': msg['message'][:100] + '...' if len(msg['message']) > 100 else msg['message']
-                })
-                if len(examples) >= 2: 
-                    break
+        # Use word boundaries to match whole words only
+        examples = _find_examples(valid_messages, keyword)
         
         # Only add topic if we found at least one example
         if examples:
@@ -11,6 +11,7 @@ urlpatterns = [
     path('group-events', views.group_events_page, name='group_events_page'),
     path('api/group_events/analytics/', views.group_events_analytics, name='group_events_analytics'),
     path('api/group_events/logs/', views.group_events_logs, name='group_events_logs'),
+    path('api/group_events/membership/', views.group_events_membership, name='group_events_membership'),
     path('api/group_dates/', views.get_group_dates, name='get_group_dates'),
 
     path('groups/', views.get_groups, name='get_groups'),
@@ -18,14 +19,24 @@ urlpatterns = [
     path('delete_file/', views.delete_file, name='delete_file'),
     path('get_uploaded_files/', views.get_uploaded_files, name='get_uploaded_files'),
     path('summarize/', views.summarize, name='summarize'),
+    path('summarize/stream/', views.summarize_stream, name='summarize_stream'),
     path('ask/', views.ask_question, name='ask_question'),
+    path('ask/stream/', views.ask_stream, name='ask_stream'),
     path('group_events/', views.group_events, name='group_events'),
     path('event_details/', views.event_details, name='event_details'),
     path('sentiment/', views.sentiment, name='sentiment'),
+    path('sentiment/stream/', views.sentiment_stream, name='sentiment_stream'),
     path('activity_analysis/', views.activity_analysis, name='activity_analysis'),
     path('export_data/', views.export_data, name='export_data'),
     path('debug_groups/', views.debug_groups, name='debug_groups'),
     path('health/', views.health_check, name='health_check'),
+    path('api/llm_cache/stats/', views.llm_cache_stats, name='llm_cache_stats'),
+
+    # Background analysis jobs
+    path('api/jobs/submit/', views.submit_analysis_job, name='submit_analysis_job'),
+    path('api/jobs/<str:job_id>/status/', views.analysis_job_status, name='analysis_job_status'),
+    path('api/jobs/<str:job_id>/result/', views.analysis_job_result, name='analysis_job_result'),
+    path('api/jobs/<str:job_id>/cancel/', views.cancel_analysis_job, name='cancel_analysis_job'),
     
     
 ]
\ No newline at end of file
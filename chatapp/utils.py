@@ -1,6 +1,10 @@
 from datetime import datetime
+from functools import lru_cache
 
 
+# The same export lines are parsed by sorting, filtering, event indexing and
+# sentiment aggregation within one request; datetimes are immutable, so cache them
+@lru_cache(maxsize=65536)
 def parse_timestamp(timestamp_str):
     """
     Parse timestamp string to datetime object.
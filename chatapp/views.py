@@ -3,33 +3,50 @@ import re
 import json
 import csv
 import os
-import requests
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.core.files.storage import default_storage
+from django.db import connections
 from dotenv import load_dotenv
-from .models import ChatFile
-from .config import GEMINI_API_KEY, MAX_CHARS_FOR_ANALYSIS
+from .models import ChatFile, AnalysisJob
+from .config import (
+    GEMINI_API_KEY, QA_PROMPT_TOKEN_BUDGET, EVENT_LOGS_PAGE_SIZE, EVENT_LOGS_MAX_PAGE_SIZE, LLM_REQUEST_DEADLINE_SECONDS,
+)
 from .utils import parse_timestamp, filter_messages_by_date
 from .business_metrics import calculate_business_metrics
+from .heavy_hitters import keyword_options
 from .group_event import (
     analyze_group_events,
     get_event_counts,
     get_event_details,
     get_top_removers,
-    _normalize_events,
-    _filter_normalized,
-    compute_timeseries,
-    compute_distribution,
-    compute_most_active_day,
-    compute_top_contributors,
-    extract_unique_actors,
 )
-from .sentiment_analyzer import analyze_sentiment
+from .event_index import (
+    ensure_event_index,
+    rebuild_event_index,
+    drop_event_index,
+    query_events,
+    page_events,
+    summarize_events,
+    to_epoch,
+    from_epoch,
+)
+from .membership import member_count_at, members_at, member_history, member_count_series, membership_stats
+from .sentiment_analyzer import analyze_sentiment, stream_sentiment, sentiment_engine
+from .sentiment_rollup import record_rollups, drop_rollups, uncovered_ranges, rollup_sentiment
+from .sentiment_format import RESPONSE_FORMATS as SENTIMENT_RESPONSE_FORMATS, format_sentiment_result
+from .llm_gateway import generate as llm_generate, generate_stream as llm_generate_stream, cache_stats
+from .circuit_breaker import breaker_stats
+from .http_client import HTTP_ERRORS, get_client
+from .prompt_builder import build_chat_context
+from .jobs import register_job, submit_job, cancel_job, job_status, job_kinds
 from .summary_generator import (
     generate_total_summary, 
     generate_user_messages, 
@@ -38,14 +55,17 @@ from .summary_generator import (
     generate_weekly_summary,
     generate_brief_summary,
     generate_daily_user_messages,
-    generate_user_wise_detailed_report
+    generate_user_wise_detailed_report,
+    SUMMARY_MODES,
 )
+from .summary_tree import drop_nodes as drop_summary_nodes
 
 load_dotenv()
 
 # Use Google Gemini API
 MODEL_NAME = "gemini-1.5-pro"
 GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}/generateContent"
+GEMINI_STREAM_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:streamGenerateContent"
 
 def generate_fallback_answer(question, messages):
     """Generate a comprehensive fallback answer when AI is unavailable"""
@@ -239,16 +259,15 @@ def generate_fallback_answer(question, messages):
         answer += "💡 **Try asking**: 'List meetings', 'Who is most active?', 'What topics were discussed?', 'Show files shared'"
         return answer
 
-def generate_with_gemini(prompt):
-    """Generate content using Google Gemini API"""
+def generate_with_gemini(prompt, deadline=None):
+    """Generate content using Google Gemini API (cached by the LLM gateway)"""
+    return llm_generate(prompt, call=_request_gemini_rest, model_name=MODEL_NAME, deadline=deadline)
+
+def _request_gemini_rest(prompt, timeout=None):
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY environment variable not set")
 
-    headers = {
-        "Content-Type": "application/json"
-    }
-
     data = {
         "contents": [
             {
@@ -260,19 +279,40 @@ def generate_with_gemini(prompt):
     }
 
     try:
-        response = requests.post(GEMINI_API_URL, headers=headers, params={"key": api_key}, json=data)
-        response.raise_for_status()
-
-        result = response.json()
+        result = get_client().post_json(GEMINI_API_URL, params={"key": api_key}, json=data, timeout=timeout)
         return result['candidates'][0]['content']['parts'][0]['text']
 
-    except requests.exceptions.RequestException as e:
+    except HTTP_ERRORS as e:
         raise Exception(f"Gemini API error: {str(e)}")
     except KeyError as e:
         raise Exception(f"Unexpected response format: {str(e)}")
     except Exception as e:
         raise Exception(f"Error calling Gemini API: {str(e)}")
 
+def stream_with_gemini(prompt, deadline=None):
+    """Yield the Gemini response in chunks as they arrive (cached by the LLM gateway)"""
+    return llm_generate_stream(prompt, call=_stream_gemini_rest, model_name=MODEL_NAME, deadline=deadline)
+
+def _stream_gemini_rest(prompt, timeout=None):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY environment variable not set")
+
+    data = {"contents": [{"parts": [{"text": prompt}]}]}
+    try:
+        for line in get_client().stream_lines(
+            GEMINI_STREAM_URL, params={"key": api_key, "alt": "sse"}, json=data, timeout=timeout,
+        ):
+            if not line or not line.startswith('data:'):
+                continue
+            chunk = json.loads(line[5:])
+            for candidate in chunk.get('candidates', [])[:1]:
+                for part in candidate.get('content', {}).get('parts', []):
+                    if part.get('text'):
+                        yield part['text']
+    except HTTP_ERRORS as e:
+        raise Exception(f"Gemini API error: {str(e)}")
+
 def parse_whatsapp(file_path):
     messages = []
     current_message = None
@@ -353,6 +393,24 @@ def load_all_chats():
 
     return chat_data
 
+def load_group_messages(group_name):
+    """Parse only the files of one group, sorted by timestamp"""
+    messages = []
+    for chat_file in ChatFile.objects.filter(group_name=group_name).order_by('id'):
+        try:
+            messages.extend(parse_whatsapp(chat_file.file.path))
+        except Exception as e:
+            print(f"Error loading {chat_file.original_filename}: {e}")
+    messages.sort(key=lambda msg: parse_timestamp(msg['timestamp']) or datetime.min)
+    return messages
+
+def _event_filter_bounds(start_date_str, end_date_str):
+    start_dt = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
+    end_dt = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
+    if end_dt:
+        end_dt = end_dt.replace(hour=23, minute=59, second=59)
+    return start_dt, end_dt
+
 def index(request):
     # Redirect legacy root to the new Home page to surface the modern UI
     return redirect('home')
@@ -442,51 +500,25 @@ def group_events_analytics(request):
     if not group_name:
         return JsonResponse({"error": "Invalid group name"}, status=400)
 
-    chat_data = load_all_chats()
-    if group_name not in chat_data:
+    if not ensure_event_index(group_name, lambda: load_group_messages(group_name)):
         return JsonResponse({"error": "Group not found"}, status=404)
 
-    messages = chat_data[group_name]['messages']
-    # First pass filter coarse by date for performance
-    filtered_messages = filter_messages_by_date(messages, start_date_str, end_date_str)
-    if not filtered_messages:
-        return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
-
-    # Build events and normalize
-    events = analyze_group_events(filtered_messages)
-    normalized = _normalize_events(events)
-
-    # Prepare datetime bounds for fine filtering
-    start_dt = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
-    end_dt = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
-    if end_dt:
-        end_dt = end_dt.replace(hour=23, minute=59, second=59)
-
-    rows = _filter_normalized(normalized, start_dt, end_dt, event_types, user)
-
-    # Aggregations
-    timeseries = compute_timeseries(rows)
-    distribution = compute_distribution(rows)
-    most_active = compute_most_active_day(timeseries)
-    top_contributors = compute_top_contributors(rows, limit=5)
-
-    # Card counts from filtered rows
-    card_counts = {'added': 0, 'left': 0, 'removed': 0, 'changed_subject': 0, 'changed_icon': 0, 'created': 0}
-    for r in rows:
-        card_counts[r['event_type']] += 1
+    start_dt, end_dt = _event_filter_bounds(start_date_str, end_date_str)
 
-    actors = extract_unique_actors(rows)
+    # Indexed slice of the persisted events, then small aggregations
+    rows = query_events(group_name, start_dt, end_dt, event_types, user)
+    summary = summarize_events(rows, top_limit=5)
 
     return JsonResponse({
-        "event_counts": card_counts,
+        "event_counts": summary['event_counts'],
         "insights": {
-            "most_active_day": most_active,  # e.g., {date, total, ...}
-            "total_events": distribution.get('total', 0),
-            "top_contributors": top_contributors,
+            "most_active_day": summary['most_active_day'],  # e.g., {date, total, ...}
+            "total_events": summary['distribution'].get('total', 0),
+            "top_contributors": summary['top_contributors'],
         },
-        "timeseries": timeseries,
-        "distribution": distribution,
-        "actors": actors,
+        "timeseries": summary['timeseries'],
+        "distribution": summary['distribution'],
+        "actors": summary['actors'],
     })
 
 @csrf_exempt
@@ -506,37 +538,107 @@ def group_events_logs(request):
     if not group_name:
         return JsonResponse({"error": "Invalid group name"}, status=400)
 
-    chat_data = load_all_chats()
-    if group_name not in chat_data:
+    if not ensure_event_index(group_name, lambda: load_group_messages(group_name)):
         return JsonResponse({"error": "Group not found"}, status=404)
 
-    messages = chat_data[group_name]['messages']
-    filtered_messages = filter_messages_by_date(messages, start_date_str, end_date_str)
-    if not filtered_messages:
-        return JsonResponse({"events": []})
-
-    events = analyze_group_events(filtered_messages)
-    normalized = _normalize_events(events)
-
-    start_dt = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
-    end_dt = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
-    if end_dt:
-        end_dt = end_dt.replace(hour=23, minute=59, second=59)
+    cursor = data.get('cursor')
+    search = (data.get('search') or '').strip() or None
+    descending = data.get('sort', 'asc') == 'desc'
+    try:
+        page_size = int(data.get('page_size') or EVENT_LOGS_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "page_size must be an integer"}, status=400)
+    page_size = max(1, min(page_size, EVENT_LOGS_MAX_PAGE_SIZE))
 
-    rows = _filter_normalized(normalized, start_dt, end_dt, event_types, user)
+    start_dt, end_dt = _event_filter_bounds(start_date_str, end_date_str)
+    rows = query_events(group_name, start_dt, end_dt, event_types, user, search)
+    try:
+        page, next_cursor = page_events(rows, cursor, page_size, descending)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     # Shape rows for table
     table_rows = []
-    for r in rows:
+    for r in page:
         table_rows.append({
             'event_type': r['event_type'],
             'actor': r['actor'],
             'target': r['target'],
-            'timestamp': r['dt'].strftime('%d-%b-%Y %I:%M %p'),
+            'timestamp': from_epoch(r['epoch']).strftime('%d-%b-%Y %I:%M %p'),
             'details': r['details'] or '',
         })
 
-    return JsonResponse({"events": table_rows})
+    response = {
+        "events": table_rows,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+        "page_size": page_size,
+    }
+    if not cursor:
+        # Total only on the first page; later pages reuse it
+        response["total"] = rows.count()
+    return JsonResponse(response)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def group_events_membership(request):
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+
+    group_name = data.get('group_name')
+    at_date_str = data.get('date')  # point-in-time query, YYYY-MM-DD
+    start_date_str = data.get('start_date')
+    end_date_str = data.get('end_date')
+    member = data.get('member')
+
+    if not group_name:
+        return JsonResponse({"error": "Invalid group name"}, status=400)
+
+    if not ensure_event_index(group_name, lambda: load_group_messages(group_name)):
+        return JsonResponse({"error": "Group not found"}, status=404)
+
+    try:
+        start_dt, end_dt = _event_filter_bounds(start_date_str, end_date_str)
+        at_dt = _event_filter_bounds(None, at_date_str)[1]
+    except ValueError:
+        return JsonResponse({"error": "Dates must be in YYYY-MM-DD format"}, status=400)
+
+    stats = membership_stats(group_name)
+    at_epoch = to_epoch(at_dt) if at_dt else stats.get('end_epoch', 0)
+
+    def fmt(epoch):
+        return from_epoch(epoch).strftime('%Y-%m-%d %H:%M') if epoch is not None else None
+
+    members = [
+        {'member': i.member, 'joined': fmt(i.joined_epoch) if i.join_observed else None, 'left': fmt(i.left_epoch)}
+        for i in members_at(group_name, at_epoch)
+    ]
+    series = member_count_series(
+        group_name,
+        to_epoch(start_dt) if start_dt else None,
+        to_epoch(end_dt) if end_dt else None,
+    )
+
+    response = {
+        "at": {
+            "timestamp": fmt(at_epoch),
+            "member_count": member_count_at(group_name, at_epoch),
+            "members": members,
+        },
+        "series": [{'date': fmt(epoch)[:10], 'member_count': count} for epoch, count in series],
+        "tenure": stats,
+    }
+    if member:
+        response["member"] = {
+            'member': member,
+            'intervals': [
+                {'joined': fmt(i.joined_epoch) if i.join_observed else None, 'left': fmt(i.left_epoch)}
+                for i in member_history(group_name, member)
+            ],
+        }
+    return JsonResponse(response)
 
 @require_http_methods(["GET"])
 def get_groups(request):
@@ -560,6 +662,11 @@ def upload_file(request):
             group_name=group_name
         )
         chat_file.save()
+        # Build the persisted event index now so analytics never re-detects
+        try:
+            rebuild_event_index(group_name, load_group_messages(group_name))
+        except Exception as e:
+            print(f"Error indexing events for {group_name}: {e}")
         return JsonResponse({
             "success": True,
             "group_name": group_name,
@@ -579,6 +686,10 @@ def delete_file(request):
         if chat_file.file:
             chat_file.file.delete()
         chat_file.delete()
+        # Persisted events are rebuilt from the remaining files on next use
+        drop_event_index(chat_file.group_name)
+        drop_rollups(chat_file.group_name)
+        drop_summary_nodes(chat_file.group_name)
         return JsonResponse({"success": True})
     except ChatFile.DoesNotExist:
         return JsonResponse({"error": "File not found"}, status=404)
@@ -608,9 +719,13 @@ def summarize(request):
     start_date_str = data.get('start_date')
     end_date_str = data.get('end_date')
     user = data.get('user')
+    # 'local' builds total, brief, weekly and daily summaries offline
+    mode = data.get('mode')
     
     if not group_name:
         return JsonResponse({"error": "Invalid group name"}, status=400)
+    if mode and mode not in SUMMARY_MODES:
+        return JsonResponse({"error": f"Unknown summary mode: {mode}"}, status=400)
     
     chat_data = load_all_chats()
     if group_name not in chat_data:
@@ -623,7 +738,7 @@ def summarize(request):
         return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
     
     if summary_type == 'total':
-        summary = generate_total_summary(filtered_messages)
+        summary = generate_total_summary(filtered_messages, start_date_str, end_date_str, mode=mode, group_name=group_name)
         return JsonResponse({"summary_type": "total", "summary": summary})
     
     elif summary_type == 'user_messages':
@@ -641,16 +756,26 @@ def summarize(request):
         return JsonResponse({"summary_type": "user_messages_for_user", "user": user, "user_messages": user_messages})
     
     elif summary_type == 'weekly_summary':
-        weekly_summaries = generate_weekly_summary(filtered_messages, start_date_str, end_date_str)
-        return JsonResponse({"summary_type": "weekly_summary", "weekly_summaries": weekly_summaries})
+        weekly_summaries = generate_weekly_summary(
+            filtered_messages, start_date_str, end_date_str, group_name=group_name, mode=mode,
+        )
+        return JsonResponse({
+            "summary_type": "weekly_summary",
+            "weekly_summaries": weekly_summaries,
+            "partial": any(week.get('timed_out') for week in weekly_summaries),
+        })
     
     elif summary_type == 'brief':
-        summary = generate_brief_summary(filtered_messages)
+        summary = generate_brief_summary(filtered_messages, start_date_str, end_date_str, mode=mode, group_name=group_name)
         return JsonResponse({"summary_type": "brief", "summary": summary})
     
     elif summary_type == 'daily_user_messages':
-        daily_summaries = generate_daily_user_messages(filtered_messages)
-        return JsonResponse({"summary_type": "daily_user_messages", "daily_summaries": daily_summaries})
+        daily_summaries = generate_daily_user_messages(filtered_messages, group_name=group_name, mode=mode)
+        return JsonResponse({
+            "summary_type": "daily_user_messages",
+            "daily_summaries": daily_summaries,
+            "partial": any(day.get('timed_out') for day in daily_summaries),
+        })
     
     elif summary_type == 'user_wise_detailed':
         if not user:
@@ -661,6 +786,26 @@ def summarize(request):
     else:
         return JsonResponse({"error": "Invalid summary type"}, status=400)
 
+def _qa_prompt(chat_text, user_question):
+    # Enhanced prompt for better AI responses
+    return f"""You are a WhatsApp chat analyzer. Analyze the following chat data and answer the user's question with specific, detailed information.
+
+IMPORTANT INSTRUCTIONS:
+- Provide SPECIFIC answers with dates, times, names, and actual content
+- For meeting questions: List actual meetings with dates, organizers, and details
+- For "who" questions: Provide names and statistics
+- For "what" questions: Describe actual topics discussed with examples
+- For "when" questions: Give specific dates and times
+- Use emojis and formatting for better readability
+- Extract exact information from the chat content
+
+Chat Data:
+{chat_text}
+
+User Question: {user_question}
+
+Provide a comprehensive answer with specific details from the chat:"""
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def ask_question(request):
@@ -668,6 +813,7 @@ def ask_question(request):
         data = json.loads(request.body)
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    deadline = time.monotonic() + LLM_REQUEST_DEADLINE_SECONDS
         
     group_name = data.get('group_name')
     user_question = data.get('question')
@@ -689,32 +835,10 @@ def ask_question(request):
     if not filtered_messages:
         return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
     
-    chat_text = "\n".join([f"{msg['sender']}: {msg['message']}" for msg in filtered_messages])
-    
-    if len(chat_text) > MAX_CHARS_FOR_ANALYSIS:
-        chat_text = chat_text[-MAX_CHARS_FOR_ANALYSIS:]
+    chat_text, prompt_stats = build_chat_context(filtered_messages, QA_PROMPT_TOKEN_BUDGET, query=user_question)
     
     try:
-        # Enhanced prompt for better AI responses
-        prompt = f"""You are a WhatsApp chat analyzer. Analyze the following chat data and answer the user's question with specific, detailed information.
-
-IMPORTANT INSTRUCTIONS:
-- Provide SPECIFIC answers with dates, times, names, and actual content
-- For meeting questions: List actual meetings with dates, organizers, and details
-- For "who" questions: Provide names and statistics
-- For "what" questions: Describe actual topics discussed with examples
-- For "when" questions: Give specific dates and times
-- Use emojis and formatting for better readability
-- Extract exact information from the chat content
-
-Chat Data:
-{chat_text}
-
-User Question: {user_question}
-
-Provide a comprehensive answer with specific details from the chat:"""
-        
-        response = generate_with_gemini(prompt)
+        response = generate_with_gemini(_qa_prompt(chat_text, user_question), deadline)
         
         # Handle potential API issues
         if response == "QUOTA_EXCEEDED":
@@ -725,7 +849,7 @@ Provide a comprehensive answer with specific details from the chat:"""
         else:
             answer = response
             
-        return JsonResponse({"answer": answer})
+        return JsonResponse({"answer": answer, "prompt_stats": prompt_stats})
     except Exception as e:
         # Generate fallback answer for any errors
         try:
@@ -806,381 +930,6 @@ def event_details(request):
         "events": event_details
     })
 
-def analyze_group_events(messages):
-    """Analyze group events from messages"""
-    events = []
-    
-    print(f"Analyzing {len(messages)} messages for group events...")
-    
-    for i, message in enumerate(messages):
-        text = message.get('message', '').lower()
-        timestamp = message.get('timestamp', '')
-        sender = message.get('sender', 'Unknown')
-        original_message = message.get('message', '')
-        
-        # Debug: Print first 10 messages to see what we're working with
-        if i < 10:
-            print(f"Message {i}: '{original_message}' (sender: {sender})")
-        
-        # Check for different event types with better pattern matching
-        if is_added_event(text, original_message):
-            print(f"Found ADDED event: '{original_message}'")
-            added_details = extract_added_details(original_message)
-            events.append({
-                'type': 'added',
-                'timestamp': timestamp,
-                'sender': sender,
-                'raw_message': original_message,
-                'details': added_details,
-                'added_person': extract_person_name(original_message, 'added'),
-                'adder': sender
-            })
-        elif is_left_event(text, original_message):
-            print(f"Found LEFT event: '{original_message}'")
-            left_details = extract_left_details(original_message)
-            events.append({
-                'type': 'left',
-                'timestamp': timestamp,
-                'sender': sender,
-                'raw_message': original_message,
-                'details': left_details,
-                'person': extract_person_name(original_message, 'left')
-            })
-        elif is_removed_event(text, original_message):
-            print(f"Found REMOVED event: '{original_message}'")
-            removed_details = extract_removed_details(original_message)
-            events.append({
-                'type': 'removed',
-                'timestamp': timestamp,
-                'sender': sender,
-                'raw_message': original_message,
-                'details': removed_details,
-                'removed_person': extract_person_name(original_message, 'removed'),
-                'remover': sender
-            })
-        elif is_subject_changed_event(text, original_message):
-            print(f"Found SUBJECT CHANGED event: '{original_message}'")
-            subject_details = extract_subject_change_details(original_message)
-            events.append({
-                'type': 'changed_subject',
-                'timestamp': timestamp,
-                'sender': sender,
-                'raw_message': original_message,
-                'details': subject_details,
-                'changer': sender,
-                'new_subject': extract_subject_name(original_message)
-            })
-        elif is_icon_changed_event(text, original_message):
-            print(f"Found ICON CHANGED event: '{original_message}'")
-            events.append({
-                'type': 'changed_icon',
-                'timestamp': timestamp,
-                'sender': sender,
-                'raw_message': original_message,
-                'details': 'Group icon was changed',
-                'changer': sender
-            })
-        elif is_group_created_event(text, original_message):
-            print(f"Found GROUP CREATED event: '{original_message}'")
-            events.append({
-                'type': 'created',
-                'timestamp': timestamp,
-                'sender': sender,
-                'raw_message': original_message,
-                'details': 'Group was created',
-                'creator': sender
-            })
-    
-    print(f"Found {len(events)} total events")
-    return events
-
-def is_added_event(text, original_message):
-    """Check if message is an 'added' event"""
-    patterns = [
-        'added',
-        'joined',
-        'was added',
-        'has been added',
-        'added to the group',
-        'joined the group',
-        'was added to the group'
-    ]
-    return any(pattern in text for pattern in patterns)
-
-def is_left_event(text, original_message):
-    """Check if message is a 'left' event"""
-    patterns = [
-        'left',
-        'exited',
-        'left the group',
-        'exited the group',
-        'has left',
-        'has exited'
-    ]
-    return any(pattern in text for pattern in patterns)
-
-def is_removed_event(text, original_message):
-    """Check if message is a 'removed' event"""
-    patterns = [
-        'removed',
-        'kicked',
-        'was removed',
-        'has been removed',
-        'removed from the group',
-        'kicked from the group',
-        'was kicked'
-    ]
-    return any(pattern in text for pattern in patterns)
-
-def is_subject_changed_event(text, original_message):
-    """Check if message is a 'subject changed' event"""
-    patterns = [
-        'changed the subject',
-        'changed subject',
-        'subject changed',
-        'changed group subject',
-        'group subject changed'
-    ]
-    return any(pattern in text for pattern in patterns)
-
-def is_icon_changed_event(text, original_message):
-    """Check if message is an 'icon changed' event"""
-    patterns = [
-        'changed the group icon',
-        'changed group icon',
-        'group icon changed',
-        'changed the icon',
-        'icon changed'
-    ]
-    return any(pattern in text for pattern in patterns)
-
-def is_group_created_event(text, original_message):
-    """Check if message is a 'group created' event"""
-    patterns = [
-        'created group',
-        'group created',
-        'created the group',
-        'group was created'
-    ]
-    return any(pattern in text for pattern in patterns)
-
-def get_event_details(events, event_type):
-    """Get details for specific event type"""
-    filtered_events = [event for event in events if event['type'] == event_type]
-    
-    # Sort by timestamp (newest first)
-    filtered_events.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    return filtered_events
-
-def extract_added_details(message):
-    """Extract details from 'added' event message"""
-    import re
-    
-    # Try to extract who added whom
-    patterns = [
-        r'(\w+(?:\s+\w+)*)\s+added\s+(\w+(?:\s+\w+)*)',
-        r'(\w+(?:\s+\w+)*)\s+has\s+added\s+(\w+(?:\s+\w+)*)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, message, re.IGNORECASE)
-        if match:
-            adder = match.group(1).strip()
-            added_person = match.group(2).strip()
-            return f"{adder} added {added_person}"
-    
-    # Fallback
-    if 'added' in message.lower():
-        parts = message.split('added')
-        if len(parts) > 1:
-            return f"Added: {parts[1].strip()}"
-    return "Member was added to the group"
-
-def extract_left_details(message):
-    """Extract details from 'left' event message"""
-    import re
-    
-    # Try to extract who left
-    patterns = [
-        r'(\w+(?:\s+\w+)*)\s+left',
-        r'(\w+(?:\s+\w+)*)\s+exited',
-        r'(\w+(?:\s+\w+)*)\s+has\s+left',
-        r'(\w+(?:\s+\w+)*)\s+has\s+exited'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, message, re.IGNORECASE)
-        if match:
-            person = match.group(1).strip()
-            return f"{person} left the group"
-    
-    # Fallback
-    if 'left' in message.lower():
-        return f"Left: {message.replace('left', '').strip()}"
-    elif 'exited' in message.lower():
-        return f"Exited: {message.replace('exited', '').strip()}"
-    return "Member left the group"
-
-def extract_removed_details(message):
-    """Extract details from 'removed' event message"""
-    import re
-    
-    # Try to extract who removed whom
-    patterns = [
-        r'(\w+(?:\s+\w+)*)\s+removed\s+(\w+(?:\s+\w+)*)',
-        r'(\w+(?:\s+\w+)*)\s+kicked\s+(\w+(?:\s+\w+)*)',
-        r'(\w+(?:\s+\w+)*)\s+has\s+removed\s+(\w+(?:\s+\w+)*)',
-        r'(\w+(?:\s+\w+)*)\s+has\s+kicked\s+(\w+(?:\s+\w+)*)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, message, re.IGNORECASE)
-        if match:
-            remover = match.group(1).strip()
-            removed_person = match.group(2).strip()
-            return f"{remover} removed {removed_person}"
-    
-    # Fallback
-    if 'removed' in message.lower():
-        parts = message.split('removed')
-        if len(parts) > 1:
-            return f"Removed: {parts[1].strip()}"
-    elif 'kicked' in message.lower():
-        parts = message.split('kicked')
-        if len(parts) > 1:
-            return f"Kicked: {parts[1].strip()}"
-    return "Member was removed from the group"
-
-def extract_subject_change_details(message):
-    """Extract details from subject change event message"""
-    # Common patterns: "User changed the subject to 'New Subject'"
-    if 'changed the subject' in message:
-        if 'to' in message:
-            parts = message.split('to')
-            if len(parts) > 1:
-                return f"Subject changed to: {parts[1].strip()}"
-        return "Group subject was changed"
-    return "Group subject was changed"
-
-def extract_person_name(message, event_type):
-    """Extract person name from event message"""
-    import re
-    
-    if event_type == 'added':
-        # Patterns: "John Doe added Jane Smith", "John Doe added Jane Smith and 2 others"
-        patterns = [
-            r'(\w+(?:\s+\w+)*)\s+added\s+(\w+(?:\s+\w+)*)',
-            r'(\w+(?:\s+\w+)*)\s+has\s+added\s+(\w+(?:\s+\w+)*)',
-            r'(\w+(?:\s+\w+)*)\s+added\s+(\w+(?:\s+\w+)*)\s+to\s+the\s+group'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                return match.group(2).strip()
-        
-        # Fallback: split by 'added'
-        if 'added' in message.lower():
-            parts = message.split('added')
-            if len(parts) > 1:
-                name = parts[1].strip()
-                # Remove common suffixes
-                name = re.sub(r'\s+and\s+\d+\s+others?', '', name)
-                name = re.sub(r'\s+to\s+the\s+group', '', name)
-                return name.strip()
-                
-    elif event_type == 'left':
-        # Patterns: "John Doe left", "John Doe exited"
-        patterns = [
-            r'(\w+(?:\s+\w+)*)\s+left',
-            r'(\w+(?:\s+\w+)*)\s+exited',
-            r'(\w+(?:\s+\w+)*)\s+has\s+left',
-            r'(\w+(?:\s+\w+)*)\s+has\s+exited'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                return match.group(1).strip()
-        
-        # Fallback
-        if 'left' in message.lower():
-            return message.replace('left', '').strip()
-        elif 'exited' in message.lower():
-            return message.replace('exited', '').strip()
-            
-    elif event_type == 'removed':
-        # Patterns: "John Doe removed Jane Smith", "John Doe kicked Jane Smith"
-        patterns = [
-            r'(\w+(?:\s+\w+)*)\s+removed\s+(\w+(?:\s+\w+)*)',
-            r'(\w+(?:\s+\w+)*)\s+kicked\s+(\w+(?:\s+\w+)*)',
-            r'(\w+(?:\s+\w+)*)\s+has\s+removed\s+(\w+(?:\s+\w+)*)',
-            r'(\w+(?:\s+\w+)*)\s+has\s+kicked\s+(\w+(?:\s+\w+)*)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                return match.group(2).strip()
-        
-        # Fallback
-        if 'removed' in message.lower():
-            parts = message.split('removed')
-            if len(parts) > 1:
-                return parts[1].strip()
-        elif 'kicked' in message.lower():
-            parts = message.split('kicked')
-            if len(parts) > 1:
-                return parts[1].strip()
-    
-    return 'Unknown'
-
-def extract_subject_name(message):
-    """Extract new subject name from subject change message"""
-    if 'changed the subject to' in message:
-        parts = message.split('to')
-        if len(parts) > 1:
-            subject = parts[1].strip()
-            # Remove quotes if present
-            subject = subject.strip('"').strip("'")
-            return subject
-    return 'New Subject'
-
-def get_event_counts(events):
-    """Get count of each event type"""
-    counts = {
-        'added': 0,
-        'left': 0,
-        'removed': 0,
-        'changed_subject': 0,
-        'changed_icon': 0,
-        'created': 0
-    }
-    
-    for event in events:
-        event_type = event.get('type', '')
-        if event_type in counts:
-            counts[event_type] += 1
-    
-    return counts
-
-def get_top_removers(events):
-    """Get top users who removed others"""
-    remover_counts = {}
-    
-    for event in events:
-        if event.get('type') == 'removed':
-            remover = event.get('remover', 'Unknown')
-            if remover in remover_counts:
-                remover_counts[remover] += 1
-            else:
-                remover_counts[remover] = 1
-    
-    # Sort by count and return top 5
-    sorted_removers = sorted(remover_counts.items(), key=lambda x: x[1], reverse=True)
-    return [{'user': user, 'count': count} for user, count in sorted_removers[:5]]
-
 @csrf_exempt
 @require_http_methods(["POST"])
 @csrf_exempt
@@ -1190,15 +939,37 @@ def sentiment(request):
         data = json.loads(request.body)
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    deadline = time.monotonic() + LLM_REQUEST_DEADLINE_SECONDS
         
     group_name = data.get('group_name')
     start_date_str = data.get('start_date')
     end_date_str = data.get('end_date')
+    response_format = data.get('format') or 'full'
     
     print(f"Sentiment analysis request: group={group_name}, start={start_date_str}, end={end_date_str}")
     
     if not group_name:
         return JsonResponse({"error": "Invalid group name"}, status=400)
+    if response_format not in SENTIMENT_RESPONSE_FORMATS:
+        return JsonResponse({"error": f"Unknown format: {response_format}"}, status=400)
+    try:
+        numbers = _optional_floats(data, *SENTIMENT_NUMBER_FIELDS)
+        engine = sentiment_engine(data.get('engine'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    
+    if data.get('mode') == 'rollup':
+        # Answer from stored daily counts; no chat parsing or model calls
+        try:
+            uncovered = uncovered_ranges(group_name, start_date_str, end_date_str)
+        except ValueError:
+            return JsonResponse({"error": "Invalid date format"}, status=400)
+        if uncovered:
+            return JsonResponse({
+                "error": "Sentiment has not been analysed for the whole range yet",
+                "uncovered_ranges": uncovered,
+            }, status=409)
+        return JsonResponse(rollup_sentiment(group_name, start_date_str, end_date_str, data.get('user')))
     
     try:
         chat_data = load_all_chats()
@@ -1219,7 +990,18 @@ def sentiment(request):
         
         # Perform sentiment analysis
         print(f"About to call analyze_sentiment with {len(filtered_messages)} messages")
-        result = analyze_sentiment(filtered_messages)
+        try:
+            result = analyze_sentiment(
+                filtered_messages,
+                engine=engine,
+                max_escalation_ratio=numbers['escalation_ratio'],
+                mode=data.get('mode'),
+                margin_of_error=numbers['margin_of_error'],
+                confidence_level=numbers['confidence_level'],
+                deadline=deadline,
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
         print(f"Sentiment analysis completed. Result type: {type(result)}")
         print(f"Result keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
         
@@ -1235,8 +1017,13 @@ def sentiment(request):
         
         # Add total count for frontend display
         total_count = sum(result['sentiment_breakdown'].values())
-        result['total_analyzed'] = total_count
+        # Extrapolated counts are rounded, so estimates report the real population
+        result['total_analyzed'] = result['estimate']['population'] if 'estimate' in result else total_count
+        _record_sentiment_rollups(group_name, start_date_str, end_date_str, result)
         
+        if response_format == 'compact':
+            compact = format_sentiment_result(result, 'compact', _flag(data.get('include_text')))
+            return JsonResponse(compact, json_dumps_params={'separators': (',', ':')})
         return JsonResponse(result)
         
     except Exception as e:
@@ -1245,6 +1032,248 @@ def sentiment(request):
         traceback.print_exc()
         return JsonResponse({"error": f"Internal server error: {str(e)}"}, status=500)
 
+def _record_sentiment_rollups(group_name, start_date_str, end_date_str, result):
+    """Fold finished labels into the daily rollups; never fails the request"""
+    try:
+        record_rollups(group_name, start_date_str, end_date_str, result)
+    except Exception as e:
+        print(f"Error recording sentiment rollups for {group_name}: {e}")
+
+def _flag(value):
+    """Boolean request field that may arrive as JSON or as a query-string value"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+# Numeric /sentiment/ fields, accepted as JSON numbers or numeric strings
+SENTIMENT_NUMBER_FIELDS = ('escalation_ratio', 'margin_of_error', 'confidence_level')
+
+def _optional_floats(data, *names):
+    """Parse optional numeric request fields to floats (None when absent); raises ValueError naming a bad one"""
+    values = {}
+    for name in names:
+        value = data.get(name)
+        try:
+            values[name] = float(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name}")
+    return values
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+def _sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _stream_request_data(request):
+    """Request fields from a JSON body (POST) or query parameters (GET, for EventSource); None if invalid"""
+    if request.method == 'GET':
+        return request.GET
+    try:
+        return json.loads(request.body)
+    except json.JSONDecodeError:
+        return None
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def sentiment_stream(request):
+    """
+    Server-Sent Events version of /sentiment/. Accepts the same fields as JSON
+    (POST) or query parameters (GET, for EventSource) and emits start, update
+    and complete events as batches finish.
+    """
+    data = _stream_request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    deadline = time.monotonic() + LLM_REQUEST_DEADLINE_SECONDS
+    
+    group_name = data.get('group_name')
+    if not group_name:
+        return JsonResponse({"error": "Invalid group name"}, status=400)
+    response_format = data.get('format') or 'full'
+    if response_format not in SENTIMENT_RESPONSE_FORMATS:
+        return JsonResponse({"error": f"Unknown format: {response_format}"}, status=400)
+    
+    try:
+        escalation_ratio = _optional_floats(data, 'escalation_ratio')['escalation_ratio']
+        engine = sentiment_engine(data.get('engine'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    
+    messages = load_group_messages(group_name)
+    if not messages:
+        return JsonResponse({"error": "Group not found"}, status=404)
+    filtered_messages = filter_messages_by_date(messages, data.get('start_date'), data.get('end_date'))
+    if not filtered_messages:
+        return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
+    
+    def events():
+        try:
+            for event, payload in stream_sentiment(
+                filtered_messages, engine=engine, max_escalation_ratio=escalation_ratio,
+                deadline=deadline,
+            ):
+                if event == 'complete':
+                    payload['total_analyzed'] = sum(payload['sentiment_breakdown'].values())
+                    _record_sentiment_rollups(group_name, data.get('start_date'), data.get('end_date'), payload)
+                    payload = format_sentiment_result(payload, response_format, _flag(data.get('include_text')))
+                yield _sse(event, payload)
+        except Exception as e:
+            print(f"Error in streaming sentiment analysis: {e}")
+            yield _sse('error', {"error": f"Internal server error: {str(e)}"})
+    
+    return _sse_response(events())
+
+def _run_streaming(produce):
+    """
+    Run produce(emit) on a worker thread and yield the (event, payload) pairs
+    it emits as they happen, then ('complete', its return value), or
+    ('error', ...) if it raised.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            events.put(('complete', produce(lambda event, payload: events.put((event, payload)))))
+        except Exception as e:
+            print(f"Error in streaming response: {e}")
+            events.put(('error', {"error": f"Internal server error: {str(e)}"}))
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        event, payload = events.get()
+        yield event, payload
+        if event in ('complete', 'error'):
+            return
+
+STREAMED_SUMMARY_TYPES = ('total', 'brief', 'weekly_summary', 'daily_user_messages')
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def summarize_stream(request):
+    """
+    Server-Sent Events version of /summarize/ for total, brief, weekly and
+    daily summaries. total and brief emit the model's output as token events;
+    weekly and daily emit an entry event per week or day as it finishes. The
+    complete event carries the same body as /summarize/, with cleaning and
+    fallbacks applied, and replaces what was streamed.
+    """
+    data = _stream_request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    group_name = data.get('group_name')
+    summary_type = data.get('summary_type', 'total')
+    start_date_str = data.get('start_date')
+    end_date_str = data.get('end_date')
+    mode = data.get('mode')
+    
+    if not group_name:
+        return JsonResponse({"error": "Invalid group name"}, status=400)
+    if summary_type not in STREAMED_SUMMARY_TYPES:
+        return JsonResponse({"error": f"Streaming is not available for summary type: {summary_type}"}, status=400)
+    if mode and mode not in SUMMARY_MODES:
+        return JsonResponse({"error": f"Unknown summary mode: {mode}"}, status=400)
+    
+    messages = load_group_messages(group_name)
+    if not messages:
+        return JsonResponse({"error": "Group not found"}, status=404)
+    filtered_messages = filter_messages_by_date(messages, start_date_str, end_date_str)
+    if not filtered_messages:
+        return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
+    
+    def produce(emit):
+        def on_token(chunk):
+            emit('token', {"text": chunk})
+
+        def on_entry(index, entry):
+            emit('entry', {"index": index, "entry": entry})
+
+        if summary_type == 'total':
+            summary = generate_total_summary(
+                filtered_messages, start_date_str, end_date_str, mode=mode, on_token=on_token, group_name=group_name,
+            )
+            return {"summary_type": "total", "summary": summary}
+        if summary_type == 'brief':
+            summary = generate_brief_summary(
+                filtered_messages, start_date_str, end_date_str, mode=mode, on_token=on_token, group_name=group_name,
+            )
+            return {"summary_type": "brief", "summary": summary}
+        if summary_type == 'weekly_summary':
+            weekly_summaries = generate_weekly_summary(
+                filtered_messages, start_date_str, end_date_str, group_name=group_name, mode=mode, on_entry=on_entry,
+            )
+            return {
+                "summary_type": "weekly_summary",
+                "weekly_summaries": weekly_summaries,
+                "partial": any(week.get('timed_out') for week in weekly_summaries),
+            }
+        daily_summaries = generate_daily_user_messages(filtered_messages, group_name=group_name, mode=mode, on_entry=on_entry)
+        return {
+            "summary_type": "daily_user_messages",
+            "daily_summaries": daily_summaries,
+            "partial": any(day.get('timed_out') for day in daily_summaries),
+        }
+    
+    def events():
+        yield _sse('start', {"summary_type": summary_type, "message_count": len(filtered_messages)})
+        for event, payload in _run_streaming(produce):
+            yield _sse(event, payload)
+    
+    return _sse_response(events())
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def ask_stream(request):
+    """
+    Server-Sent Events version of /ask/: token events carry the answer as the
+    model writes it, and complete carries the full answer. When the model
+    fails, complete carries the fallback answer with fallback set instead.
+    """
+    data = _stream_request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    deadline = time.monotonic() + LLM_REQUEST_DEADLINE_SECONDS
+    group_name = data.get('group_name')
+    user_question = data.get('question')
+    
+    if not group_name:
+        return JsonResponse({"error": "Invalid group name"}, status=400)
+    if not user_question:
+        return JsonResponse({"error": "No question provided"}, status=400)
+    
+    messages = load_group_messages(group_name)
+    if not messages:
+        return JsonResponse({"error": "Group not found"}, status=404)
+    filtered_messages = filter_messages_by_date(messages, data.get('start_date'), data.get('end_date'))
+    if not filtered_messages:
+        return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
+    
+    chat_text, prompt_stats = build_chat_context(filtered_messages, QA_PROMPT_TOKEN_BUDGET, query=user_question)
+    prompt = _qa_prompt(chat_text, user_question)
+    
+    def events():
+        yield _sse('start', {"prompt_stats": prompt_stats})
+        chunks = []
+        fallback = False
+        try:
+            for chunk in stream_with_gemini(prompt, deadline):
+                chunks.append(chunk)
+                yield _sse('token', {"text": chunk})
+            answer = ''.join(chunks)
+        except Exception as e:
+            print(f"Error streaming answer: {e}")
+            answer = generate_fallback_answer(user_question, filtered_messages)
+            fallback = True
+        yield _sse('complete', {"answer": answer, "fallback": fallback, "prompt_stats": prompt_stats})
+    
+    return _sse_response(events())
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def activity_analysis(request):
@@ -1261,9 +1290,13 @@ def activity_analysis(request):
     end_date_str = data.get('end_date')
     user_filter = data.get('user')                # Optional user filter
     include_messages = bool(data.get('include_messages', False))
-    
     if not group_name:
         return JsonResponse({"error": "Invalid group name"}, status=400)
+    try:
+        # 'exact' or 'approximate', and the approximate mode's error rate
+        keyword_mode, keyword_error_rate = keyword_options(data.get('keyword_mode'), data.get('keyword_error_rate'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     
     try:
         chat_data = load_all_chats()
@@ -1321,7 +1354,11 @@ def activity_analysis(request):
             print(f"Large dataset detected ({len(filtered_messages)} messages), limiting to {max_messages}")
             filtered_messages = filtered_messages[:max_messages]
         
-        raw_metrics = calculate_business_metrics(filtered_messages)
+        raw_metrics = calculate_business_metrics(
+            filtered_messages,
+            keyword_mode=keyword_mode,
+            keyword_error_rate=keyword_error_rate,
+        )
     except Exception as e:
         print(f"Error calculating business metrics: {e}")
         return JsonResponse({"error": "Failed to calculate metrics"}, status=500)
@@ -1425,6 +1462,8 @@ def activity_analysis(request):
         'analysis_type': analysis_type,
         'all_users': available_users,
         'weeks': weeks if weeks else None,
+        'top_keywords': raw_metrics.get('top_keywords', {}),
+        'top_keywords_metadata': raw_metrics.get('top_keywords_metadata'),
     }
 
     if include_messages:
@@ -1432,6 +1471,37 @@ def activity_analysis(request):
 
     return JsonResponse(activity_data)
 
+EXPORT_FEATURES = ('summary', 'sentiment', 'activity', 'events', 'messages')
+
+def build_export_data(filtered_messages, export_features, keyword_mode=None, progress=None, group_name=None,
+                      keyword_error_rate=None):
+    """Build the selected export sections; progress(done, total, message) runs before each one"""
+    selected = [f for f in EXPORT_FEATURES if f in export_features or 'all' in export_features]
+    export_data = {}
+    
+    for done, feature in enumerate(selected):
+        if progress:
+            progress(done, len(selected), f"Building {feature}")
+        
+        if feature == 'summary':
+            export_data['summary'] = generate_total_summary(filtered_messages, group_name=group_name)
+        elif feature == 'sentiment':
+            export_data['sentiment'] = analyze_sentiment(filtered_messages)
+        elif feature == 'activity':
+            export_data['activity'] = calculate_business_metrics(
+                filtered_messages, keyword_mode=keyword_mode, keyword_error_rate=keyword_error_rate,
+            )
+        elif feature == 'events':
+            events = analyze_group_events(filtered_messages)
+            export_data['events'] = {
+                'event_counts': get_event_counts(events),
+                'top_removers': get_top_removers(events)
+            }
+        elif feature == 'messages':
+            export_data['messages'] = filtered_messages
+    
+    return export_data
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def export_data(request):
@@ -1452,6 +1522,10 @@ def export_data(request):
     
     if not group_name:
         return JsonResponse({"error": "Invalid group name"}, status=400)
+    try:
+        keyword_mode, keyword_error_rate = keyword_options(data.get('keyword_mode'), data.get('keyword_error_rate'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     
     chat_data = load_all_chats()
     if group_name not in chat_data:
@@ -1463,26 +1537,9 @@ def export_data(request):
     if not filtered_messages:
         return JsonResponse({"error": "No messages found in the selected date range"}, status=400)
     
-    export_data = {}
-    
-    if 'summary' in export_features or 'all' in export_features:
-        export_data['summary'] = generate_total_summary(filtered_messages)
-    
-    if 'sentiment' in export_features or 'all' in export_features:
-        export_data['sentiment'] = analyze_sentiment(filtered_messages)
-    
-    if 'activity' in export_features or 'all' in export_features:
-        export_data['activity'] = calculate_business_metrics(filtered_messages)
-    
-    if 'events' in export_features or 'all' in export_features:
-        events = analyze_group_events(filtered_messages)
-        export_data['events'] = {
-            'event_counts': get_event_counts(events),
-            'top_removers': get_top_removers(events)
-        }
-    
-    if 'messages' in export_features or 'all' in export_features:
-        export_data['messages'] = filtered_messages
+    export_data = build_export_data(
+        filtered_messages, export_features, keyword_mode, group_name=group_name, keyword_error_rate=keyword_error_rate,
+    )
     
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1563,6 +1620,135 @@ def export_data(request):
     else:
         return JsonResponse({"error": "Unsupported export format"}, status=400)
 
+# Background jobs: long analyses run off the request thread and are polled for progress
+
+def _job_messages(params):
+    group_name = params.get('group_name')
+    if not group_name:
+        raise ValueError("Invalid group name")
+    messages = load_group_messages(group_name)
+    filtered_messages = filter_messages_by_date(messages, params.get('start_date'), params.get('end_date'))
+    if not filtered_messages:
+        raise ValueError("No messages found in the selected date range")
+    return filtered_messages
+
+@register_job('sentiment')
+def sentiment_job(params, job):
+    numbers = _optional_floats(params, *SENTIMENT_NUMBER_FIELDS)
+    result = analyze_sentiment(
+        _job_messages(params),
+        engine=params.get('engine'),
+        max_escalation_ratio=numbers['escalation_ratio'],
+        progress=job.progress,
+        mode=params.get('mode'),
+        margin_of_error=numbers['margin_of_error'],
+        confidence_level=numbers['confidence_level'],
+    )
+    if 'sentiment_breakdown' not in result:
+        result['sentiment_breakdown'] = result.get('overall_sentiment', {'positive': 0, 'neutral': 0, 'negative': 0})
+    if 'estimate' not in result:
+        result['total_analyzed'] = sum(result['sentiment_breakdown'].values())
+    _record_sentiment_rollups(params['group_name'], params.get('start_date'), params.get('end_date'), result)
+    result = format_sentiment_result(result, params.get('format'), _flag(params.get('include_text')))
+    # Round-trip so defaultdicts and other containers are stored as plain JSON
+    return json.loads(json.dumps(result, default=str))
+
+@register_job('export')
+def export_job(params, job):
+    export_data = build_export_data(
+        _job_messages(params),
+        params.get('features', []),
+        params.get('keyword_mode'),
+        progress=job.progress,
+        group_name=params.get('group_name'),
+        keyword_error_rate=params.get('keyword_error_rate'),
+    )
+    return json.loads(json.dumps(export_data, default=str))
+
+@register_job('weekly_summary')
+def weekly_summary_job(params, job):
+    weekly_summaries = generate_weekly_summary(
+        _job_messages(params), params.get('start_date'), params.get('end_date'), progress=job.progress,
+        deadline_seconds=None, group_name=params.get('group_name'), mode=params.get('mode'),
+    )
+    return {"summary_type": "weekly_summary", "weekly_summaries": weekly_summaries}
+
+@register_job('daily_user_messages')
+def daily_user_messages_job(params, job):
+    # Jobs are not bound by the worker timeout, so every day gets a model summary
+    daily_summaries = generate_daily_user_messages(
+        _job_messages(params), progress=job.progress, deadline_seconds=None, group_name=params.get('group_name'),
+        mode=params.get('mode'),
+    )
+    return {"summary_type": "daily_user_messages", "daily_summaries": daily_summaries}
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def submit_analysis_job(request):
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON data"}, status=400)
+    
+    kind = data.get('kind')
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return JsonResponse({"error": "params must be an object"}, status=400)
+    if not params.get('group_name'):
+        return JsonResponse({"error": "Invalid group name"}, status=400)
+    # Bad fields are rejected here rather than failing the job once it runs
+    try:
+        if kind == 'sentiment':
+            params = {**params, **_optional_floats(params, *SENTIMENT_NUMBER_FIELDS)}
+            sentiment_engine(params.get('engine'))
+        elif kind == 'export':
+            keyword_mode, keyword_error_rate = keyword_options(
+                params.get('keyword_mode'), params.get('keyword_error_rate'),
+            )
+            params = {**params, 'keyword_mode': keyword_mode, 'keyword_error_rate': keyword_error_rate}
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    
+    try:
+        job = submit_job(kind, params)
+    except ValueError as e:
+        return JsonResponse({"error": str(e), "kinds": job_kinds()}, status=400)
+    
+    return JsonResponse(job_status(job), status=202)
+
+@require_http_methods(["GET"])
+def analysis_job_status(request, job_id):
+    job = AnalysisJob.objects.filter(id=job_id).first()
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job_status(job))
+
+@require_http_methods(["GET"])
+def analysis_job_result(request, job_id):
+    job = AnalysisJob.objects.filter(id=job_id).first()
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    if job.status == AnalysisJob.STATUS_SUCCEEDED:
+        return JsonResponse({"job_id": job.id, "kind": job.kind, "result": job.result})
+    if job.status in (AnalysisJob.STATUS_FAILED, AnalysisJob.STATUS_CANCELLED):
+        return JsonResponse({**job_status(job), "error": job.error or f"Job {job.status}"}, status=410)
+    return JsonResponse({**job_status(job), "error": "Job has not finished yet"}, status=409)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_analysis_job(request, job_id):
+    job = cancel_job(job_id)
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job_status(job))
+
+@require_http_methods(["GET"])
+def llm_cache_stats(request):
+    """Hit/miss counters and size of the shared LLM response cache, plus circuit breaker states"""
+    stats = cache_stats()
+    stats['circuit_breakers'] = breaker_stats()
+    return JsonResponse(stats)
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def debug_groups(request):
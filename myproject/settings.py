@@ -90,6 +90,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Background jobs write progress from worker threads
+        "OPTIONS": {"timeout": 20},
     }
 }
 
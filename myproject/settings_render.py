@@ -88,6 +88,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Background jobs write progress from worker threads
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -104,6 +106,8 @@ if "DATABASE_URL" in os.environ:
             "PASSWORD": password,
             "HOST": host,
             "PORT": port,
+            # Wait for a lock up to 20s, like the SQLite timeout above
+            "OPTIONS": {"options": "-c lock_timeout=20000"},
         }
 
 # ---------------- Password Validators ----------------